@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+""" Compares the extraction throughput of every archive format.
+
+Usage:
+    archives.py [<megabytes>]
+"""
+
+# Standard library imports
+import sys
+import tarfile
+from os import urandom, makedirs
+from os.path import abspath, dirname, getsize
+from shutil import rmtree
+from subprocess import call
+from tempfile import mkdtemp
+from time import time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Craft imports
+from craft import archive
+
+# Compressors used to build the synthetic archives, for formats tarfile
+# cannot write by itself on every Python version
+_compressors = {
+    'tar.xz': ['xz', '-z', '-T0', '-k']
+}
+
+def tree(directory, megabytes):
+    """ Builds a synthetic file tree, made of half compressible
+    and half random data.
+
+    Parameters
+        directory
+            directory for the tree to be built in.
+        megabytes
+            approximate size of the tree.
+    """
+
+    block = 256*1024
+    for position in range(0, megabytes*4):
+        subdirectory = '{0}/usr/share/package/{1}'.format(directory, position/64)
+        if position % 64 == 0:
+            makedirs(subdirectory)
+        handle = open('{0}/{1}.dat'.format(subdirectory, position), 'wb')
+        if position % 2:
+            handle.write(urandom(block))
+        else:
+            handle.write(('synthetic line {0}\n'.format(position)*(block/24))[:block])
+        handle.close()
+
+def build(source, destination, format):
+    """ Builds an archive of a file tree.
+
+    Returns
+        string
+            the archive's path.
+        None
+            if the format cannot be built here.
+    """
+
+    filepath = destination+'/'+archive.filename(format)
+
+    if format in _compressors:
+        plain = destination+'/'+archive.filename('tar')
+        handle = tarfile.open(plain, 'w')
+        handle.add(source+'/usr', './usr')
+        handle.close()
+        try:
+            if call(_compressors[format]+[plain]) != 0:
+                return None
+        except OSError:
+            return None
+        return filepath
+
+    handle = tarfile.open(filepath, 'w:'+archive.FORMATS[format])
+    handle.add(source+'/usr', './usr')
+    handle.close()
+
+    return filepath
+
+def measure(filepath, format, size, label):
+    """ Extracts an archive and reports its throughput. """
+
+    destination = mkdtemp(prefix='craft-extract-')
+    try:
+        start = time()
+        extracted = archive.extract(filepath, destination, format)
+        elapsed = time()-start
+    finally:
+        rmtree(destination)
+
+    if not extracted:
+        print('{0:<24} failed'.format(label))
+        return
+
+    print('{0:<24} {1:>8.1f} MB/s {2:>10.3f} s {3:>8.1f} MB archive'.format(
+        label, size/elapsed/1048576.0, elapsed, getsize(filepath)/1048576.0))
+
+def main(megabytes):
+    """ Builds a synthetic archive in every format, and extracts each one
+    of them with both the external decompressors and tarfile. """
+
+    workspace = mkdtemp(prefix='craft-archives-')
+    try:
+        tree(workspace+'/tree', megabytes)
+        size = megabytes*1024*1024
+
+        print('tree: {0} MB'.format(megabytes))
+        for format in sorted(archive.FORMATS):
+            filepath = build(workspace+'/tree', workspace, format)
+            if filepath is None:
+                print('{0:<24} unavailable'.format(format))
+                continue
+
+            measure(filepath, format, size, format)
+            if archive._decompressor(format):
+                decompressors = archive._decompressors
+                archive._decompressors = {}
+                try:
+                    measure(filepath, format, size, format+' (tarfile)')
+                finally:
+                    archive._decompressors = decompressors
+    finally:
+        rmtree(workspace)
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]))
+    except IndexError:
+        main(64)
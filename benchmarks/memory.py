@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+""" Measures the resident memory used by Package units.
+
+Usage:
+    memory.py [<count>]
+"""
+
+# Standard library imports
+import gc
+import sys
+from os import sysconf
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Craft imports
+from craft.elements import Package, Set
+from craft import load
+
+def resident():
+    """ Retrieves the process' resident memory, in bytes. """
+
+    handle = open('/proc/self/statm')
+    pages = int(handle.read().split()[1])
+    handle.close()
+
+    return pages*sysconf('SC_PAGE_SIZE')
+
+def definition(position):
+    """ Builds a synthetic package definition.
+
+    Parameters
+        position
+            the package's position, used for naming it and
+            its dependencies.
+    """
+
+    return {
+        'checksums': {'sha1': '{0:040x}'.format(position)},
+        'files': {'static': ['./etc/package{0}.conf'.format(position)]},
+        'depends': ['package{0}:amd64'.format(position-each) for each in range(1, 4) if position-each >= 0],
+        'conflicts': None,
+        'replaces': None,
+        'provides': None,
+        'groups': ['base'],
+        'flags': None,
+        'information': {
+            'maintainers': ['Craft Maintainers'],
+            'tags': ['library', 'base'],
+            'misc': {
+                'Website': 'http://example.org/package{0}'.format(position),
+                'Description': 'Synthetic package number {0}.'.format(position)
+            }
+        }
+    }
+
+def main(count):
+    """ Loads synthetic packages into a Set, the same way load._set() does,
+    and reports the memory they retain. """
+
+    gc.collect()
+    before = resident()
+
+    units = Set()
+    shared = {}
+    for position in range(0, count):
+        data = definition(position)
+        load._flyweight(data, shared)
+        units.add(Package(load._intern('package{0}'.format(position)), load._intern('1.0'), load._intern('amd64'), load._intern('main'), data))
+    gc.collect()
+    after = resident()
+
+    print('packages: {0}'.format(count))
+    print('resident memory: {0} bytes'.format(after-before))
+    print('per package: {0} bytes'.format((after-before)/count))
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]))
+    except IndexError:
+        main(50000)
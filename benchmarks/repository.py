@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+""" Generates synthetic Craft environments, having a repository of packages
+along with their archives, a database and a root directory.
+
+Usage:
+    repository.py [options] <directory>
+
+Options:
+    --packages=<count>     Number of packages. [default: 1000]
+    --fanout=<count>       Dependencies per package. [default: 3]
+    --virtuals=<count>     Number of virtual packages. [default: 10]
+    --groups=<count>       Number of groups. [default: 5]
+    --size=<bytes>         Size of each package's archived data. [default: 4096]
+    --files=<count>        Files in each package's archive. [default: 4]
+    --seed=<seed>          Seed for the generated relationships. [default: 0]
+"""
+
+# Standard library imports
+import hashlib
+import io
+import random
+import sys
+import tarfile
+from os import makedirs
+from os.path import abspath, dirname
+
+# Third-party imports
+import yaml
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Craft imports
+from craft import archive
+
+# Versions every package is available in, so that upgrades can be resolved
+VERSIONS = ('1.0', '2.0')
+
+ARCHITECTURE = 'amd64'
+
+def name(position):
+    """ Retrieves the name of a synthetic package. """
+
+    return 'package{0}'.format(position)
+
+def build_archive(filepath, package, version, size, files):
+    """ Writes a package's archive, having its own directory under
+    /usr/share so that packages never collide.
+
+    Parameters
+        filepath
+            path for the archive to be written to.
+        package
+            the package's name.
+        version
+            the package's version.
+        size
+            total size of the archived files, in bytes.
+        files
+            number of archived files.
+    Returns
+        string
+            the archive's SHA-1 checksum.
+    """
+
+    handle = tarfile.open(filepath, 'w:gz')
+    for directory in ['./usr', './usr/share', './usr/share/'+package]:
+        member = tarfile.TarInfo(directory)
+        member.type = tarfile.DIRTYPE
+        member.mode = 0o755
+        handle.addfile(member)
+
+    line = '{0} {1}\n'.format(package, version)
+    for position in range(0, files):
+        data = (line*(size/files/len(line)+1))[:size/files]
+        member = tarfile.TarInfo('./usr/share/{0}/data{1}'.format(package, position))
+        member.size = len(data)
+        member.mode = 0o644
+        handle.addfile(member, io.BytesIO(data))
+    handle.close()
+
+    return checksum(filepath)
+
+def checksum(filepath):
+    """ Calculates a file's SHA-1 checksum. """
+
+    handle = open(filepath, 'rb')
+    try:
+        return hashlib.sha1(handle.read()).hexdigest()
+    finally:
+        handle.close()
+
+def definitions(packages, fanout, virtuals, groups, seed):
+    """ Builds the relationships of the synthetic packages. Each package
+    depends on packages found before it, so that dependencies may always
+    be resolved, and a few of them depend on virtual packages instead.
+
+    Returns
+        list
+            having a (depends, provides, groups) tuple for each package.
+    """
+
+    generator = random.Random(seed)
+    relationships = []
+
+    for position in range(0, packages):
+        depends = set()
+        for each in range(0, min(fanout, position)):
+            depends.add(name(generator.randrange(0, position))+':'+ARCHITECTURE)
+
+        provides = None
+        if virtuals and position < virtuals:
+            provides = ['virtual{0}'.format(position)]
+        elif virtuals and position % 97 == 96:
+            depends.add('virtual{0}'.format(generator.randrange(0, virtuals)))
+
+        member_of = None
+        if groups:
+            member_of = ['group{0}'.format(position % groups)]
+
+        relationships.append((sorted(depends) or None, provides, member_of))
+
+    return relationships
+
+def generate(directory, packages=1000, fanout=3, virtuals=10, groups=5, size=4096, files=4, seed=0):
+    """ Generates a synthetic Craft environment.
+
+    Parameters
+        directory
+            directory for the environment to be generated in. Must not exist.
+        packages
+            number of packages, each one of them available in every
+            one of VERSIONS.
+        fanout
+            number of dependencies of each package.
+        virtuals
+            number of virtual packages, each one of them provided by
+            a single package.
+        groups
+            number of groups, every package belonging to one of them.
+        size
+            total size of each package's archived files, in bytes.
+        files
+            number of files in each package's archive.
+        seed
+            seed for the packages' relationships.
+    Returns
+        string
+            path of the environment's configuration file.
+    """
+
+    directory = abspath(directory)
+    makedirs(directory+'/db/available/main')
+    makedirs(directory+'/root')
+
+    data = {}
+    relationships = definitions(packages, fanout, virtuals, groups, seed)
+    for position in range(0, packages):
+        depends, provides, member_of = relationships[position]
+        data[name(position)] = {}
+        for version in VERSIONS:
+            location = '{0}/remote/{1}/{2}/{3}'.format(directory, name(position), version, ARCHITECTURE)
+            makedirs(location)
+            sha1 = build_archive(location+'/'+archive.filename(archive.DEFAULT_FORMAT), name(position), version, size, files)
+            data[name(position)][version] = {ARCHITECTURE: {
+                'checksums': {'sha1': sha1},
+                'files': {'static': None},
+                'depends': depends and list(depends),
+                'conflicts': None,
+                'replaces': None,
+                'provides': provides and list(provides),
+                'groups': member_of and list(member_of),
+                'flags': None,
+                'information': {
+                    'maintainers': ['Craft Maintainers'],
+                    'tags': ['synthetic'],
+                    'misc': {'Description': 'Synthetic package number {0}.'.format(position)}
+                }
+            }}
+
+    handle = open(directory+'/db/available/main/'+ARCHITECTURE+'.yml', 'w')
+    yaml.safe_dump(data, handle, default_flow_style=False)
+    handle.close()
+
+    configuration = {
+        'repositories': {'main': {'target': directory+'/remote', 'handler': 'cp -t .'}},
+        'architectures': {'default': ARCHITECTURE, 'enabled': [ARCHITECTURE]},
+        'groups': None,
+        'db': directory+'/db/',
+        'root': directory+'/root/'
+    }
+    handle = open(directory+'/config.yml', 'w')
+    yaml.safe_dump(configuration, handle, default_flow_style=False)
+    handle.close()
+
+    return directory+'/config.yml'
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    print(generate(args['<directory>'],
+        int(args['--packages']),
+        int(args['--fanout']),
+        int(args['--virtuals']),
+        int(args['--groups']),
+        int(args['--size']),
+        int(args['--files']),
+        int(args['--seed'])))
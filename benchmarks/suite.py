@@ -0,0 +1,360 @@
+#!/usr/bin/python
+
+""" Times Craft's main operations end-to-end on a synthetic environment,
+and reports the results as JSON. Results may be stored as a baseline,
+which later runs are compared against: the comparison exits with a
+non-zero status whenever a scenario has become slower, or uses more
+memory, than the tolerances allow.
+
+Usage:
+    suite.py [options]
+    suite.py baseline <path> [options]
+    suite.py compare <path> [options]
+
+Options:
+    --packages=<count>          Number of packages. [default: 1000]
+    --fanout=<count>            Dependencies per package. [default: 3]
+    --virtuals=<count>          Number of virtual packages. [default: 10]
+    --groups=<count>            Number of groups. [default: 5]
+    --size=<bytes>              Size of each package's archived data. [default: 4096]
+    --files=<count>             Files in each package's archive. [default: 4]
+    --seed=<seed>               Seed for the generated relationships. [default: 0]
+    --targets=<count>           Packages targeted by each operation. [default: 50]
+    --repeat=<count>            Runs of each scenario, the fastest one
+                                being kept. [default: 3]
+    --tolerance=<ratio>         Allowed slowdown when comparing. [default: 0.25]
+    --memory-tolerance=<ratio>  Allowed peak memory growth when
+                                comparing. [default: 0.25]
+    --output=<path>             File for the results to be written to,
+                                instead of the standard output.
+
+When comparing, the environment is generated with the baseline's
+parameters, whatever the options given.
+"""
+
+# Standard library imports
+from glob import glob
+import json
+import platform
+import sys
+from os import devnull, fork, pipe, fdopen, close, waitpid, _exit, remove, mkdir, sysconf
+from os.path import abspath, dirname
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event, Thread
+from time import time
+import traceback
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Third-party imports
+from docopt import docopt
+
+# Craft imports
+from craft import actions, cache, closure, load, message, validate
+from craft.elements import Set
+import repository
+
+# Parameters describing the generated environment
+PARAMETERS = ('packages', 'fanout', 'virtuals', 'groups', 'size', 'files', 'seed', 'targets')
+
+# Differences below these are regarded as noise when comparing
+_time_slack = 0.05
+_memory_slack = 1024*1024
+
+# Seconds between samples of the resident memory, without tracemalloc
+_sampling_interval = 0.005
+
+class _Choices(object):
+    """ Standard input answering every prompt with the first choice,
+    such as the provider of a virtual package. """
+
+    def readline(self, *args):
+        return '0\n'
+
+class _Quiet(object):
+    """ Silences Craft's messages and answers its prompts while
+    a scenario runs, so that console I/O is not measured. """
+
+    def __enter__(self):
+        self.streams = sys.stdin, sys.stdout
+        sys.stdin = _Choices()
+        sys.stdout = open(devnull, 'w')
+
+    def __exit__(self, *args):
+        message.flush()
+        sys.stdout.close()
+        sys.stdin, sys.stdout = self.streams
+
+def resident():
+    """ Retrieves the process' resident memory, in bytes. """
+
+    handle = open('/proc/self/statm')
+    pages = int(handle.read().split()[1])
+    handle.close()
+
+    return pages*sysconf('SC_PAGE_SIZE')
+
+class _Peak(object):
+    """ Samples the resident memory on a thread while a scenario runs.
+    Without tracemalloc, as on Python 2, it is the only measure of the
+    scenario's peak: ru_maxrss is inherited across fork(), so it would
+    report the parent's peak instead. Allocations shorter than the
+    sampling interval may be missed. """
+
+    def __enter__(self):
+        self.before = self.peak = resident()
+        self.done = Event()
+        self.thread = Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.done.wait(_sampling_interval):
+            self.peak = max(self.peak, resident())
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, resident())
+
+    def growth(self):
+        return self.peak-self.before
+
+def _child(scenario, prepare):
+    """ Runs a scenario in a forked process.
+
+    Returns
+        dict
+            having the scenario's duration in seconds and the peak memory,
+            in bytes, it allocated on top of what the process already used.
+    """
+
+    with _Quiet():
+        if prepare is not None:
+            prepare()
+
+        if tracemalloc is not None:
+            tracemalloc.start()
+            start = time()
+            scenario()
+            elapsed = time()-start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            with _Peak() as sampler:
+                start = time()
+                scenario()
+                elapsed = time()-start
+            peak = sampler.growth()
+
+    return {'seconds': elapsed, 'peak_memory': peak}
+
+def measure(name, scenario, operations, repeat, results, prepare=None):
+    """ Runs and times a scenario, each run in its own forked process so
+    that its peak memory is measured separately, and so that it leaves
+    no state behind in memory.
+
+    Parameters
+        name
+            the scenario's name.
+        scenario
+            callable running the scenario.
+        operations
+            number of operations the scenario performs.
+        repeat
+            number of runs, the fastest one being kept.
+        results
+            list for the scenario's timing to be appended to.
+        prepare
+            optional callable run before each run, but not timed.
+    Raises
+        RuntimeError
+            if the scenario failed.
+    """
+
+    runs = []
+    for each in range(0, repeat):
+        reader, writer = pipe()
+        pid = fork()
+        if pid == 0:
+            close(reader)
+            handle = fdopen(writer, 'w')
+            status = 0
+            try:
+                handle.write(json.dumps(_child(scenario, prepare)))
+            except:
+                handle.write(json.dumps({'error': traceback.format_exc()}))
+                status = 1
+            handle.close()
+            _exit(status)
+
+        close(writer)
+        handle = fdopen(reader)
+        run = json.loads(handle.read() or '{"error": "no result"}')
+        handle.close()
+        waitpid(pid, 0)
+
+        if 'error' in run:
+            raise RuntimeError("scenario '{0}' failed:\n{1}".format(name, run['error']))
+        runs.append(run)
+
+    results.append({
+        'scenario': name,
+        'seconds': min([run['seconds'] for run in runs]),
+        'peak_memory': max([run['peak_memory'] for run in runs]),
+        'operations': operations
+    })
+
+def _reset(configuration):
+    """ Removes every installed package from an environment. """
+
+    rmtree(configuration.root(), True)
+    mkdir(configuration.root())
+    rmtree(configuration.db()+'installed', True)
+    for filepath in glob(configuration.db()+'owners*'):
+        remove(filepath)
+
+def targets(packages, count):
+    """ Retrieves the names of the targeted packages, those having
+    the largest dependency closures. """
+
+    return [repository.name(position)+':'+repository.ARCHITECTURE for position in range(max(0, packages-count), packages)]
+
+def run(parameters, repeat):
+    """ Generates a synthetic environment and times each scenario on it.
+
+    Parameters
+        parameters
+            dict having a value for each one of PARAMETERS.
+        repeat
+            number of runs of each scenario.
+    Returns
+        dict
+            having the environment's parameters and the scenarios' results.
+    """
+
+    results = []
+    directory = mkdtemp(prefix='craft-benchmark-')
+    try:
+        filepath = repository.generate(directory+'/environment',
+            parameters['packages'], parameters['fanout'], parameters['virtuals'],
+            parameters['groups'], parameters['size'], parameters['files'],
+            parameters['seed'])
+        configuration = load.configuration(filepath)
+        available = load.available(configuration)
+        versions = parameters['packages']*len(repository.VERSIONS)
+
+        measure('load.available', lambda: load.available(configuration), versions, repeat, results)
+
+        definition = load.yaml(glob(configuration.db()+'available/*/*.yml')[0])
+        measure('validate.set', lambda: validate.set(definition), versions, repeat, results)
+
+        names = [repository.name(position)+':'+repository.ARCHITECTURE for position in range(0, parameters['packages'])]
+        measure('Set.target', lambda: [available.target(name) for name in names], len(names), repeat, results)
+
+        targeted = [available.target(name) for name in targets(parameters['packages'], parameters['targets'])]
+        measure('actions.install (cold closures)', lambda: actions.install(configuration, Set(), available, targeted), len(targeted), repeat, results, lambda: closure.clear(configuration))
+        with _Quiet():
+            plan = actions.install(configuration, Set(), available, targeted)
+        measure('actions.install', lambda: actions.install(configuration, Set(), available, targeted), len(targeted), repeat, results)
+
+        installed = Set([package for package in available.packages() if package.version == repository.VERSIONS[0]])
+        outdated = [installed.target(name) for name in targets(parameters['packages'], parameters['targets'])]
+        measure('actions.upgrade', lambda: actions.upgrade(configuration, installed, available, outdated), len(outdated), repeat, results)
+        measure('actions.uninstall', lambda: actions.uninstall(installed, outdated), len(outdated), repeat, results)
+
+        measure('actions.download', lambda: actions.download(configuration, plan), len(plan), repeat, results, lambda: rmtree(cache.directory(configuration), True))
+        with _Quiet():
+            actions.download(configuration, plan)
+        measure('actions._install', lambda: actions._install_all(configuration, Set(), plan), len(plan), repeat, results, lambda: _reset(configuration))
+    finally:
+        rmtree(directory, True)
+
+    return {
+        'parameters': parameters,
+        'python': platform.python_version(),
+        'results': results
+    }
+
+def compare(baseline, current, tolerance, memory_tolerance):
+    """ Compares a run's results against a baseline's.
+
+    Parameters
+        baseline
+            the baseline's results, as returned by run().
+        current
+            the new run's results.
+        tolerance
+            allowed slowdown, as a ratio of the baseline's durations.
+        memory_tolerance
+            allowed peak memory growth, as a ratio of the baseline's.
+    Returns
+        list
+            having a description of each regression found.
+    """
+
+    found = {}
+    for result in current['results']:
+        found[result['scenario']] = result
+
+    regressions = []
+    for result in baseline['results']:
+        name = result['scenario']
+        if name not in found:
+            regressions.append("{0}: missing from the new run".format(name))
+            continue
+
+        seconds = found[name]['seconds']
+        if seconds > result['seconds']*(1+tolerance) and seconds-result['seconds'] > _time_slack:
+            regressions.append("{0}: {1:.3f} s, was {2:.3f} s".format(name, seconds, result['seconds']))
+
+        memory = found[name]['peak_memory']
+        if memory > result['peak_memory']*(1+memory_tolerance) and memory-result['peak_memory'] > _memory_slack:
+            regressions.append("{0}: {1} bytes at peak, was {2} bytes".format(name, memory, result['peak_memory']))
+
+    return regressions
+
+def main():
+    args = docopt(__doc__)
+
+    parameters = {}
+    for key in PARAMETERS:
+        parameters[key] = int(args['--'+key])
+
+    baseline = None
+    if args['compare']:
+        handle = open(args['<path>'])
+        baseline = json.load(handle)
+        handle.close()
+        parameters = baseline['parameters']
+
+    results = run(parameters, int(args['--repeat']))
+    report = json.dumps(results, indent=4, sort_keys=True)
+
+    if args['baseline']:
+        handle = open(args['<path>'], 'w')
+        handle.write(report+'\n')
+        handle.close()
+    elif args['--output']:
+        handle = open(args['--output'], 'w')
+        handle.write(report+'\n')
+        handle.close()
+    else:
+        print(report)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, float(args['--tolerance']), float(args['--memory-tolerance']))
+        for regression in regressions:
+            sys.stderr.write('Regression: '+regression+'\n')
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+""" Measures the throughput of package and set validation.
+
+Usage:
+    validation.py [<count>]
+"""
+
+# Standard library imports
+import sys
+from os.path import abspath, dirname
+from time import time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Craft imports
+from craft import validate
+import memory
+
+# Runs of each measurement, the fastest one being kept
+_repeat = 5
+
+def fastest(function, *args):
+    """ Runs a function several times.
+
+    Returns
+        float
+            the duration of the fastest run, in seconds.
+    """
+
+    durations = []
+    for each in range(0, _repeat):
+        start = time()
+        function(*args)
+        durations.append(time()-start)
+
+    return min(durations)
+
+def packages(definitions):
+    for definition in definitions:
+        validate.package(definition)
+
+def main(count):
+    """ Validates synthetic package definitions, one at a time and
+    as a whole set, and reports how many are validated per second. """
+
+    definitions = [memory.definition(position) for position in range(0, count)]
+    data = {}
+    for position, definition in enumerate(definitions):
+        data['package{0}'.format(position)] = {'1.0': {'amd64': definition}}
+
+    for label, seconds in [
+        ('validate.package', fastest(packages, definitions)),
+        ('validate.set', fastest(validate.set, data))
+    ]:
+        print('{0:<18} {1:>8.3f} s {2:>10.0f} packages/s'.format(label, seconds, count/max(seconds, 1e-9)))
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]))
+    except IndexError:
+        main(20000)
@@ -1,20 +1,37 @@
 """ High-level interface to Craft's most common operations. """
 
 # Standard library imports
+from errno import EEXIST, ENOTEMPTY
 from glob import glob
-from os import system, mkdir, chdir, rmdir, remove, rename, access, W_OK
-from os.path import isfile, isdir
+from os import system, mkdir, chdir, rmdir, remove, rename, link, chmod, lstat, access, walk, W_OK
+from os.path import isfile, isdir, islink, getsize, lexists, dirname, join
 from shutil import rmtree
+from stat import S_IMODE
+from tempfile import mkdtemp
+from threading import RLock
+from time import time
 
 # Craft imports
 from elements import BrokenDependency, Conflict
 from elements import Incompatible, Installable, Uninstallable, Upgradeable, Downgradeable
-from elements import Set
+from elements import Package, Set
 import archive
+import cache
 import checksum
+import closure
 import dump
 import environment
+import events
+import integrity
 import message
+import ownership
+import progress
+import removal
+import schedule
+import timing
+
+# Guards the installed Set and the ownership index against concurrent installations
+_lock = RLock()
 
 class InstallError(Exception):
     """ Raised if an error occurs during a package's installation phase. """
@@ -104,7 +121,7 @@ class EnableError(Exception):
 
         self.filepath = filepath
 
-def _install(configuration, installed, package, filepath):
+def _install(configuration, installed, package, filepath, tracker=None):
     """ Performs a low-level package installation.
 
     Parameters
@@ -117,6 +134,8 @@ def _install(configuration, installed, package, filepath):
         filepath
             absolute filesystem path of the package's archive
             to be installed.
+        tracker
+            optional progress.Progress, advanced as files are extracted.
     Raises
         InstallError
             if any error occurs during the installation.
@@ -128,6 +147,7 @@ def _install(configuration, installed, package, filepath):
             if the installation was successfully completed.
     """
 
+    started = time()
     architecture = package.architecture
     name = package.name
     version = package.version
@@ -145,9 +165,10 @@ def _install(configuration, installed, package, filepath):
         except OSError:
             pass
 
-    if package in installed:
-        message.warning("'{0}' is already installed. Aborting...".format(package))
-        raise InstallError(package)
+    with _lock:
+        if package in installed:
+            message.warning("'{0}' is already installed. Aborting...".format(package))
+            raise InstallError(package)
 
     try:
         mkdir(package_directory)
@@ -155,19 +176,25 @@ def _install(configuration, installed, package, filepath):
         message.warning("failed to create internal directory while installing '{0}'. Aborting...".format(package))
         raise InstallError(package)
 
-    try:
-        chdir(package_directory)
-    except OSError:
-        message.warning("could not access the directory belonging to package '{0}'. Aborting...".format(package))
-        raise InstallError(package)
-
-    sha1 = package.has_checksum('sha1')
-    if sha1:
+    checksums = package.checksums()
+    if checksums:
         if not filepath:
             message.warning("missing archive filepath for package '{0}'. Aborting...".format(package))
             raise InstallError(package)
 
-        if not checksum.sha1(filepath, sha1):
+        for algorithm in checksums:
+            if not checksum.supported(algorithm):
+                message.warning("unsupported checksum '{0}' specified by package '{1}'. Aborting...".format(algorithm, package))
+                try:
+                    rmtree(package_directory)
+                except OSError:
+                    raise
+                raise InstallError(package)
+
+        verifying = time()
+        valid = checksum.verify(filepath, checksums, checksum.Cache(configuration.db()+'checksums'))
+        events.emit('verify', package=str(package), valid=valid, duration=time()-verifying)
+        if not valid:
             message.warning("inconsistent archive provided for package '{0}'. Aborting...".format(package))
             try:
                 rmtree(package_directory)
@@ -175,19 +202,39 @@ def _install(configuration, installed, package, filepath):
                 raise
             raise InstallError(package)
 
-        package_files = archive.getfiles(filepath)
-        if not package_files:
+        package_entries = archive.getentries(filepath, package.format())
+        if not package_entries:
             message.warning("empty archive provided for package '{0}'. Aborting...".format(package))
             try:
                 rmtree(package_directory)
             except OSError:
                 raise
             raise InstallError(package)
+        package_files = [name for name, is_directory in package_entries]
+
+        # Files are claimed as soon as they are found not to collide, so
+        # packages being installed at the same time cannot both claim them.
+        with _lock:
+            index = ownership.Index(configuration)
+            collisions = index.collisions(package, package_entries)
+            if not collisions:
+                index.add(package, package_files)
+            index.close()
+        if collisions:
+            for path, owner in collisions:
+                message.warning("'{0}' from package '{1}' is already owned by '{2}'.".format(path, package, owner))
+            message.warning("file collisions found while installing '{0}'. Aborting...".format(package))
+            try:
+                rmtree(package_directory)
+            except OSError:
+                raise
+            raise InstallError(package)
 
         try:
-            package_files_dump_handle = open('files', 'w')
+            package_files_dump_handle = open(package_directory+'/files', 'w')
         except IOError:
             message.warning("could not write the file list for package '{0}'. Aborting...".format(package))
+            _release(configuration, package, package_files)
             try:
                 rmtree(package_directory)
             except OSError:
@@ -198,24 +245,549 @@ def _install(configuration, installed, package, filepath):
                 package_files_dump_handle.write(each+'\n')
             package_files_dump_handle.close()
 
-        if not archive.extract(filepath, configuration.root()):
+        callback = None
+        if tracker is not None:
+            callback = lambda member: tracker.advance(member.size, member.isfile())
+
+        extracting = time()
+        if not archive.extract(filepath, configuration.root(), package.format(), callback):
             message.warning("could not extract the archive provided for package '{0}'. Aborting...".format(package))
+            _release(configuration, package, package_files)
             try:
                 rmtree(package_directory)
             except OSError:
                 raise
             raise InstallError(package)
+        events.emit('extract', package=str(package), files=len(package_files), duration=time()-extracting)
+
+        try:
+            integrity.record(configuration, package, package_files)
+        except IOError:
+            message.warning("could not record the digests of the files belonging to package '{0}'.".format(package))
 
     try:
-        if not dump.package(package, 'metadata.yml'):
+        if not dump.package(package, package_directory+'/metadata.yml'):
             message.warning("failed to write metadata.yml for package '{0}'. Aborting...".format(package))
+            if checksums:
+                _release(configuration, package, package_files)
             raise InstallError(package)
     except IOError:
         raise
 
-    installed.add(package)
+    with _lock:
+        installed.add(package)
+
+    events.emit('install', package=str(package), duration=time()-started)
+    return True
+
+def _release(configuration, package, paths):
+    """ Gives up the ownership of the files claimed by a package
+    whose installation has failed.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose installation has failed.
+        paths
+            iterable having the package's paths, as found in its archive.
+    """
+
+    with _lock:
+        index = ownership.Index(configuration)
+        index.remove(package, paths)
+        index.close()
+
+def _abandon(configuration, package, paths):
+    """ Undoes the bookkeeping of a package whose replacement has failed,
+    so that it may be attempted again: gives up the ownership of its
+    files, and removes its directory from the database.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose replacement has failed.
+        paths
+            iterable having the package's paths, as found in its archive.
+    """
+
+    _release(configuration, package, paths)
+
+    directory = configuration.db()+'installed/'+package.name+'/'+package.version
+    rmtree(directory+'/'+package.architecture, True)
+    for each in [directory, configuration.db()+'installed/'+package.name]:
+        try:
+            rmdir(each)
+        except OSError:
+            break
+
+def _restore(root, backup, swapped, created, displaced, preserved):
+    """ Undoes a partial swap of a package's files. The files renamed over
+    are restored from their backups, and whatever did not exist before is
+    removed.
+
+    Parameters
+        root
+            the root directory.
+        backup
+            directory holding the backups, named after the position of
+            the swap they were made for.
+        swapped
+            list having a (path, backed up) tuple for each file swapped,
+            in the order they were swapped.
+        created
+            list having the directories created for the new files,
+            parents first.
+        displaced
+            list having the paths which changed type, whose previous
+            files or directories were moved to the backup directory
+            and named after their position.
+        preserved
+            list having the '.craft-old' links made to preserve the
+            old package's static files.
+    Raises
+        OSError
+            if a file could not be restored.
+    """
+
+    for position in range(len(swapped)-1, -1, -1):
+        path, backed_up = swapped[position]
+        if backed_up:
+            rename(backup+'/'+str(position), root+path)
+        else:
+            remove(root+path)
+
+    for path in reversed(created):
+        try:
+            rmdir(root+path)
+        except OSError:
+            pass
+
+    for position in range(len(displaced)-1, -1, -1):
+        rename(backup+'/displaced-'+str(position), root+displaced[position])
+
+    for path in preserved:
+        try:
+            remove(path)
+        except OSError:
+            pass
+
+    rmtree(backup, True)
+
+def _displace(root, backup, path, owned, displaced):
+    """ Moves what stands in the way of a path changing type, from a file
+    to a directory or the other way around, to the backup directory. Only
+    the replaced package's own files and directories may be moved.
+
+    Parameters
+        root
+            the root directory.
+        backup
+            directory holding the backups.
+        path
+            the normalised path, relative to the root directory.
+        owned
+            set having the normalised paths of the replaced package's files.
+        displaced
+            list having the paths already moved to the backup directory,
+            to which the path is added.
+    Raises
+        OSError
+            if the path, or anything below it, belongs to another
+            package, or if it could not be moved.
+    """
+
+    if path not in owned:
+        raise OSError(EEXIST, "not owned by the replaced package", root+path)
+    if isdir(root+path) and not islink(root+path):
+        for directory, subdirectories, files in walk(root+path):
+            for name in subdirectories+files:
+                if ownership.normalise(join(directory, name), root) not in owned:
+                    raise OSError(ENOTEMPTY, "directory not empty", root+path)
+
+    displaced.append(path)
+    rename(root+path, backup+'/displaced-'+str(len(displaced)-1))
+
+def _archive(configuration, package):
+    """ Retrieves the filesystem path of a package's cached archive.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose archive is to be found.
+    Returns
+        string
+            absolute filesystem path of the archive.
+        False
+            if the package does not ship an archive.
+    """
+
+    if package.has_checksum():
+        return cache.resolve(configuration, package)
+
+    return False
+
+@timing.timed('install')
+def _install_all(configuration, installed, packages):
+    """ Performs the low-level installation of a collection of packages.
+    Packages which do not depend on each other are installed in parallel,
+    while dependencies are always installed before their dependents.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        installed
+            Set having all currently installed units on the system.
+        packages
+            Plan, or iterable, having the Package units to be installed,
+            along with their archives already downloaded.
+    Raises
+        InstallError
+            if any package could not be installed. No further packages
+            are installed once that happens.
+    Returns
+        True
+            if all packages were successfully installed.
+    """
+
+    def perform(package):
+        package.save_temporary_flags()
+        message.simple("Installing '{0}'...".format(package))
+        _install(configuration, installed, package, _archive(configuration, package), tracker)
+        message.simple("'{0}' was successfully installed...".format(package))
+        tracker.advance(items=1)
+
+    if not isinstance(packages, schedule.Plan):
+        packages = schedule.Plan(packages)
+    tracker = progress.Progress('Installing', len(packages), 'packages')
+    try:
+        packages.execute(perform, configuration.workers())
+    finally:
+        tracker.finish()
+        cache.flush(configuration)
+        message.flush()
+
     return True
 
+def _replace(configuration, installed, old, new, filepath):
+    """ Performs a low-level, staged package replacement. The new package's
+    archive is extracted to a staging directory on the same filesystem,
+    and each of its files is then renamed over the old one, so that no
+    file is ever missing. Files only shipped by the old package are
+    removed afterwards, and its static files are preserved as hard links.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        installed
+            Set having all currently installed units on the system.
+        old
+            the installed Package unit to be replaced.
+        new
+            the Package unit replacing it.
+        filepath
+            absolute filesystem path of the new package's archive.
+    Raises
+        InstallError
+            if any error occurs during the replacement. The files renamed
+            into place before the error occurred are restored from their
+            backups, and the new package's ownership claims and database
+            directory are removed.
+        OSError
+            if, in case an operation has failed, it is not possible
+            to cleanly recover from it.
+    Returns
+        True
+            if the replacement was successfully completed.
+    """
+
+    started = time()
+    db = configuration.db()
+    root = configuration.root()
+    old_directory = db+'installed/'+old.name+'/'+old.version+'/'+old.architecture
+    new_directory = db+'installed/'+new.name+'/'+new.version+'/'+new.architecture
+
+    with _lock:
+        # Sets match units by name and architecture alone, which the
+        # replacement usually shares with the package it replaces.
+        if old not in installed:
+            message.warning("'{0}' is not installed. Aborting...".format(old))
+            raise InstallError(new)
+        elif isdir(new_directory):
+            message.warning("'{0}' is already installed. Aborting...".format(new))
+            raise InstallError(new)
+
+    old_files = []
+    try:
+        handle = open(old_directory+'/files')
+    except IOError:
+        pass
+    else:
+        old_files = handle.read().splitlines()
+        handle.close()
+
+    checksums = new.checksums()
+    new_entries = []
+    if checksums:
+        if not filepath:
+            message.warning("missing archive filepath for package '{0}'. Aborting...".format(new))
+            raise InstallError(new)
+
+        for algorithm in checksums:
+            if not checksum.supported(algorithm):
+                message.warning("unsupported checksum '{0}' specified by package '{1}'. Aborting...".format(algorithm, new))
+                raise InstallError(new)
+
+        verifying = time()
+        valid = checksum.verify(filepath, checksums, checksum.Cache(configuration.db()+'checksums'))
+        events.emit('verify', package=str(new), valid=valid, duration=time()-verifying)
+        if not valid:
+            message.warning("inconsistent archive provided for package '{0}'. Aborting...".format(new))
+            raise InstallError(new)
+
+        new_entries = archive.getentries(filepath, new.format())
+        if not new_entries:
+            message.warning("empty archive provided for package '{0}'. Aborting...".format(new))
+            raise InstallError(new)
+    new_files = [name for name, is_directory in new_entries]
+
+    with _lock:
+        index = ownership.Index(configuration)
+        collisions = [(path, owner) for path, owner in index.collisions(new, new_entries) if owner != str(old)]
+        if not collisions:
+            index.add(new, new_files)
+        index.close()
+    if collisions:
+        for path, owner in collisions:
+            message.warning("'{0}' from package '{1}' is already owned by '{2}'.".format(path, new, owner))
+        message.warning("file collisions found while installing '{0}'. Aborting...".format(new))
+        raise InstallError(new)
+
+    for each in [db+'installed/'+new.name, db+'installed/'+new.name+'/'+new.version, new_directory]:
+        try:
+            mkdir(each)
+        except OSError:
+            pass
+
+    try:
+        handle = open(new_directory+'/files', 'w')
+    except IOError:
+        message.warning("could not write the file list for package '{0}'. Aborting...".format(new))
+        _abandon(configuration, new, new_files)
+        raise InstallError(new)
+    else:
+        for each in new_files:
+            handle.write(each+'\n')
+        handle.close()
+
+    backup = None
+    swapped = []
+    created = []
+    displaced = []
+    preserved = []
+
+    if checksums:
+        try:
+            staging = mkdtemp(prefix='.craft-staging-', dir=root)
+        except OSError:
+            message.warning("could not create a staging directory for package '{0}'. Aborting...".format(new))
+            _abandon(configuration, new, new_files)
+            raise InstallError(new)
+
+        try:
+            backup = mkdtemp(prefix='.craft-backup-', dir=root)
+        except OSError:
+            message.warning("could not create a backup directory for package '{0}'. Aborting...".format(new))
+            rmtree(staging)
+            _abandon(configuration, new, new_files)
+            raise InstallError(new)
+
+        extracting = time()
+        if not archive.extract(filepath, staging, new.format()):
+            message.warning("could not extract the archive provided for package '{0}'. Aborting...".format(new))
+            rmtree(staging)
+            rmtree(backup)
+            _abandon(configuration, new, new_files)
+            raise InstallError(new)
+        events.emit('extract', package=str(new), files=len(new_files), duration=time()-extracting)
+
+        for each in old.static():
+            try:
+                message.simple("Attempting to save '{0}' as '{1}'...".format(root+each, root+each+'.craft-old'))
+                link(root+each, root+each+'.craft-old')
+                preserved.append(root+each+'.craft-old')
+            except OSError:
+                message.simple("Could not preserve the following static file: '{0}'.".format(root+each))
+                message.simple("  '{0}' may exist already.".format(root+each+'.craft-old'))
+
+        # Parent directories must exist before anything is renamed into
+        # them, including those the archive does not list. Each file renamed
+        # over is kept as a hard link in the backup directory, and whatever
+        # is in the way of a path changing type is moved there whole, so
+        # that a failed swap may be rolled back.
+        directories = set()
+        for path, is_directory in new_entries:
+            path = ownership.normalise(path)
+            if not is_directory:
+                path = dirname(path)
+            while path and path not in directories:
+                directories.add(path)
+                path = dirname(path)
+        directories = sorted(directories, key=lambda path: path.count('/'))
+        owned = set([ownership.normalise(path) for path in old_files])
+        try:
+            for path in directories:
+                if isdir(root+path):
+                    continue
+                elif lexists(root+path):
+                    _displace(root, backup, path, owned, displaced)
+                mkdir(root+path)
+                created.append(path)
+                chmod(root+path, S_IMODE(lstat(staging+'/'+path).st_mode))
+            for path, is_directory in new_entries:
+                if not is_directory:
+                    if isdir(root+path) and not islink(root+path):
+                        _displace(root, backup, ownership.normalise(path), owned, displaced)
+                    backed_up = lexists(root+path)
+                    if backed_up:
+                        link(root+path, backup+'/'+str(len(swapped)))
+                    rename(staging+'/'+path, root+path)
+                    swapped.append((path, backed_up))
+        except OSError:
+            message.warning("could not move '{0}' into place while installing '{1}'. Aborting...".format(root+path, new))
+            rmtree(staging)
+            try:
+                _restore(root, backup, swapped, created, displaced, preserved)
+            except OSError:
+                message.warning("could not restore the files replaced by '{0}'.".format(new))
+                raise
+            _abandon(configuration, new, new_files)
+            raise InstallError(new)
+
+        rmtree(staging)
+
+        try:
+            integrity.record(configuration, new, new_files)
+        except IOError:
+            message.warning("could not record the digests of the files belonging to package '{0}'.".format(new))
+
+    try:
+        dumped = dump.package(new, new_directory+'/metadata.yml')
+    except IOError:
+        dumped = False
+    if not dumped:
+        message.warning("failed to write metadata.yml for package '{0}'. Aborting...".format(new))
+        if backup is not None:
+            try:
+                _restore(root, backup, swapped, created, displaced, preserved)
+            except OSError:
+                message.warning("could not restore the files replaced by '{0}'.".format(new))
+                raise
+        _abandon(configuration, new, new_files)
+        raise InstallError(new)
+
+    if backup is not None:
+        rmtree(backup)
+
+    # Only what the new package does not ship any longer is removed
+    shipped = set([ownership.normalise(path) for path in new_files])
+    shipped.update(displaced)
+    stale = [root+path for path in old_files if ownership.normalise(path) not in shipped]
+    entries, refused = removal.scan(stale)
+    removal.run(entries, configuration.workers())
+
+    entries, refused = removal.scan([old_directory+'/'+each for each in ('metadata.yml', 'files', 'digests', 'stat')])
+    removal.run(entries, 1)
+    for each in [old_directory, db+'installed/'+old.name+'/'+old.version, db+'installed/'+old.name]:
+        try:
+            rmdir(each)
+        except OSError:
+            break
+
+    with _lock:
+        index = ownership.Index(configuration)
+        index.remove(old, old_files)
+        index.close()
+        installed.remove(old)
+        installed.add(new)
+
+    events.emit('replace', package=str(new), replaced=str(old), duration=time()-started)
+    return True
+
+@timing.timed('replace')
+def _replace_all(configuration, installed, to_uninstall, to_install):
+    """ Performs a staged upgrade or downgrade. Each package to be installed
+    replaces the package to be uninstalled having the same name and
+    architecture, or one it explicitly replaces. Packages without a
+    counterpart are installed first, or uninstalled last, as usual.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        installed
+            Set having all currently installed units on the system.
+        to_uninstall
+            iterable having the installed Package units being replaced.
+        to_install
+            Plan, or iterable, having the Package units replacing them,
+            along with their archives already downloaded.
+    Raises
+        InstallError
+            if any package could not be installed or replaced.
+        UninstallError
+            if any package could not be uninstalled.
+    Returns
+        True
+            if all packages were successfully replaced.
+    """
+
+    if not isinstance(to_install, schedule.Plan):
+        to_install = schedule.Plan(to_install)
+
+    pairs = []
+    remaining = set(to_uninstall)
+    for package in to_install:
+        counterpart = None
+        for old in remaining:
+            if old.name == package.name and old.architecture == package.architecture:
+                counterpart = old
+                break
+        if counterpart is None:
+            for descriptor in package.descriptors('replaces'):
+                for old in remaining:
+                    if old.is_targeted_by(descriptor) or (old.name == descriptor.name and descriptor.architecture is None):
+                        counterpart = old
+                        break
+                if counterpart is not None:
+                    break
+        if counterpart is not None:
+            remaining.remove(counterpart)
+            pairs.append((counterpart, package))
+
+    replacing = set([package for old, package in pairs])
+    _install_all(configuration, installed, [package for package in to_install if package not in replacing])
+
+    try:
+        for old, package in pairs:
+            package.save_temporary_flags()
+            message.simple("Replacing '{0}' with '{1}'...".format(old, package))
+            _replace(configuration, installed, old, package, _archive(configuration, package))
+            message.simple("'{0}' was successfully installed...".format(package))
+    finally:
+        cache.flush(configuration)
+
+    for package in to_uninstall:
+        if package in remaining:
+            message.simple("Uninstalling '{0}'...".format(package))
+            _uninstall(configuration, installed, package, True)
+            message.simple("'{0}' was successfully uninstalled...".format(package))
+
+    message.flush()
+    return True
+
+@timing.timed('uninstall')
 def _uninstall(configuration, installed, package, keep_static):
     """ Performs a low-level package uninstallation.
 
@@ -237,6 +809,7 @@ def _uninstall(configuration, installed, package, keep_static):
             if the uninstallation was successfully completed.
     """
 
+    started = time()
     architecture = package.architecture
     name = package.name
     version = package.version
@@ -265,13 +838,15 @@ def _uninstall(configuration, installed, package, keep_static):
     craft_files = [
         db+'installed/'+name+'/'+version+'/'+architecture+'/metadata.yml',
         db+'installed/'+name+'/'+version+'/'+architecture+'/files',
+        db+'installed/'+name+'/'+version+'/'+architecture+'/digests',
+        db+'installed/'+name+'/'+version+'/'+architecture+'/stat',
         db+'installed/'+name+'/'+version+'/'+architecture
     ]
 
-    for each in package_files:
-        if not access(root+each, W_OK):
-            message.warning("cannot remove file '{0}' from package '{1}'.".format(root+each, package))
-            raise UninstallError(package)
+    entries, refused = removal.scan([root+each for each in package_files])
+    if refused:
+        message.warning("cannot remove file '{0}' from package '{1}'.".format(refused[0], package))
+        raise UninstallError(package)
 
     for each in craft_files:
         if isfile(each) or isdir(each):
@@ -279,6 +854,7 @@ def _uninstall(configuration, installed, package, keep_static):
                 message.warning("cannot remove file '{0}'.".format(each))
                 raise UninstallError(package)
 
+    preserved = set()
     if keep_static:
         for each in package.static():
             try:
@@ -288,15 +864,13 @@ def _uninstall(configuration, installed, package, keep_static):
                 message.simple("Could not preserve the following static file: '{0}'.".format(root+each))
                 message.simple("  '{0}' may exist already.".format(root+each+'.craft-old'))
                 pass
+            else:
+                preserved.add(ownership.normalise(each))
 
-    for each in package_files:
-        try:
-            if isdir(root+each):
-                rmdir(root+each)
-            elif isfile(root+each):
-                remove(root+each)
-        except OSError:
-            pass
+    if preserved:
+        entries = [entry for entry in entries if ownership.normalise(entry.path, root) not in preserved]
+
+    removal.run(entries, configuration.workers())
 
     for each in craft_files:
         try:
@@ -317,9 +891,17 @@ def _uninstall(configuration, installed, package, keep_static):
         except OSError:
             break
 
+    index = ownership.Index(configuration)
+    index.remove(package, package_files)
+    index.close()
+
     installed.remove(package)
+
+    events.emit('uninstall', package=str(package), files=len(package_files), duration=time()-started)
+    message.flush()
     return True
 
+@timing.timed('resolve')
 def install(configuration, installed, available, attempt_install):
     """ Returns a collection of units allowed to be installed.
     Resolves dependencies, handles conflicts and checks
@@ -345,13 +927,16 @@ def install(configuration, installed, available, attempt_install):
             is not able to be installed due to its CPU architecture
             being disabled.
     Returns
-        list
-            having all Package units to be installed.
+        Plan
+            having all Package units to be installed, dependencies first.
     """
 
+    started = time()
     already_targeted = Set()
     attempt_install = Set(attempt_install)
     to_install = Set()
+    events.emit('resolve.start', operation='install', targets=len(attempt_install))
+    closures = closure.load(configuration, available)
 
     # Remove all already installed units from the list
     for unit in list(attempt_install):
@@ -361,7 +946,12 @@ def install(configuration, installed, available, attempt_install):
 
     # Target units for installation
     for unit in list(attempt_install):
-        if isinstance(unit, Installable):
+        if isinstance(unit, Package):
+            try:
+                closure.target_for_installation(closures, unit, installed, available, attempt_install, already_targeted, to_install)
+            except BrokenDependency:
+                raise
+        elif isinstance(unit, Installable):
             try:
                 unit.target_for_installation(installed, available, attempt_install, already_targeted, to_install)
             except BrokenDependency:
@@ -384,8 +974,11 @@ def install(configuration, installed, available, attempt_install):
             except Conflict:
                 raise
 
-    return to_install
+    message.flush()
+    events.emit('resolve.end', operation='install', packages=len(to_install), duration=time()-started)
+    return schedule.Plan(to_install)
 
+@timing.timed('resolve')
 def uninstall(installed, attempt_uninstall):
     """ Returns a collection of units allowed to be uninstalled.
 
@@ -396,13 +989,15 @@ def uninstall(installed, attempt_uninstall):
             an iterable having all units the user is attempting
             to get uninstalled.
     Returns
-        list
-            having all Package units to be uninstalled.
+        Plan
+            having all Package units to be uninstalled, dependents first.
     """
 
+    started = time()
     already_targeted = Set()
     attempt_uninstall = Set(attempt_uninstall)
     to_uninstall = Set()
+    events.emit('resolve.start', operation='uninstall', targets=len(attempt_uninstall))
 
     # Ignore units which are not installed
     for unit in list(attempt_uninstall):
@@ -417,8 +1012,11 @@ def uninstall(installed, attempt_uninstall):
         else:
             message.simple("'{0}' is not uninstallable. Ignoring...".format(unit))
 
-    return to_uninstall
+    message.flush()
+    events.emit('resolve.end', operation='uninstall', packages=len(to_uninstall), duration=time()-started)
+    return schedule.Plan(to_uninstall, True)
 
+@timing.timed('resolve')
 def upgrade(configuration, installed, available, attempt_upgrade):
     """ Returns a collection of units for performing an upgrade.
 
@@ -443,16 +1041,18 @@ def upgrade(configuration, installed, available, attempt_upgrade):
             being disabled.
     Returns
         list
-            having the units that must be installed, and are replacing older
-            units, the units to be uninstalled, and are being replaced,
-            and the newly found dependencies.
+            having the Plan of units that must be installed, which replace
+            older units or are newly found dependencies, and the Plan of
+            units to be uninstalled, which are being replaced.
     """
 
+    started = time()
     already_targeted_for_installation = Set()
     already_targeted_for_upgrade = Set()
     attempt_upgrade = Set(attempt_upgrade)
     to_install = Set()
     to_uninstall = Set()
+    events.emit('resolve.start', operation='upgrade', targets=len(attempt_upgrade))
 
     # Ignore units which are not installed
     for unit in list(attempt_upgrade):
@@ -484,8 +1084,11 @@ def upgrade(configuration, installed, available, attempt_upgrade):
             except Conflict:
                 raise
 
-    return [to_install, to_uninstall]
+    message.flush()
+    events.emit('resolve.end', operation='upgrade', packages=len(to_install), replaced=len(to_uninstall), duration=time()-started)
+    return [schedule.Plan(to_install), schedule.Plan(to_uninstall, True)]
 
+@timing.timed('resolve')
 def downgrade(configuration, installed, available, attempt_downgrade):
     """ Returns a collection of units for performing an downgrade.
 
@@ -510,16 +1113,18 @@ def downgrade(configuration, installed, available, attempt_downgrade):
             being disabled.
     Returns
         list
-            having the units that must be installed, and are replacing older
-            units, the units to be uninstalled, and are being replaced,
-            and the newly found dependencies.
+            having the Plan of units that must be installed, which replace
+            older units or are newly found dependencies, and the Plan of
+            units to be uninstalled, which are being replaced.
     """
 
+    started = time()
     already_targeted_for_installation = Set()
     already_targeted_for_downgrade = Set()
     attempt_downgrade = Set(attempt_downgrade)
     to_install = Set()
     to_uninstall = Set()
+    events.emit('resolve.start', operation='downgrade', targets=len(attempt_downgrade))
 
     # Ignore units which are not installed
     for unit in list(attempt_downgrade):
@@ -551,8 +1156,11 @@ def downgrade(configuration, installed, available, attempt_downgrade):
             except Conflict:
                 raise
 
-    return [to_install, to_uninstall]
+    message.flush()
+    events.emit('resolve.end', operation='downgrade', packages=len(to_install), replaced=len(to_uninstall), duration=time()-started)
+    return [schedule.Plan(to_install), schedule.Plan(to_uninstall, True)]
 
+@timing.timed('download')
 def download(configuration, packages):
     """ Download packages.
 
@@ -575,10 +1183,53 @@ def download(configuration, packages):
     db = configuration.db()
     repositories = configuration.repositories()
     packages = list(packages)
+    requested = list(packages)
+    keys = set()
+    checksums = checksum.Cache(db+'checksums')
+
+    try:
+        mkdir(cache.directory(configuration))
+    except OSError:
+        pass
 
+    # Archives are shared by every package having the same checksum,
+    # regardless of their repository.
     for package in list(packages):
-        if isfile(db+'/available/'+package.repository+'/cache/'+package.name+'/'+package.version+'/'+package.architecture+'/package.tar.gz'):
+        for algorithm in package.checksums():
+            if not checksum.supported(algorithm):
+                message.warning("unsupported checksum '{0}' specified by package '{1}'.".format(algorithm, package))
+                raise DownloadError(package)
+
+        found = cache.key(package)
+        if not found or found in keys:
             packages.remove(package)
+            continue
+        keys.add(found)
+
+        cached = cache.path(configuration, package)
+        legacy = cache.legacy_path(configuration, package)
+        if isfile(cached):
+            cache.touch(configuration, cached)
+            packages.remove(package)
+        elif isfile(legacy) and checksum.verify(legacy, package.checksums(), checksums):
+            try:
+                cache.store(configuration, package, legacy, False)
+            except (IOError, OSError):
+                raise DownloadError(package)
+            packages.remove(package)
+
+    events.emit('download.plan', packages=len(packages), cached=len(keys)-len(packages))
+    downloaded = 0
+    downloaded_bytes = 0
+
+    # Plans only have a total size if every package specifies its own
+    total = 0
+    for package in packages:
+        if package.size() is None:
+            total = None
+            break
+        total = total+package.size()
+    tracker = progress.Progress('Downloading', len(packages), 'archives', total)
 
     for package in packages:
         try:
@@ -601,36 +1252,55 @@ def download(configuration, packages):
             pass
 
         for package in grouped_packages[repository_name]:
-            if package.has_checksum():
-                n = package.name
-                v = package.version
-                a = package.architecture
-
-                directories = [
-                    db+'/available',
-                    db+'/available/'+repository_name,
-                    db+'/available/'+repository_name+'/cache',
-                    db+'/available/'+repository_name+'/cache/'+n,
-                    db+'/available/'+repository_name+'/cache/'+n+'/'+v,
-                    db+'/available/'+repository_name+'/cache/'+n+'/'+v+'/'+a
-                ]
-
-                for directory in directories:
-                    try:
-                        mkdir(directory)
-                    except OSError:
-                        pass
+            n = package.name
+            v = package.version
+            a = package.architecture
 
+            try:
+                staging = mkdtemp(prefix='download-', dir=cache.directory(configuration))
+                chdir(staging)
+            except OSError:
+                raise DownloadError(package)
+
+            try:
+                handler = repository['handler']
+                name = archive.filename(package.format())
+                target = "{0}/{1}/{2}/{3}/{4}".format(repository['target'], n, v, a, name)
+                started = time()
+                events.emit('download.start', package=str(package), target=target)
+                watcher = progress.Watcher(tracker, staging+'/'+name)
+                watcher.start()
                 try:
-                    chdir(db+'/available/'+package.repository+'/cache/'+n+'/'+v+'/'+a)
+                    status = system(handler+' '+target)
+                finally:
+                    watcher.stop()
+                if status != 0:
+                    raise DownloadError(package)
+                elif not isfile(name):
+                    message.warning("inconsistent archive downloaded for package '{0}'.".format(package))
+                    raise DownloadError(package)
+                size = getsize(name)
+                events.emit('download.end', package=str(package), bytes=size, duration=time()-started)
+
+                verifying = time()
+                valid = checksum.verify(name, package.checksums(), checksums)
+                events.emit('verify', package=str(package), valid=valid, duration=time()-verifying)
+                if not valid:
+                    message.warning("inconsistent archive downloaded for package '{0}'.".format(package))
+                    raise DownloadError(package)
+
+                try:
+                    cache.store(configuration, package, staging+'/'+name)
                 except OSError:
                     raise DownloadError(package)
+            finally:
+                chdir(db)
+                rmtree(staging, True)
 
-                if not isfile('package.tar.gz'):
-                    handler = repository['handler']
-                    target = "{0}/{1}/{2}/{3}/package.tar.gz".format(repository['target'], n, v, a)
-                    if system(handler+' '+target) != 0:
-                        raise DownloadError(package)
+            downloaded = downloaded+1
+            downloaded_bytes = downloaded_bytes+size
+            tracker.advance(items=1)
+            events.emit('download.progress', packages=downloaded, total=len(packages), bytes=downloaded_bytes)
 
         try:
             environment.purge(repository['env'].keys())
@@ -639,6 +1309,10 @@ def download(configuration, packages):
         except KeyError:
             pass
 
+    tracker.finish()
+    cache.prune(configuration, None, requested)
+
+    message.flush()
     return True
 
 def clear(configuration, cache):
@@ -659,11 +1333,12 @@ def clear(configuration, cache):
     """
 
     if cache:
-        path = configuration.db()+'/available/*'
+        paths = glob(configuration.db()+'/available/*')
+        paths.extend(glob(configuration.db()+'cache'))
     else:
-        path = configuration.db()+'/available/*/*.yml'
+        paths = glob(configuration.db()+'/available/*/*.yml')
 
-    for each in glob(path):
+    for each in paths:
         try:
             if isdir(each):
                 rmtree(each)
@@ -672,6 +1347,8 @@ def clear(configuration, cache):
         except OSError:
             raise ClearError
 
+    closure.clear(configuration)
+
     return True
 
 def sync(configuration):
@@ -1,14 +1,183 @@
 """ Manage archives. """
 
 # Standard library imports
+from copy import copy
+from distutils.spawn import find_executable
+from errno import EEXIST
+from os import makedirs
+from os.path import dirname, join, normpath
+from subprocess import Popen, PIPE
+import tarfile
 from tarfile import open as archive_open
 
-def getfiles(filepath):
+# Craft imports
+import timing
+
+# Archive formats packages may be shipped in, along with the tarfile
+# compression each one of them is read with
+FORMATS = {
+    'tar.gz': 'gz',
+    'tar.xz': 'xz',
+    'tar.bz2': 'bz2',
+    'tar': ''
+}
+
+DEFAULT_FORMAT = 'tar.gz'
+
+# External decompressors, preferred over tarfile's own whenever available
+_decompressors = {
+    'tar.gz': (('unpigz', '-c'), ('pigz', '-dc')),
+    'tar.xz': (('xz', '-dc'),)
+}
+
+def filename(format):
+    """ Retrieves the file name of a package's archive.
+
+    Parameters
+        format
+            one of FORMATS.
+    Returns
+        string
+            the archive's file name.
+    """
+
+    return 'package.'+format
+
+def _decompressor(format):
+    """ Finds an external decompressor for a format.
+
+    Parameters
+        format
+            one of FORMATS.
+    Returns
+        list
+            having the decompressor's command line, lacking the archive.
+        None
+            if no decompressor is available.
+    """
+
+    for command in _decompressors.get(format, ()):
+        found = find_executable(command[0])
+        if found:
+            return [found]+list(command[1:])
+
+    return None
+
+class _Archive(object):
+    """ Readable archive, decompressed either by tarfile or by an external
+    decompressor piping its output to tarfile. Members are read in order,
+    so that streamed archives never need to be seeked. """
+
+    def __init__(self, filepath, format):
+        """ Constructor.
+
+        Parameters
+            filepath
+                the archive.
+            format
+                one of FORMATS, or None for tarfile to detect
+                the archive's compression by itself.
+        Raises
+            IOError
+                if the archive could not be opened.
+        """
+
+        self.process = None
+        command = None
+        if format is not None:
+            command = _decompressor(format)
+
+        if command is not None:
+            try:
+                self.process = Popen(command+[filepath], stdout=PIPE)
+            except OSError as e:
+                raise IOError(e.errno, e.strerror, filepath)
+            try:
+                self.handle = archive_open(fileobj=self.process.stdout, mode='r|')
+            except tarfile.TarError:
+                self.close()
+                raise IOError("could not read archive '{0}'".format(filepath))
+        elif format is None:
+            self.handle = archive_open(filepath)
+        else:
+            try:
+                self.handle = archive_open(filepath, 'r:'+FORMATS[format])
+            except tarfile.CompressionError:
+                raise IOError("unsupported archive format '{0}'".format(format))
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    def extract(self, member, destination, parents=None):
+        """ Extracts a member, creating the directories it is extracted
+        into first. Archives being extracted to the same destination at
+        the same time may create them too, which tarfile does not expect.
+
+        Parameters
+            member
+                the TarInfo member to be extracted.
+            destination
+                filesystem destination for the member to be extracted to.
+            parents
+                optional set of the directories already created,
+                updated with the ones created for the member.
+        """
+
+        parent = dirname(normpath(join(destination, member.name)))
+        if parents is None or parent not in parents:
+            try:
+                makedirs(parent)
+            except OSError as error:
+                if error.errno != EEXIST:
+                    raise
+            if parents is not None:
+                parents.add(parent)
+
+        self.handle.extract(member, destination)
+
+    def restore(self, member, destination):
+        """ Applies a directory member's ownership, times and permissions
+        to the directory it was extracted to. """
+
+        path = normpath(join(destination, member.name))
+        try:
+            self.handle.chown(member, path)
+            self.handle.utime(member, path)
+            self.handle.chmod(member, path)
+        except tarfile.ExtractError:
+            pass
+
+    def close(self):
+        """ Closes the archive.
+
+        Returns
+            True
+                if the archive was entirely and successfully decompressed.
+            False
+                otherwise.
+        """
+
+        try:
+            self.handle.close()
+        except AttributeError:
+            pass
+
+        if self.process is not None:
+            self.process.stdout.read()
+            self.process.stdout.close()
+            return self.process.wait() == 0
+
+        return True
+
+def getfiles(filepath, format=None):
     """ Retrieve all files from an archive as a list.
 
     Parameters
         filepath
             archive for the files list to be retrieved from.
+        format
+            the archive's format, one of FORMATS. Detected by tarfile if
+            not specified.
     Returns
         list
             having the archive's files' names.
@@ -16,24 +185,56 @@ def getfiles(filepath):
             if an IOError occurred during any of the operations.
     """
 
+    entries = getentries(filepath, format)
+    if not entries:
+        return False
+
+    return [name for name, is_directory in entries]
+
+def getentries(filepath, format=None):
+    """ Retrieve all entries from an archive as a list, along with
+    whether each one of them is a directory.
+
+    Parameters
+        filepath
+            archive for the entries list to be retrieved from.
+        format
+            the archive's format, one of FORMATS. Detected by tarfile if
+            not specified.
+    Returns
+        list
+            having a (name, is_directory) tuple for each entry.
+        False
+            if an IOError occurred during any of the operations.
+    """
+
     try:
-        handle = archive_open(filepath)
-    except IOError:
+        handle = _Archive(filepath, format)
+        entries = [(member.name, member.isdir()) for member in handle]
+    except (IOError, tarfile.TarError):
+        return False
+
+    if not handle.close():
         return False
-    else:
-        files = handle.getnames()
-        handle.close()
 
-    return reversed(files)
+    entries.reverse()
+    return entries
 
-def extract(filepath, destination):
+@timing.timed('extract')
+def extract(filepath, destination, format=None, callback=None):
     """ Extract an archive to a specific destination.
 
     Parameters
         filepath
             archive for the files to be extracted from.
         destination
-            filesystem destination for the archive to be extracted to. 
+            filesystem destination for the archive to be extracted to.
+        format
+            the archive's format, one of FORMATS. Detected by tarfile if
+            not specified.
+        callback
+            optional callable called with each member once extracted,
+            such as for reporting progress.
     Returns
         True
             if the archive was successfully extracted.
@@ -42,11 +243,32 @@ def extract(filepath, destination):
     """
 
     try:
-        handle = archive_open(filepath)
-    except IOError:
+        handle = _Archive(filepath, format)
+    except (IOError, tarfile.TarError):
         return False
-    else:
-        handle.extractall(destination)
+
+    # Directories' permissions and times are only applied once their
+    # contents are extracted, the same way tarfile.extractall() does.
+    directories = []
+    parents = set()
+    try:
+        for member in handle:
+            if member.isdir():
+                directories.append(member)
+                member = copy(member)
+                member.mode = 0o700
+            handle.extract(member, destination, parents)
+            if callback is not None:
+                callback(member)
+    except (IOError, OSError, tarfile.TarError):
         handle.close()
+        return False
+
+    if not handle.close():
+        return False
+
+    directories.sort(key=lambda member: member.name, reverse=True)
+    for member in directories:
+        handle.restore(member, destination)
 
     return True
@@ -0,0 +1,322 @@
+""" Content-addressed cache of package archives. """
+
+# Standard library imports
+from glob import glob
+import marshal
+import re
+from os import lstat, remove, rename, link
+from os.path import basename, isfile
+from shutil import copyfile
+from threading import Lock
+from time import time
+
+# Craft imports
+import archive
+import checksum
+
+# Archives are keyed by the first of these checksums a package specifies
+_algorithms = checksum.algorithms
+
+# Digests end up in file names, so nothing else may be taken for one
+_digest_pattern = re.compile('[0-9a-f]+\Z')
+
+# Guards the access times against concurrent installations
+_lock = Lock()
+
+# Accesses recorded since the index was last written, by cache directory
+_accessed = {}
+
+def key(package):
+    """ Retrieves the cache key of a package's archive.
+
+    Parameters
+        package
+            the Package unit whose archive is to be cached.
+    Returns
+        string
+            the archive's key, made of a checksum algorithm and digest.
+        False
+            if the package specifies no usable checksum. Digests
+            which are not hexadecimal are not usable.
+    """
+
+    for algorithm in _algorithms:
+        digest = package.has_checksum(algorithm)
+        if digest and _digest_pattern.match(digest.lower()):
+            return algorithm+'-'+digest.lower()
+
+    return False
+
+def directory(configuration):
+    """ Retrieves the cache's directory. """
+
+    return configuration.db()+'cache/'
+
+def path(configuration, package):
+    """ Retrieves the path a package's archive is cached at,
+    whether it has been cached already or not.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose archive is to be found.
+    Returns
+        string
+            absolute filesystem path of the cached archive.
+        False
+            if the package specifies no usable checksum.
+    """
+
+    found = key(package)
+    if not found:
+        return False
+
+    return directory(configuration)+found+'.'+package.format()
+
+def legacy_path(configuration, package):
+    """ Retrieves the path a package's archive used to be cached at,
+    under its repository. Local cached repositories still ship
+    their archives there. """
+
+    return configuration.db()+'available/'+package.repository+'/cache/'+package.name+'/'+package.version+'/'+package.architecture+'/'+archive.filename(package.format())
+
+def _load_accesses(configuration):
+    """ Reads the last access time of every cached archive.
+
+    Returns
+        dict
+            mapping each archive's key to its last access time.
+    """
+
+    try:
+        handle = open(directory(configuration)+'accesses', 'rb')
+    except IOError:
+        return {}
+
+    try:
+        return marshal.load(handle)
+    except (EOFError, ValueError, TypeError):
+        return {}
+    finally:
+        handle.close()
+
+def _save_accesses(configuration, accesses):
+    """ Writes the last access time of every cached archive. The index is
+    only a hint for eviction, so failing to write it is not an error. """
+
+    try:
+        handle = open(directory(configuration)+'accesses.partial', 'wb')
+        marshal.dump(accesses, handle)
+        handle.close()
+        rename(directory(configuration)+'accesses.partial', directory(configuration)+'accesses')
+    except (IOError, OSError):
+        pass
+
+def touch(configuration, filepath):
+    """ Records an access to a cached archive. Access times are kept in
+    the cache's own index rather than on the archives, as filesystems
+    mounted with noatime or relatime would not record them reliably, and
+    changing an archive's timestamps would invalidate its cached checksum.
+    Accesses are kept in memory until flush() writes them to the index,
+    once per operation.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        filepath
+            absolute filesystem path of the cached archive.
+    """
+
+    with _lock:
+        try:
+            _accessed[directory(configuration)][basename(filepath)] = time()
+        except KeyError:
+            _accessed[directory(configuration)] = {basename(filepath): time()}
+
+def flush(configuration):
+    """ Writes the accesses recorded by touch() to the cache's index.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+    """
+
+    with _lock:
+        accessed = _accessed.pop(directory(configuration), None)
+        if accessed:
+            accesses = _load_accesses(configuration)
+            accesses.update(accessed)
+            _save_accesses(configuration, accesses)
+
+def store(configuration, package, filepath, move=True):
+    """ Adds an archive to the cache.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit the archive belongs to.
+        filepath
+            absolute filesystem path of the archive. It must already have
+            been verified against the package's checksum.
+        move
+            specifies whether the archive may be moved into the cache.
+            Otherwise, it is hard linked, or copied if that fails.
+    Raises
+        OSError
+            if the archive could not be added to the cache.
+        IOError
+            if the archive could not be copied to the cache.
+    Returns
+        string
+            absolute filesystem path of the cached archive.
+    """
+
+    cached = path(configuration, package)
+
+    if move:
+        rename(filepath, cached)
+    else:
+        try:
+            link(filepath, cached)
+        except OSError:
+            copyfile(filepath, cached+'.partial')
+            rename(cached+'.partial', cached)
+
+    touch(configuration, cached)
+    return cached
+
+def resolve(configuration, package):
+    """ Retrieves a package's cached archive, and records the access.
+    Archives still found under their repository are used as well,
+    whenever they are not cached yet.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose archive is to be found.
+    Returns
+        string
+            absolute filesystem path of the archive.
+        False
+            if the archive is not cached.
+    """
+
+    cached = path(configuration, package)
+    if cached and isfile(cached):
+        touch(configuration, cached)
+        return cached
+
+    legacy = legacy_path(configuration, package)
+    if isfile(legacy):
+        return legacy
+
+    return False
+
+def _entries(configuration):
+    """ Lists the cached archives.
+
+    Returns
+        list
+            having a (last access time, size, path) tuple for each
+            cached archive, least recently used first.
+    """
+
+    with _lock:
+        accesses = _load_accesses(configuration)
+        accesses.update(_accessed.get(directory(configuration), {}))
+    entries = []
+    filepaths = []
+    for algorithm in _algorithms:
+        filepaths.extend(glob(directory(configuration)+algorithm+'-*'))
+
+    for filepath in filepaths:
+        if filepath.endswith('.partial'):
+            continue
+        try:
+            status = lstat(filepath)
+        except OSError:
+            continue
+        entries.append((accesses.get(basename(filepath), status.st_mtime), status.st_size, filepath))
+    entries.sort()
+
+    return entries
+
+def stats(configuration):
+    """ Summarises the cache's contents.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+    Returns
+        tuple
+            having the number of cached archives, their total size in
+            bytes and the cache's size limit in bytes, or None if the
+            cache is not limited.
+    """
+
+    entries = _entries(configuration)
+    return len(entries), sum([size for atime, size, filepath in entries]), configuration.cache_size()
+
+def prune(configuration, limit=None, keep=()):
+    """ Evicts the least recently used archives until the cache
+    fits within a size limit. The recorded accesses are written to
+    the index beforehand, whether any archive is evicted or not.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        limit
+            size limit in bytes. Defaults to the configured limit.
+            The cache is left untouched if neither is set.
+        keep
+            iterable having the Package units whose archives
+            must not be evicted.
+    Returns
+        tuple
+            having the number of evicted archives and the number
+            of bytes freed.
+    """
+
+    flush(configuration)
+
+    if limit is None:
+        limit = configuration.cache_size()
+        if limit is None:
+            return 0, 0
+
+    kept = set()
+    for package in keep:
+        found = path(configuration, package)
+        if found:
+            kept.add(found)
+
+    entries = _entries(configuration)
+    total = sum([size for atime, size, filepath in entries])
+    evicted = 0
+    freed = 0
+
+    for atime, size, filepath in entries:
+        if total <= limit:
+            break
+        elif filepath in kept:
+            continue
+        try:
+            remove(filepath)
+        except OSError:
+            continue
+        total = total-size
+        evicted = evicted+1
+        freed = freed+size
+
+    if evicted:
+        with _lock:
+            accesses = _load_accesses(configuration)
+            for key in accesses.keys():
+                if not isfile(directory(configuration)+key):
+                    del accesses[key]
+            _save_accesses(configuration, accesses)
+
+    return evicted, freed
@@ -2,39 +2,312 @@
 
 # Standard library imports
 import hashlib
+import io
+from os import fstat, stat
+from Queue import Queue
+from threading import Lock, Thread
 
-def sha1(filepath, expected):
-    """ Calculates and verifies the SHA-1 checksum of a file's
-    contents.
+try:
+    import anydbm as dbm
+except ImportError:
+    import dbm
+
+# Craft imports
+import timing
+
+# Checksums packages may be verified against; BLAKE2 is only available
+# from Python 3.6 onwards
+algorithms = ('sha1', 'sha256', 'sha512')
+if hasattr(hashlib, 'blake2b'):
+    algorithms += ('blake2b',)
+
+# Files are read in blocks of this size into a single, reused buffer
+_blocksize = 1024*1024
+
+# Files at least this large are hashed by one thread per algorithm
+_parallel_threshold = 64*1024*1024
+
+# Blocks handed to the hashing threads are this large, and at most this
+# many are queued for each thread
+_parallel_blocksize = 8*1024*1024
+_parallel_queued = 2
+
+# The cache is cleared whenever it grows past this number of files
+_cache_limit = 4096
+
+# Guards the cache's file against concurrent installations
+_lock = Lock()
+
+def supported(algorithm):
+    """ Checks whether a checksum algorithm is supported.
+
+    Parameters
+        algorithm
+            name of the algorithm, as found in a package's checksums.
+    Returns
+        True
+            if files may be verified against such checksum.
+        False
+            otherwise.
+    """
+
+    if algorithm not in algorithms:
+        return False
+
+    try:
+        hashlib.new(algorithm)
+    except ValueError:
+        return False
+
+    return True
+
+def _consume(hasher, blocks):
+    """ Feeds queued blocks to a hasher until None is dequeued. Runs on its
+    own thread, as hashlib releases the GIL while hashing large blocks. """
+
+    block = blocks.get()
+    while block is not None:
+        hasher.update(block)
+        block = blocks.get()
+
+def _parallel(handle, hashers):
+    """ Reads a file once, in large blocks, and feeds every block to each
+    hasher on its own thread. """
+
+    queues = []
+    threads = []
+    for hasher in hashers:
+        blocks = Queue(_parallel_queued)
+        thread = Thread(target=_consume, args=(hasher, blocks))
+        thread.daemon = True
+        thread.start()
+        queues.append(blocks)
+        threads.append(thread)
+
+    try:
+        block = handle.read(_parallel_blocksize)
+        while block:
+            for blocks in queues:
+                blocks.put(block)
+            block = handle.read(_parallel_blocksize)
+    finally:
+        for blocks in queues:
+            blocks.put(None)
+        for thread in threads:
+            thread.join()
+
+@timing.timed('hash')
+def digests(filepath, names):
+    """ Calculates several digests of a file's contents in a single pass.
+    For large files, each algorithm is run on its own thread.
 
     Parameters
         filepath
             file to be read.
-        expected
-            the expected SHA-1 checksum.
+        names
+            iterable having the names of the hashlib algorithms to be used.
     Raises
         IOError
             if the file could not be read.
+        ValueError
+            if an algorithm is not supported.
     Returns
-        string
-            the file's SHA-1 checksum.
+        dict
+            mapping each algorithm to the file's hexadecimal digest.
     """
 
-    hasher = hashlib.sha1()
-    blocksize = 65536
+    hashers = {}
+    for name in names:
+        hashers[name] = hashlib.new(name)
 
+    handle = io.open(filepath, 'rb', buffering=0)
     try:
-        handle = open(filepath, 'rb')
-    except IOError:
-        raise
-    else:
-        buf = handle.read(blocksize)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = handle.read(blocksize)
+        if len(hashers) > 1 and fstat(handle.fileno()).st_size >= _parallel_threshold:
+            _parallel(handle, hashers.values())
+        else:
+            buf = bytearray(_blocksize)
+            view = memoryview(buf)
+            size = handle.readinto(buf)
+            while size:
+                for hasher in hashers.itervalues():
+                    hasher.update(view[:size])
+                size = handle.readinto(buf)
+    finally:
         handle.close()
 
-    if hasher.hexdigest() == expected:
-        return True
-    else:
+    values = {}
+    for name in hashers:
+        values[name] = hashers[name].hexdigest()
+
+    return values
+
+def digest(filepath, algorithm='sha1'):
+    """ Calculates the digest of a file's contents.
+
+    Parameters
+        filepath
+            file to be read.
+        algorithm
+            name of the hashlib algorithm to be used.
+    Raises
+        IOError
+            if the file could not be read.
+    Returns
+        string
+            the file's hexadecimal digest.
+    """
+
+    return digests(filepath, (algorithm,))[algorithm]
+
+def _identity(status):
+    """ Identifies a version of a file by its device, inode, size and
+    modification time, which change whenever it is replaced or written. """
+
+    try:
+        mtime = status.st_mtime_ns
+    except AttributeError:
+        mtime = repr(status.st_mtime)
+
+    return '{0}:{1}:{2}:{3}'.format(status.st_dev, status.st_ino, status.st_size, mtime)
+
+class Cache(object):
+    """ Persistent cache of the digests already calculated for files,
+    so that unchanged files are not read again. """
+
+    def __init__(self, filepath):
+        """ Constructor.
+
+        Parameters
+            filepath
+                the cache's database file.
+        """
+
+        self.filepath = filepath
+
+    def lookup(self, status, names):
+        """ Retrieves a file's cached digests.
+
+        Parameters
+            status
+                the file's stat() result.
+            names
+                iterable having the names of the digests' algorithms.
+        Returns
+            dict
+                mapping each algorithm whose digest is cached to the digest.
+        """
+
+        values = {}
+        with _lock:
+            try:
+                handle = dbm.open(self.filepath, 'c')
+            except dbm.error:
+                return values
+            try:
+                for name in names:
+                    try:
+                        values[name] = handle[name+' '+_identity(status)]
+                    except KeyError:
+                        pass
+            finally:
+                handle.close()
+
+        return values
+
+    def record(self, status, values):
+        """ Caches a file's digests.
+
+        Parameters
+            status
+                the file's stat() result, taken before calculating the digests.
+            values
+                dict mapping algorithms to the file's digests.
+        """
+
+        with _lock:
+            try:
+                handle = dbm.open(self.filepath, 'c')
+            except dbm.error:
+                return
+            try:
+                if len(handle) >= _cache_limit:
+                    for key in handle.keys():
+                        del handle[key]
+                for name in values:
+                    handle[name+' '+_identity(status)] = values[name]
+            finally:
+                handle.close()
+
+@timing.timed('verify')
+def verify(filepath, expected, cache=None):
+    """ Verifies every checksum of a file's contents, reading it only once.
+
+    Parameters
+        filepath
+            file to be read.
+        expected
+            dict mapping algorithms to the expected checksums.
+        cache
+            optional Cache having the checksums already calculated. Files
+            which have not changed since their checksums were cached are
+            not read again.
+    Raises
+        IOError
+            if the file could not be read.
+    Returns
+        True
+            if every checksum matches, and at least one was given.
+        False
+            otherwise, including when any algorithm is not supported.
+    """
+
+    if not expected:
         return False
+
+    for name in expected:
+        if not supported(name):
+            return False
+
+    values = {}
+    if cache is not None:
+        try:
+            status = stat(filepath)
+        except OSError as e:
+            raise IOError(e.errno, e.strerror, filepath)
+        values = cache.lookup(status, expected.iterkeys())
+
+    missing = [name for name in expected if name not in values]
+    if missing:
+        calculated = digests(filepath, missing)
+        if cache is not None:
+            cache.record(status, calculated)
+        values.update(calculated)
+
+    for name in expected:
+        if values[name] != expected[name].lower():
+            return False
+
+    return True
+
+def sha1(filepath, expected, cache=None):
+    """ Calculates and verifies the SHA-1 checksum of a file's
+    contents. See verify().
+
+    Parameters
+        filepath
+            file to be read.
+        expected
+            the expected SHA-1 checksum.
+        cache
+            optional Cache having the checksums already calculated.
+    Raises
+        IOError
+            if the file could not be read.
+    Returns
+        True
+            if the file's checksum is the expected one.
+        False
+            otherwise.
+    """
+
+    return verify(filepath, {'sha1': expected}, cache)
@@ -0,0 +1,468 @@
+""" Precomputed transitive dependency closures. """
+
+# Standard library imports
+from array import array
+from glob import glob
+from marshal import dump as marshal_dump, load as marshal_load
+from os import stat, remove
+
+# Craft imports
+from elements import BrokenDependency, Package, Set
+import dsl.relationship
+import timing
+
+class Closures(object):
+    """ Transitive dependency closures of every package in the 'available'
+    Set, stored as integer-ID adjacency lists.
+
+    Packages are identified by their position in the keys list. Packages
+    belonging to the same dependency cycle share a single component, and
+    each component only refers to the components it directly depends on,
+    so every sub-closure is stored exactly once.
+    """
+
+    def __init__(self, signature, keys, component, members, children, unresolved):
+        """ Constructor.
+
+        Parameters
+            signature
+                describes the metadata files the closures were computed from.
+            keys
+                list of (name, architecture, version) tuples, one per package.
+            component
+                array mapping each package ID to its component ID.
+            members
+                pair of arrays (offsets, values) mapping each component ID
+                to the IDs of its packages.
+            children
+                pair of arrays (offsets, values) mapping each component ID
+                to the IDs of the components it directly depends on.
+            unresolved
+                array flagging the packages having dependencies that can
+                only be resolved at runtime, such as virtual packages,
+                groups or broken dependencies.
+        """
+
+        self.signature = signature
+        self.keys = keys
+        self.component = component
+        self.members = members
+        self.children = children
+        self.unresolved = unresolved
+        self.ids = {}
+        self.units = {}
+
+    def bind(self, available):
+        """ Maps the package IDs to the Package units of a Set.
+
+        Parameters
+            available
+                the 'available' Set the closures were computed from.
+        """
+
+        ids = {}
+        for position in range(0, len(self.keys)):
+            ids[self.keys[position]] = position
+
+        self.units = {}
+        for package in available.packages():
+            try:
+                self.units[ids[(package.name, package.architecture, package.version)]] = package
+            except KeyError:
+                pass
+
+        self.ids = ids
+
+    def closure(self, package, installed=None, targeted=None):
+        """ Retrieves a package's transitive dependency closure, leaving
+        out the packages already installed or targeted along with the
+        dependencies only reachable through them.
+
+        Parameters
+            package
+                the Package unit whose closure is to be retrieved.
+            installed
+                optional Set having the installed units.
+            targeted
+                optional Set having the units already targeted, whose
+                dependencies have been targeted along with them.
+        Returns
+            tuple
+                having the closure's Package units, including the package
+                itself, and the Package units whose dependencies must be
+                resolved at runtime.
+            False
+                if the package is not known to the closures, or if what
+                remains of its closure may not be told from the closures
+                alone. That is the case whenever a dependency cycle is
+                only partly installed, or whenever another version of a
+                dependency is installed or targeted.
+        """
+
+        if installed is None:
+            installed = Set()
+        if targeted is None:
+            targeted = Set()
+
+        try:
+            start = self.component[self.ids[(package.name, package.architecture, package.version)]]
+        except KeyError:
+            return False
+
+        member_offsets, member_values = self.members
+        child_offsets, child_values = self.children
+        visited = set([start])
+        pending = [start]
+        units = []
+        unresolved = []
+
+        while pending:
+            current = pending.pop()
+            members = []
+            for position in range(member_offsets[current], member_offsets[current+1]):
+                try:
+                    members.append((self.units[member_values[position]], member_values[position]))
+                except KeyError:
+                    # The closures no longer match the Set they are bound to
+                    return False
+
+            # Targeted packages had their dependencies targeted with them,
+            # and those of installed packages are installed already
+            states = [_state(targeted, unit) for unit, identifier in members]
+            if True in states:
+                continue
+            elif False in states:
+                return False
+            states = [_state(installed, unit) for unit, identifier in members]
+            if False in states:
+                return False
+            done = states.count(True)
+            if done == len(members):
+                continue
+            elif done:
+                return False
+
+            for unit, identifier in members:
+                units.append(unit)
+                if self.unresolved[identifier]:
+                    unresolved.append(unit)
+
+            for position in range(child_offsets[current], child_offsets[current+1]):
+                child = child_values[position]
+                if child not in visited:
+                    visited.add(child)
+                    pending.append(child)
+
+        return units, unresolved
+
+def _state(units, package):
+    """ Tells whether a Set has a package, another version of it, or neither.
+
+    Parameters
+        units
+            the Set to be looked into.
+        package
+            the Package unit to be looked for.
+    Returns
+        True
+            if the Set has the package itself.
+        False
+            if the Set only has other versions of the package.
+        None
+            if the Set has no version of the package.
+    """
+
+    found = units.target(dsl.relationship.Descriptor(package.name, package.architecture, None, package.as_target()))
+    if not found:
+        return None
+    elif found.version == package.version:
+        return True
+    elif units.target(dsl.relationship.Descriptor(package.name, package.architecture, package.version, package.as_target())):
+        return True
+    return False
+
+def _signature(configuration):
+    """ Describes the repositories' metadata files and the settings deciding
+    which packages are available, so stale closures may be detected.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+    Returns
+        list
+            having the enabled architectures and repositories, followed
+            by the path, size and modification time of every file.
+    """
+
+    signature = [
+        tuple(sorted(configuration.architectures() or ())),
+        tuple(sorted(configuration.repositories() or ()))
+    ]
+    for path in sorted(glob(configuration.db()+'available/*/*.yml')):
+        try:
+            status = stat(path)
+        except OSError:
+            continue
+        signature.append((path, status.st_size, status.st_mtime))
+
+    return signature
+
+def components(count, offsets, values):
+    """ Finds the strongly connected components of a graph, using an
+    iterative version of Tarjan's algorithm. Runs in linear time.
+
+    Parameters
+        count
+            the number of vertices.
+        offsets
+            array having the position of each vertex's first edge in values.
+        values
+            array having the target vertex of every edge. Negative targets
+            are ignored.
+    Returns
+        tuple
+            having an array mapping each vertex to its component, and
+            the number of components. Components are numbered in reverse
+            topological order, dependencies coming first.
+    """
+
+    index = array('i', [-1]) * count
+    lowlink = array('i', [0]) * count
+    component = array('i', [-1]) * count
+    stack = []
+    counter = 0
+    found = 0
+
+    for root in range(0, count):
+        if index[root] != -1:
+            continue
+
+        index[root] = lowlink[root] = counter
+        counter = counter+1
+        stack.append(root)
+        work = [(root, offsets[root])]
+
+        while work:
+            vertex, position = work[-1]
+            if position < offsets[vertex+1]:
+                work[-1] = (vertex, position+1)
+                target = values[position]
+                if target < 0:
+                    continue
+                elif index[target] == -1:
+                    index[target] = lowlink[target] = counter
+                    counter = counter+1
+                    stack.append(target)
+                    work.append((target, offsets[target]))
+                elif component[target] == -1 and index[target] < lowlink[vertex]:
+                    lowlink[vertex] = index[target]
+            else:
+                work.pop()
+                if work and lowlink[vertex] < lowlink[work[-1][0]]:
+                    lowlink[work[-1][0]] = lowlink[vertex]
+                if lowlink[vertex] == index[vertex]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = found
+                        if member == vertex:
+                            break
+                    found = found+1
+
+    return component, found
+
+def build(configuration, available):
+    """ Computes the transitive dependency closures of all packages
+    in a Set.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        available
+            the 'available' Set.
+    Returns
+        Closures
+    """
+
+    packages = sorted(available.packages(), key=lambda package: (package.name, package.architecture, package.version))
+    keys = [(package.name, package.architecture, package.version) for package in packages]
+    ids = {}
+    for position in range(0, len(packages)):
+        ids[keys[position]] = position
+
+    offsets = array('i', [0])
+    values = array('i')
+    unresolved = array('b')
+    resolved = {}
+    for package in packages:
+        is_open = 0
+        for descriptor in package.descriptors('depends'):
+            try:
+                target = resolved[descriptor]
+            except KeyError:
+                target = resolved[descriptor] = available.target(descriptor)
+            if isinstance(target, Package):
+                values.append(ids[(target.name, target.architecture, target.version)])
+            else:
+                is_open = 1
+        offsets.append(len(values))
+        unresolved.append(is_open)
+
+    component, count = components(len(packages), offsets, values)
+
+    grouped = [[] for each in range(0, count)]
+    for position in range(0, len(packages)):
+        grouped[component[position]].append(position)
+
+    member_offsets = array('i', [0])
+    member_values = array('i')
+    child_offsets = array('i', [0])
+    child_values = array('i')
+
+    for current in range(0, count):
+        children = set()
+        for position in grouped[current]:
+            member_values.append(position)
+            for edge in range(offsets[position], offsets[position+1]):
+                child = component[values[edge]]
+                if child != current:
+                    children.add(child)
+        member_offsets.append(len(member_values))
+        child_values.extend(sorted(children))
+        child_offsets.append(len(child_values))
+
+    closures = Closures(_signature(configuration), keys, component, (member_offsets, member_values), (child_offsets, child_values), unresolved)
+    closures.bind(available)
+    return closures
+
+def _arrays(*arrays):
+    """ Converts arrays to and from their serialised form. """
+
+    converted = []
+    for each in arrays:
+        if isinstance(each, array):
+            converted.append((each.typecode, each.tostring()))
+        else:
+            restored = array(each[0])
+            restored.fromstring(each[1])
+            converted.append(restored)
+    return converted
+
+@timing.timed('closures')
+def load(configuration, available):
+    """ Loads the persisted closures, computing and persisting them
+    again if the repositories have been synchronised since.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        available
+            the 'available' Set.
+    Returns
+        Closures
+    """
+
+    filepath = configuration.db()+'available/closures'
+    signature = _signature(configuration)
+
+    try:
+        handle = open(filepath, 'rb')
+    except IOError:
+        pass
+    else:
+        try:
+            data = marshal_load(handle)
+            if data[0] == signature:
+                component, member_offsets, member_values, child_offsets, child_values, unresolved = _arrays(*data[2:])
+                closures = Closures(signature, data[1], component, (member_offsets, member_values), (child_offsets, child_values), unresolved)
+                closures.bind(available)
+                return closures
+        except (EOFError, ValueError, TypeError, IndexError):
+            pass
+        finally:
+            handle.close()
+
+    closures = build(configuration, available)
+
+    try:
+        handle = open(filepath, 'wb')
+    except IOError:
+        pass
+    else:
+        data = [closures.signature, closures.keys]
+        data.extend(_arrays(closures.component, closures.members[0], closures.members[1], closures.children[0], closures.children[1], closures.unresolved))
+        marshal_dump(tuple(data), handle)
+        handle.close()
+
+    return closures
+
+def clear(configuration):
+    """ Removes the persisted closures.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+    """
+
+    try:
+        remove(configuration.db()+'available/closures')
+    except OSError:
+        pass
+
+def target_for_installation(closures, package, installed, available, attempt_install, already_targeted, to_install):
+    """ Targets a package and its dependencies for installation using
+    its precomputed closure, less what is already installed or targeted.
+    Mirrors Package.target_for_installation(), falling back to it whenever
+    the closure alone cannot be trusted.
+
+    Parameters
+        closures
+            Closures computed from the 'available' Set.
+        package
+            the Package unit to be targeted.
+        installed
+            Set having all currently installed units on the system.
+        available
+            Set having all currently available units on the system.
+        attempt_install
+            a Set having all units targeted by the user for installation.
+        already_targeted
+            Set having all units that were already targeted for
+            installation.
+        to_install
+            Set having all other units that are already
+            targeted for installation.
+    Raises
+        BrokenDependency
+            if a dependency could not be satisfied.
+    """
+
+    if package in installed or package in already_targeted:
+        return
+
+    found = closures.closure(package, installed, already_targeted)
+    if not found:
+        package.target_for_installation(installed, available, attempt_install, already_targeted, to_install)
+        return
+
+    units, unresolved = found
+
+    for unit in units:
+        unit.flag_for_installation(attempt_install)
+        to_install.add(unit)
+        already_targeted.add(unit)
+
+    # Virtual packages and groups depend on the user's choices, and
+    # dependencies broken when the closures were computed may have
+    # become available since
+    closed = set([(unit.name, unit.architecture, unit.version) for unit in units])
+    for unit in unresolved:
+        for dependency in unit.descriptors('depends'):
+            target = available.target(dependency)
+            if isinstance(target, Package) and (target.name, target.architecture, target.version) in closed:
+                continue
+            if not already_targeted.target(dependency):
+                if not installed.target(dependency):
+                    if target:
+                        target.target_for_installation(installed, available, attempt_install, already_targeted, to_install)
+                    else:
+                        raise BrokenDependency(unit, dependency.description)
@@ -3,8 +3,28 @@
 """ Handle the unit relationship DSL. """
 
 # Standard library imports
+from collections import namedtuple
 import re
 
+try:
+    from sys import intern
+except ImportError:
+    pass
+
+_pattern = re.compile('([a-z0-9\-\.]+)+')
+_parsed = {}
+_parsed_limit = 4096
+_compiled = {}
+_compiled_limit = 16384
+_compiled_lists = {}
+_compiled_lists_limit = 16384
+
+class Descriptor(namedtuple('Descriptor', 'name architecture version description')):
+    """ Immutable, parsed form of a unit relationship. The architecture
+    and version are None when not specified. """
+
+    __slots__ = ()
+
 def parse(target):
     """ Parses a unit relationship.
 
@@ -27,9 +47,80 @@ def parse(target):
         False
     """
 
-    matches = re.findall('([a-z0-9\-\.]+)+', target)
+    try:
+        matches = _parsed[target]
+    except KeyError:
+        if len(_parsed) >= _parsed_limit:
+            _parsed.clear()
+        matches = _parsed[target] = tuple(_pattern.findall(target))
 
     if matches:
-        return matches
+        return list(matches)
 
     return False
+
+def compile_descriptor(target):
+    """ Parses a unit relationship into a Descriptor. Descriptors are
+    cached, so each relationship is only parsed once.
+
+    Parameters
+        target
+            string describing the other end of a unit relationship.
+    Returns
+        Descriptor
+            describing the other end of the relationship.
+        False
+            in case target is not valid.
+    """
+
+    try:
+        return _compiled[target]
+    except KeyError:
+        pass
+
+    try:
+        matches = [intern(match) for match in _pattern.findall(target)]
+    except TypeError:
+        matches = _pattern.findall(target)
+
+    if matches:
+        matches.extend([None, None])
+        descriptor = Descriptor(matches[0], matches[1], matches[2], target)
+    else:
+        descriptor = False
+
+    if len(_compiled) >= _compiled_limit:
+        _compiled.clear()
+    _compiled[target] = descriptor
+    return descriptor
+
+def compile_all(targets):
+    """ Parses a collection of unit relationships into Descriptors.
+
+    Parameters
+        targets
+            iterable having the relationships' descriptions. May be None.
+    Returns
+        tuple
+            having a Descriptor for every valid description.
+    """
+
+    if not targets:
+        return ()
+
+    key = tuple(targets)
+    try:
+        return _compiled_lists[key]
+    except KeyError:
+        pass
+
+    descriptors = []
+    for target in key:
+        descriptor = compile_descriptor(target)
+        if descriptor:
+            descriptors.append(descriptor)
+
+    if len(_compiled_lists) >= _compiled_lists_limit:
+        _compiled_lists.clear()
+    _compiled_lists[key] = tuple(descriptors)
+    return _compiled_lists[key]
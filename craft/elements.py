@@ -3,10 +3,13 @@
 
 # Standard library imports
 from abc import ABCMeta, abstractmethod
+from marshal import dumps as marshal_dumps, loads as marshal_loads
+from multiprocessing import cpu_count
 
 # Craft imports
 import dsl.relationship
 import dsl.version
+import message
 
 class BrokenDependency(Exception):
     """ Raised if a package depends on an unavailable unit. """
@@ -44,6 +47,7 @@ class Unit(object):
     """ Base unit. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ('name',)
 
     @abstractmethod
     def __init__(self, name):
@@ -63,10 +67,22 @@ class Unit(object):
     def as_target(self):
         return self.name
 
+    def is_targeted_by(self, descriptor):
+        """ Checks whether the unit is the target of a parsed
+        targeting description.
+
+        Parameters
+            descriptor
+                dsl.relationship.Descriptor describing the target.
+        """
+
+        return descriptor.name == self.name
+
 class Installable(object):
     """ Interface for installable units. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def target_for_installation(self, installed, available, attempt_install, already_targeted, to_install):
@@ -76,6 +92,7 @@ class Uninstallable(object):
     """ Interface for uninstallable units. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def target_for_uninstallation(self, installed, attempt_uninstall, already_targeted, to_uninstall):
@@ -85,6 +102,7 @@ class Upgradeable(object):
     """ Interface for upgradeable units. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def target_for_upgrade(self, installed, available, already_targeted_for_upgrade, already_targeted_for_installation, to_install, to_uninstall):
@@ -94,6 +112,7 @@ class Downgradeable(object):
     """ Interface for downgradeable units. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def target_for_downgrade(self, installed, available, already_targeted_for_downgrade, already_targeted_for_installation, to_install, to_uninstall):
@@ -103,6 +122,7 @@ class Describable(object):
     """ Interface for describable units. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def describe(self, context):
@@ -112,13 +132,36 @@ class Incompatible(object):
     """ Interface for units that may raise conflicts. """
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def check_for_conflicts(self, installed, targeted):
         raise NotImplementedError
 
+_RELATIONSHIPS = {'depends': 0, 'conflicts': 1, 'provides': 2, 'replaces': 3}
+
+def _listed(values):
+    """ Converts a shared tuple back to the list found in
+    a package's definition. """
+
+    if isinstance(values, tuple):
+        return list(values)
+    return values
+
 class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgradeable, Downgradeable):
-    """ Represents a remotely available package. """
+    """ Represents a remotely available package.
+
+    Only the fields needed for resolving relationships are kept as
+    attributes. The remaining metadata, such as the package's information
+    and files, is kept serialised until it is actually requested.
+    """
+
+    __slots__ = (
+        'version', 'architecture', 'repository', 'temporary_flags',
+        '_checksums', '_depends', '_conflicts', '_provides', '_replaces',
+        '_groups', '_flags', '_tags', '_maintainers', '_cold',
+        '_descriptors'
+    )
 
     def __init__(self, name, version, architecture, repository, data):
         """ Constructor.
@@ -140,8 +183,59 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
         self.version = str(version)
         self.architecture = str(architecture)
         self.repository = repository
-        self.data = data
-        self.temporary_flags = []
+        self.temporary_flags = ()
+        self._checksums = data['checksums']
+        self._depends = data['depends']
+        self._conflicts = data['conflicts']
+        self._provides = data['provides']
+        self._replaces = data['replaces']
+        self._groups = data['groups']
+        self._flags = data['flags']
+        self._tags = data['information']['tags']
+        self._maintainers = data['information']['maintainers']
+        self._descriptors = (
+            dsl.relationship.compile_all(self._depends),
+            dsl.relationship.compile_all(self._conflicts),
+            dsl.relationship.compile_all(self._provides),
+            dsl.relationship.compile_all(self._replaces)
+        )
+
+        cold = {}
+        for key in data.iterkeys():
+            if key not in ('checksums', 'depends', 'conflicts', 'provides', 'replaces', 'groups', 'flags', 'information'):
+                cold[key] = data[key]
+        cold['information'] = {}
+        for key in data['information'].iterkeys():
+            if key not in ('tags', 'maintainers'):
+                cold['information'][key] = data['information'][key]
+
+        try:
+            self._cold = marshal_dumps(cold)
+        except ValueError:
+            self._cold = cold
+
+    def _materialise(self):
+        """ Retrieves the package's rarely used metadata. """
+
+        if isinstance(self._cold, dict):
+            return self._cold
+        return marshal_loads(self._cold)
+
+    @property
+    def data(self):
+        """ The package's full metadata, as found in its definition. """
+
+        data = self._materialise()
+        data['checksums'] = self._checksums
+        data['depends'] = _listed(self._depends)
+        data['conflicts'] = _listed(self._conflicts)
+        data['provides'] = _listed(self._provides)
+        data['replaces'] = _listed(self._replaces)
+        data['groups'] = _listed(self._groups)
+        data['flags'] = _listed(self._flags)
+        data['information']['tags'] = _listed(self._tags)
+        data['information']['maintainers'] = _listed(self._maintainers)
+        return data
 
     def __unicode__(self):
         return "{0}:{1} {2}".format(self.name, self.architecture, self.version)
@@ -158,6 +252,12 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
     def as_target(self):
         return "{0}:{1}".format(self.name, self.architecture)
 
+    def is_targeted_by(self, descriptor):
+        if descriptor.name == self.name and descriptor.architecture == self.architecture:
+            if descriptor.version is None or descriptor.version == self.version:
+                return True
+        return False
+
     def describe(self, context):
         """ Prints a detailed description of the package.
 
@@ -166,41 +266,44 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 the Set where the package belongs to.
         """
 
-        conflicts = self.conflicts()
-        dependencies = self.dependencies()
         flags = self.flags()
         tags = self.tags()
         maintainers = self.maintainers()
         misc = self.misc()
-        provides = self.provides()
-        replaces = self.replaces()
         reverse_dependencies = []
-        hashed = {'Dependencies':dependencies, 'Conflicts':conflicts, 'Replaces':replaces, 'Provides':provides}
+        hashed = {'Dependencies':'depends', 'Conflicts':'conflicts', 'Replaces':'replaces', 'Provides':'provides'}
 
         print('Name: '+self.name)
         print('Version: '+self.version)
         print('Architecture: '+self.architecture)
 
+        # Only the dependencies naming the package, or one of the virtual
+        # packages it provides, may resolve to it
+        targets = [self]
+        for descriptor in self.descriptors('provides'):
+            unit = context.target(descriptor)
+            if unit:
+                targets.append(unit)
+        names = frozenset([unit.name for unit in targets])
+
         for package in context.packages():
-            for dependency in package.dependencies():
-                if dependency == self.as_target():
-                    reverse_dependencies.append(package)
-                else:
-                    for virtual in self.provides():
-                        if dependency == virtual:
-                            reverse_dependencies.append(package)
+            for descriptor in package.descriptors('depends'):
+                if descriptor.name in names and context.target(descriptor) in targets:
+                    if package not in reverse_dependencies:
+                        reverse_dependencies.append(package)
+                    break
         if reverse_dependencies:
             print('Reverse dependencies')
-            for unit in reverse_dependencies:
+            for unit in sorted(reverse_dependencies):
                 print('  {0}'.format(unit))
 
         for description in hashed.iterkeys():
-            if hashed[description]:
+            units = [context.target(descriptor) for descriptor in self.descriptors(hashed[description])]
+            units = [unit for unit in units if unit]
+            if units:
                 print(description)
-                for target_description in hashed[description]:
-                    unit = context.target(target_description)
-                    if unit:
-                        print('  {0}'.format(unit))
+                for unit in units:
+                    print('  {0}'.format(unit))
 
         if flags:
             print('Flags')
@@ -241,13 +344,40 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 are specified.
         """
 
-        if self.data['checksums']:
+        if self._checksums:
             if not checksum:
                 return True
-            elif self.data['checksums'].has_key(checksum):
-                return self.data['checksums'][checksum]
+            elif self._checksums.has_key(checksum):
+                return self._checksums[checksum]
         return False
 
+    def checksums(self):
+        if self._checksums:
+            return self._checksums
+        return {}
+
+    def format(self):
+        """ Retrieves the format of the package's archive, which
+        defaults to a gzip-compressed tarball. """
+
+        try:
+            format = self._materialise()['format']
+        except KeyError:
+            format = None
+
+        if format:
+            return format
+        return 'tar.gz'
+
+    def size(self):
+        """ Retrieves the size of the package's archive in bytes,
+        or None if the package does not specify it. """
+
+        try:
+            return self._materialise()['size']
+        except KeyError:
+            return None
+
     def has_flag(self, flag):
         """ Checks whether the package has a specific flag.
 
@@ -256,7 +386,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 the flag to be checked for.
         """
 
-        if self.data['flags'] and flag in self.data['flags']:
+        if self._flags and flag in self._flags:
             return True
         else:
             return False
@@ -274,11 +404,8 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 if the flag could not be added to the package.
         """
 
-        if self.data['flags'] is None:
-            self.data['flags'] = []
-
-        if flag not in self.data['flags']:
-            self.data['flags'].append(flag)
+        if flag not in self.flags():
+            self._flags = tuple(self.flags())+(flag,)
             return True
 
         return False
@@ -297,7 +424,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
         """
 
         if flag not in self.temporary_flags:
-            self.temporary_flags.append(flag)
+            self.temporary_flags = self.temporary_flags+(flag,)
             return True
 
         return False
@@ -312,7 +439,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
 
         for flag in flags:
             if flag not in self.temporary_flags:
-                self.temporary_flags.append(flag)
+                self.temporary_flags = self.temporary_flags+(flag,)
 
     def save_temporary_flags(self):
         """ Saves the current temporary flags
@@ -321,12 +448,12 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
 
         for flag in self.temporary_flags:
             self.add_flag(flag)
-        self.temporary_flags = []
+        self.temporary_flags = ()
 
     def erase_temporary_flags(self):
         """ Erases the current temporary flags. """
 
-        self.temporary_flags = []
+        self.temporary_flags = ()
 
     def has_tag(self, tag):
         """ Checks whether the package has a specific tag.
@@ -341,54 +468,75 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 if the tag was not found.
         """
 
-        if self.data['information']['tags']:
-            if tag in self.data['information']['tags']:
+        if self._tags:
+            if tag in self._tags:
                 return True
         return False
 
     def dependencies(self):
-        if self.data['depends']:
-            return self.data['depends']
+        if self._depends:
+            return self._depends
         return []
 
     def conflicts(self):
-        if self.data['conflicts']:
-            return self.data['conflicts']
+        if self._conflicts:
+            return self._conflicts
         return []
 
     def provides(self):
-        if self.data['provides']:
-            return self.data['provides']
+        if self._provides:
+            return self._provides
         return []
 
     def replaces(self):
-        if self.data['replaces']:
-            return self.data['replaces']
+        if self._replaces:
+            return self._replaces
+        return []
+
+    def groups(self):
+        if self._groups:
+            return self._groups
         return []
 
+    def descriptors(self, relationship):
+        """ Retrieves the parsed form of one of the package's relationships.
+
+        Parameters
+            relationship
+                one of 'depends', 'conflicts', 'provides' or 'replaces'.
+        Returns
+            tuple
+                having a dsl.relationship.Descriptor for each of the
+                relationship's descriptions.
+        """
+
+        return self._descriptors[_RELATIONSHIPS[relationship]]
+
     def static(self):
-        if self.data['files']['static']:
-            return self.data['files']['static']
+        files = self._materialise()['files']
+        if files['static']:
+            return files['static']
         return []
 
     def flags(self):
-        if self.data['flags']:
-            return self.data['flags']
+        if self._flags:
+            return self._flags
         return []
 
     def tags(self):
-        if self.data['information']['tags']:
-            return self.data['information']['tags']
+        if self._tags:
+            return self._tags
         return []
 
     def maintainers(self):
-        if self.data['information']['maintainers']:
-            return self.data['information']['maintainers']
+        if self._maintainers:
+            return self._maintainers
         return []
 
     def misc(self):
-        if self.data['information']['misc']:
-            return self.data['information']['misc']
+        information = self._materialise()['information']
+        if information['misc']:
+            return information['misc']
         return {}
 
     def check_for_conflicts(self, installed, targeted):
@@ -406,12 +554,36 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 if a conflict was found.
         """
 
-        for conflict in self.conflicts():
+        for conflict in self.descriptors('conflicts'):
             for each_set in [installed, targeted]:
                 unit = each_set.target(conflict)
                 if unit:
                     raise Conflict(self, unit)
 
+    def flag_for_installation(self, attempt_install):
+        """ Adds the temporary flag describing why the package is being
+        installed.
+
+        Parameters
+            attempt_install
+                a Set having all units targeted by the user for installation.
+        """
+
+        if self in attempt_install:
+            self.add_temporary_flag('installed-by-user')
+        else:
+            virtuals = self.descriptors('provides')
+            if virtuals:
+                for virtual in virtuals:
+                    if attempt_install.target(virtual):
+                        self.add_temporary_flag('installed-by-user')
+                        break
+                    else:
+                        self.add_temporary_flag('installed-as-dependency')
+                        break
+            else:
+                self.add_temporary_flag('installed-as-dependency')
+
     def target_for_installation(self, installed, available, attempt_install, already_targeted, to_install):
         """ Triggered when the package is a target for an
         installation operation.
@@ -437,25 +609,12 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
         """
 
         if self not in installed and self not in already_targeted:
-            if self in attempt_install:
-                self.add_temporary_flag('installed-by-user')
-            else:
-                virtuals = self.provides()
-                if virtuals:
-                    for virtual in virtuals:
-                        if attempt_install.target(virtual):
-                            self.add_temporary_flag('installed-by-user')
-                            break
-                        else:
-                            self.add_temporary_flag('installed-as-dependency')
-                            break
-                else:
-                    self.add_temporary_flag('installed-as-dependency')
+            self.flag_for_installation(attempt_install)
 
             to_install.add(self)
             already_targeted.add(self)
 
-            for dependency in self.dependencies():
+            for dependency in self.descriptors('depends'):
                 if not already_targeted.target(dependency):
                     if not installed.target(dependency):
                         unit = available.target(dependency)
@@ -465,7 +624,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                             except BrokenDependency:
                                 raise
                         else:
-                            raise BrokenDependency(self, dependency)
+                            raise BrokenDependency(self, dependency.description)
 
     def target_for_uninstallation(self, installed, attempt_uninstall, already_targeted, to_uninstall):
         """ Triggered when the package is a target for an
@@ -493,26 +652,26 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
             for package in installed.packages():
                 if self.as_target() in package.dependencies():
                     if package not in attempt_uninstall and package not in already_targeted:
-                        print("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
+                        message.simple("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
                         allow_uninstallation = False
                         break
                 for provides in self.provides():
                     if provides in package.dependencies():
                         if package not in attempt_uninstall and package not in already_targeted:
-                            print("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
+                            message.simple("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
                             allow_uninstallation = False
                             break
 
             for package in already_targeted.packages():
                 if package not in to_uninstall:
                     if self.as_target() in package.dependencies():
-                        print("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
+                        message.simple("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
                         allow_uninstallation = False
                         break
 
             if allow_uninstallation:
                 to_uninstall.add(self)
-                for dependency in self.dependencies():
+                for dependency in self.descriptors('depends'):
                     unit = installed.target(dependency)
                     if unit and unit not in already_targeted:
                         unit.target_for_uninstallation(installed, attempt_uninstall, already_targeted, to_uninstall)
@@ -551,7 +710,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
             for package in available.packages():
                 if substitute:
                     break
-                for replacements in package.replaces():
+                for replacements in package.descriptors('replaces'):
                     unit = installed.target(replacements)
                     if unit and unit == self:
                         substitute = package
@@ -571,7 +730,7 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 to_uninstall.add(self)
                 to_install.add(substitute)
 
-                for dependency in substitute.dependencies():
+                for dependency in substitute.descriptors('depends'):
                     unit = available.target(dependency)
                     if unit:
                         if unit in installed:
@@ -580,9 +739,9 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                         else:
                             unit.target_for_installation(installed, available, Set(), already_targeted_for_installation, to_install)
                     else:
-                        raise BrokenDependency(substitute, dependency)
+                        raise BrokenDependency(substitute, dependency.description)
 
-                for virtual in substitute.provides():
+                for virtual in substitute.descriptors('provides'):
                     unit = available.target(virtual)
                     if unit not in already_targeted_for_upgrade:
                         already_targeted_for_upgrade.add(unit)
@@ -632,14 +791,14 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
                 to_uninstall.add(self)
                 to_install.add(substitute)
 
-                for dependency in substitute.dependencies():
+                for dependency in substitute.descriptors('depends'):
                     unit = available.target(dependency)
                     if not unit:
-                        raise BrokenDependency(substitute, dependency)
+                        raise BrokenDependency(substitute, dependency.description)
                     elif unit not in installed:
                         unit.target_for_installation(installed, available, Set(), already_targeted_for_installation, to_install)
 
-                for virtual in substitute.provides():
+                for virtual in substitute.descriptors('provides'):
                     unit = available.target(virtual)
                     if unit not in already_targeted_for_downgrade:
                         already_targeted_for_downgrade.add(unit)
@@ -647,6 +806,8 @@ class Package(Unit, Incompatible, Describable, Installable, Uninstallable, Upgra
 class VirtualPackage(Unit, Describable, Installable, Uninstallable, Upgradeable, Downgradeable):
     """ Represents a virtual package. """
 
+    __slots__ = ('provided',)
+
     def __init__(self, name):
         super(VirtualPackage, self).__init__(name)
         self.provided = []
@@ -700,6 +861,7 @@ class VirtualPackage(Unit, Describable, Installable, Uninstallable, Upgradeable,
                 organised[counter] = package
                 counter = counter+1
 
+            message.flush()
             while not valid_choice:
                 print("Please choose a package for providing '{0}'.".format(self))
                 for each in organised.iterkeys():
@@ -751,7 +913,7 @@ class VirtualPackage(Unit, Describable, Installable, Uninstallable, Upgradeable,
             for package in installed.packages():
                 if package not in already_targeted and package not in attempt_uninstall:
                     if self.name in package.dependencies():
-                        print("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
+                        message.simple("'{0}' has been untargeted for uninstallation because it is a dependency of '{1}'.".format(self, package))
                         allow_uninstall = False
                         break
 
@@ -822,6 +984,8 @@ class VirtualPackage(Unit, Describable, Installable, Uninstallable, Upgradeable,
 class Group(Unit, Describable, Installable, Uninstallable, Upgradeable, Downgradeable):
     """ Represents a group of packages. """
 
+    __slots__ = ('packages',)
+
     def __init__(self, name):
         """ Constructor.
 
@@ -989,9 +1153,92 @@ class Set(set):
                 May be an empty list.
         """
 
+        self._names = {}
         for unit in units:
             self.add(unit)
 
+    def _index(self, unit):
+        try:
+            self._names[unit.name].append(unit)
+        except KeyError:
+            self._names[unit.name] = [unit]
+
+    def _unindex(self, unit):
+        self._names[unit.name].remove(unit)
+        if not self._names[unit.name]:
+            del self._names[unit.name]
+
+    def add(self, unit):
+        if not set.__contains__(self, unit):
+            super(Set, self).add(unit)
+            self._index(unit)
+
+    def remove(self, unit):
+        super(Set, self).remove(unit)
+        self._unindex(unit)
+
+    def discard(self, unit):
+        if set.__contains__(self, unit):
+            self.remove(unit)
+
+    def pop(self):
+        unit = super(Set, self).pop()
+        self._unindex(unit)
+        return unit
+
+    def update(self, *others):
+        for other in others:
+            for unit in other:
+                self.add(unit)
+
+    def difference_update(self, *others):
+        for other in others:
+            for unit in other:
+                self.discard(unit)
+
+    def intersection_update(self, *others):
+        kept = set.intersection(self, *others)
+        for unit in [unit for unit in self if not set.__contains__(kept, unit)]:
+            self.remove(unit)
+
+    def symmetric_difference_update(self, other):
+        for unit in set(other):
+            if set.__contains__(self, unit):
+                self.remove(unit)
+            else:
+                self.add(unit)
+
+    def __ior__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        self.symmetric_difference_update(other)
+        return self
+
+    def clear(self):
+        self._names = {}
+        super(Set, self).clear()
+
+    def copy(self):
+        return Set(self)
+
     def __contains__(self, key):
         if isinstance(key, Unit):
             unit = self.target(key.as_target())
@@ -1029,10 +1276,12 @@ class Set(set):
 
     def target(self, targeting_description):
         """ Targets a specific unit based on a targeting description.
+        When several units match, the one added first is targeted.
 
         Parameters
             targeting_description
-                string describing a target.
+                string describing a target, or a dsl.relationship.Descriptor
+                parsed from one.
         Returns
             unit
                 the targeted unit.
@@ -1040,21 +1289,14 @@ class Set(set):
                 if no units could be targeted.
         """
 
-        parsed = dsl.relationship.parse(targeting_description)
-
-        if parsed:
-            for unit in sorted(self):
-                if isinstance(unit, Package):
-                    try:
-                        if parsed[0] == unit.name and parsed[1] == unit.architecture and parsed[2] == unit.version:
-                            return unit
-                    except IndexError:
-                        try:
-                            if parsed[0] == unit.name and parsed[1] == unit.architecture:
-                                return unit
-                        except IndexError:
-                            pass
-                elif parsed[0] == unit.name:
+        if isinstance(targeting_description, dsl.relationship.Descriptor):
+            descriptor = targeting_description
+        else:
+            descriptor = dsl.relationship.compile_descriptor(targeting_description)
+
+        if descriptor:
+            for unit in self._names.get(descriptor.name, ()):
+                if unit.is_targeted_by(descriptor):
                     return unit
 
         return False
@@ -1121,6 +1363,47 @@ class Configuration(object):
 
         return self.data['root']
 
+    def workers(self):
+        """ Retrieve the number of workers for parallel operations.
+        Defaults to the number of available processors. """
+
+        try:
+            if self.data['workers']:
+                return self.data['workers']
+        except KeyError:
+            pass
+
+        try:
+            return cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def cache_size(self):
+        """ Retrieve the archive cache's size limit in bytes, given in
+        megabytes by the configuration. Returns None if the cache
+        is not limited. """
+
+        try:
+            if self.data['cache_size']:
+                return self.data['cache_size']*1024*1024
+        except KeyError:
+            pass
+
+        return None
+
+    def events(self):
+        """ Retrieve the configuration's event sinks settings, mapping
+        'console', 'jsonl' and 'prometheus' to their settings. Returns an
+        empty dictionary if no sinks are configured. """
+
+        try:
+            if self.data['events']:
+                return self.data['events']
+        except KeyError:
+            pass
+
+        return {}
+
     def is_architecture_enabled(self, architecture):
         """ Checks whether a specific architecture is enabled.
 
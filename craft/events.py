@@ -0,0 +1,222 @@
+""" Publish structured events about Craft's operations to pluggable sinks. """
+
+# Standard library imports
+import json
+from os import rename
+from threading import Lock
+from time import time
+
+# Craft imports
+import message
+
+# Sinks every event is delivered to
+_sinks = []
+
+# Guards the sinks against events emitted on several threads
+_lock = Lock()
+
+def subscribe(sink):
+    """ Delivers every subsequent event to a sink.
+
+    Parameters
+        sink
+            object having an emit(event) method, and optionally
+            a close() method called once no more events follow.
+    """
+
+    with _lock:
+        _sinks.append(sink)
+
+def unsubscribe(sink):
+    """ Stops delivering events to a sink, and closes it. """
+
+    with _lock:
+        _sinks.remove(sink)
+
+    try:
+        sink.close()
+    except AttributeError:
+        pass
+
+def active():
+    """ Checks whether any sink is subscribed, so that callers may skip
+    gathering details nobody would receive. """
+
+    return bool(_sinks)
+
+def emit(kind, **fields):
+    """ Publishes an event to every sink.
+
+    Parameters
+        kind
+            the event's name, such as 'download.end'.
+        fields
+            the event's details. Packages should be given as strings.
+    Returns
+        dict
+            the event, having its name under 'event' and the time it was
+            emitted under 'time', or None if no sink is subscribed.
+    """
+
+    if not _sinks:
+        return None
+
+    fields['event'] = kind
+    fields['time'] = time()
+
+    with _lock:
+        for sink in _sinks:
+            sink.emit(fields)
+
+    return fields
+
+def close():
+    """ Unsubscribes and closes every sink. """
+
+    while _sinks:
+        unsubscribe(_sinks[-1])
+
+def configure(configuration):
+    """ Subscribes the sinks enabled by a configuration.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+    Raises
+        IOError
+            if a sink's file could not be opened.
+    """
+
+    settings = configuration.events()
+
+    try:
+        if settings['console']:
+            subscribe(Console())
+    except KeyError:
+        pass
+
+    try:
+        if settings['jsonl']:
+            subscribe(JSONLines(settings['jsonl']))
+    except KeyError:
+        pass
+
+    try:
+        if settings['prometheus']:
+            subscribe(Prometheus(settings['prometheus']))
+    except KeyError:
+        pass
+
+class Console(object):
+    """ Displays events as messages. """
+
+    def emit(self, event):
+        details = ' '.join(['{0}={1}'.format(key, event[key]) for key in sorted(event) if key not in ('event', 'time')])
+        message.simple('[{0}] {1}'.format(event['event'], details))
+
+class JSONLines(object):
+    """ Appends each event to a file, as a line of JSON. """
+
+    def __init__(self, filepath):
+        """ Constructor.
+
+        Parameters
+            filepath
+                the file events are appended to.
+        Raises
+            IOError
+                if the file could not be opened.
+        """
+
+        self.handle = open(filepath, 'a')
+
+    def emit(self, event):
+        self.handle.write(json.dumps(event, sort_keys=True)+'\n')
+
+    def close(self):
+        self.handle.close()
+
+class Prometheus(object):
+    """ Exports counters aggregated from events to a file in the textfile
+    format read by the Prometheus node exporter. Counters carry on from
+    the values already exported, so that they keep growing across runs.
+    The file is replaced atomically whenever the sink is closed, so that
+    it is never read half-written. """
+
+    # Exported metrics, along with their types and descriptions
+    metrics = (
+        ('craft_events_total', 'counter', 'Events emitted by Craft, by event.'),
+        ('craft_event_duration_seconds_total', 'counter', 'Time spent in the operations events describe, by event.'),
+        ('craft_downloaded_bytes_total', 'counter', 'Bytes of archives downloaded.'),
+        ('craft_extracted_files_total', 'counter', 'Entries extracted from archives.'),
+        ('craft_last_event_timestamp_seconds', 'gauge', 'Time of the last event.')
+    )
+
+    def __init__(self, filepath):
+        """ Constructor.
+
+        Parameters
+            filepath
+                the exported file, usually ending in '.prom'.
+        """
+
+        self.filepath = filepath
+        self.series = {}
+
+        try:
+            handle = open(filepath)
+        except IOError:
+            return
+
+        try:
+            for line in handle:
+                if line.startswith('#') or not line.strip():
+                    continue
+                try:
+                    name, value = line.rsplit(' ', 1)
+                    self.series[name] = float(value)
+                except ValueError:
+                    continue
+        finally:
+            handle.close()
+
+    def add(self, name, value):
+        self.series[name] = self.series.get(name, 0)+value
+
+    def emit(self, event):
+        kind = event['event']
+        self.add('craft_events_total{{event="{0}"}}'.format(kind), 1)
+        if 'duration' in event:
+            self.add('craft_event_duration_seconds_total{{event="{0}"}}'.format(kind), event['duration'])
+        if kind == 'download.end':
+            self.add('craft_downloaded_bytes_total', event['bytes'])
+        elif kind == 'extract':
+            self.add('craft_extracted_files_total', event['files'])
+        self.series['craft_last_event_timestamp_seconds'] = event['time']
+
+    def lines(self):
+        """ Formats the exported metrics.
+
+        Returns
+            list
+                having the exported file's lines.
+        """
+
+        lines = []
+        for metric, kind, description in self.metrics:
+            lines.append('# HELP {0} {1}'.format(metric, description))
+            lines.append('# TYPE {0} {1}'.format(metric, kind))
+            for name in sorted(self.series):
+                if name == metric or name.startswith(metric+'{'):
+                    lines.append('{0} {1}'.format(name, repr(float(self.series[name]))))
+
+        return lines
+
+    def close(self):
+        try:
+            handle = open(self.filepath+'.partial', 'w')
+            handle.write('\n'.join(self.lines())+'\n')
+            handle.close()
+            rename(self.filepath+'.partial', self.filepath)
+        except (IOError, OSError):
+            message.warning("could not export metrics to '{0}'.".format(self.filepath))
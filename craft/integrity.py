@@ -0,0 +1,200 @@
+""" Verify the integrity of installed files. """
+
+# Standard library imports
+from multiprocessing import Pool
+from os import lstat
+from stat import S_ISREG
+
+# Craft imports
+import checksum
+
+def _check(task):
+    """ Checks a single file against its recorded digest and size.
+    Runs on a worker process.
+
+    Parameters
+        task
+            tuple having the file's path, its expected digest and
+            its expected size.
+    Returns
+        tuple
+            having the file's path, the problem found or None, and
+            the file's current size and modification time.
+    """
+
+    filepath, digest, size = task
+
+    try:
+        status = lstat(filepath)
+    except OSError:
+        return filepath, 'missing', None, None
+
+    if not S_ISREG(status.st_mode):
+        return filepath, 'not a regular file', None, None
+    elif status.st_size != size:
+        return filepath, 'size mismatch', None, None
+
+    try:
+        if checksum.digest(filepath) != digest:
+            return filepath, 'checksum mismatch', None, None
+    except IOError:
+        return filepath, 'unreadable', None, None
+
+    return filepath, None, status.st_size, status.st_mtime
+
+def _read(filepath):
+    """ Reads a manifest or stat cache file.
+
+    Parameters
+        filepath
+            the file to be read.
+    Returns
+        dict
+            mapping each path to the tuple of its two recorded values.
+            Empty if the file could not be read.
+    """
+
+    records = {}
+
+    try:
+        handle = open(filepath)
+    except IOError:
+        return records
+
+    for line in handle.read().splitlines():
+        fields = line.split(' ', 2)
+        if len(fields) == 3:
+            records[fields[2]] = (fields[0], fields[1])
+    handle.close()
+
+    return records
+
+def _write(filepath, records):
+    """ Writes a manifest or stat cache file.
+
+    Parameters
+        filepath
+            the file to be written.
+        records
+            dict mapping each path to the tuple of its two recorded values.
+    Raises
+        IOError
+            if the file could not be written.
+    """
+
+    handle = open(filepath, 'w')
+    for path in sorted(records.iterkeys()):
+        handle.write('{0} {1} {2}\n'.format(records[path][0], records[path][1], path))
+    handle.close()
+
+def record(configuration, package, paths):
+    """ Records the digest and size of a package's freshly installed files
+    in its 'digests' manifest, along with their stat cache.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        package
+            the Package unit whose files are to be recorded.
+        paths
+            iterable having the package's paths, as found in its archive.
+    Raises
+        IOError
+            if a file could not be read, or the manifest could not
+            be written.
+    """
+
+    root = configuration.root()
+    package_directory = configuration.db()+'installed/'+package.name+'/'+package.version+'/'+package.architecture+'/'
+    digests = {}
+    stats = {}
+
+    for path in paths:
+        try:
+            status = lstat(root+path)
+        except OSError:
+            continue
+        if S_ISREG(status.st_mode):
+            digests[path] = (checksum.digest(root+path), status.st_size)
+            stats[path] = (status.st_size, repr(status.st_mtime))
+
+    _write(package_directory+'digests', digests)
+    _write(package_directory+'stat', stats)
+
+def verify(configuration, packages, workers):
+    """ Compares installed files with the digests and sizes recorded
+    when they were installed. Files whose size and modification time
+    still match the stat cache are not read again.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        packages
+            iterable having the installed Package units to be verified.
+        workers
+            number of processes hashing files in parallel.
+    Returns
+        dict
+            mapping each Package unit to a list of (path, problem) tuples,
+            or to None if the package has no manifest to be verified against.
+    """
+
+    root = configuration.root()
+    results = {}
+    tasks = []
+    owners = {}
+    caches = {}
+
+    for package in packages:
+        package_directory = configuration.db()+'installed/'+package.name+'/'+package.version+'/'+package.architecture+'/'
+        digests = _read(package_directory+'digests')
+        if not digests:
+            results[package] = None
+            continue
+
+        results[package] = []
+        caches[package] = _read(package_directory+'stat')
+
+        for path, (digest, size) in digests.iteritems():
+            try:
+                cached_size, cached_mtime = caches[package][path]
+                status = lstat(root+path)
+                if S_ISREG(status.st_mode) and status.st_size == int(cached_size) and repr(status.st_mtime) == cached_mtime:
+                    continue
+            except (KeyError, OSError):
+                pass
+            owners[root+path] = (package, path)
+            tasks.append((root+path, digest, int(size)))
+
+    if tasks:
+        pool = Pool(workers)
+        try:
+            checked = pool.map(_check, tasks, max(1, len(tasks)/(workers*4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        checked = []
+
+    changed = set()
+    for filepath, problem, size, mtime in checked:
+        package, path = owners[filepath]
+        if problem:
+            results[package].append((path, problem))
+            caches[package].pop(path, None)
+        else:
+            caches[package][path] = (size, repr(mtime))
+        changed.add(package)
+
+    for package in changed:
+        package_directory = configuration.db()+'installed/'+package.name+'/'+package.version+'/'+package.architecture+'/'
+        try:
+            _write(package_directory+'stat', caches[package])
+        except IOError:
+            pass
+
+    for package in results:
+        if results[package]:
+            results[package].sort()
+
+    return results
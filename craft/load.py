@@ -2,17 +2,31 @@
 
 # Standard library imports
 from glob import glob
-from os import access, W_OK, X_OK
+from hashlib import sha1
+from itertools import izip
+from marshal import dump as marshal_dump, load as marshal_load, dumps as marshal_dumps, loads as marshal_loads
+from multiprocessing import Pool
+from os import access, rename, W_OK, X_OK
+from os.path import getsize
 from re import findall
 
+try:
+    from sys import intern
+except ImportError:
+    pass
+
 # Third-party imports
 import yaml as libyaml
 
 # Craft imports
 from elements import Package, VirtualPackage, Group, Set, Configuration
 from message import warning
+import timing
 import validate
 
+# Files adding up to at least this many bytes are loaded on a process pool
+_parallel_threshold = 1024*1024
+
 class YAMLError(Exception):
     """ Abstracts libyaml.YAMLError in a native Craft exception. """
     pass
@@ -33,26 +47,269 @@ def yaml(filepath):
             The appropriate Python representation of the file's data.
     """
 
+    return _parse(_read(filepath))
+
+def _read(filepath):
+    """ Reads a file's contents.
+
+    Raises
+        IOError
+            if the file could not be read.
+    """
+
+    filehandle = open(filepath)
     try:
-        filehandle = open(filepath)
-    except IOError:
-        raise
+        return filehandle.read()
+    finally:
+        filehandle.close()
+
+@timing.timed('parse')
+def _parse(contents):
+    """ Parses YAML contents.
+
+    Raises
+        YAMLError
+            if the contents are not valid YAML.
+    """
 
     try:
-        data = libyaml.load(filehandle)
+        return libyaml.load(contents)
     except libyaml.YAMLError:
         raise YAMLError
+
+def _validated(filepath):
+    """ Reads the digests of the files already found to be valid.
+
+    Parameters
+        filepath
+            the validation cache's file.
+    Returns
+        set
+            having the digests, or empty if they were recorded by
+            another version of the validation rules.
+    """
+
+    try:
+        handle = open(filepath, 'rb')
+    except IOError:
+        return set()
+
+    try:
+        version, digests = marshal_load(handle)
+        if version == validate.VERSION:
+            return set(digests)
+    except (EOFError, ValueError, TypeError):
+        pass
     finally:
-        filehandle.close()
+        handle.close()
+
+    return set()
+
+def _remember(filepath, digests):
+    """ Records the digests of the files found to be valid. The cache
+    only spares validations, so failing to write it is not an error. """
+
+    try:
+        handle = open(filepath+'.partial', 'wb')
+        marshal_dump((validate.VERSION, sorted(digests)), handle)
+        handle.close()
+        rename(filepath+'.partial', filepath)
+    except (IOError, OSError):
+        pass
+
+def _intern(value):
+    """ Interns a string, so that equal identifiers share a single object
+    and may be compared by identity.
+
+    Parameters
+        value
+            the string to be interned. Other objects are returned unchanged.
+    """
+
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+def _share(values, shared):
+    """ Replaces a list of identifiers by an equal, shared tuple.
+
+    Parameters
+        values
+            list to be replaced. May be None.
+        shared
+            dictionary having the tuples already in use.
+    Returns
+        tuple
+            having the interned identifiers, shared by every package
+            declaring the same ones.
+        None
+            if values is None.
+    """
+
+    if values is None:
+        return None
 
-    return data
+    values = tuple([_intern(value) for value in values])
+    return shared.setdefault(values, values)
 
-def _set(paths):
+def _flyweight(data, shared):
+    """ Replaces the identifier lists of a package's data by shared tuples.
+
+    Parameters
+        data
+            the package's data, already validated.
+        shared
+            dictionary having the tuples already in use.
+    """
+
+    for key in ('depends', 'conflicts', 'replaces', 'provides', 'groups', 'flags'):
+        data[key] = _share(data[key], shared)
+    for key in ('tags', 'maintainers'):
+        data['information'][key] = _share(data['information'][key], shared)
+
+def _definition(path, validated, workers=1):
+    """ Reads, parses and validates a YAML file defining a Set.
+
+    Parameters
+        path
+            the file to be loaded.
+        validated
+            digests of the files already validated, which are not
+            validated again.
+        workers
+            number of processes the validation may be split across.
+    Raises
+        IOError
+            if the file could not be read.
+        YAMLError
+            if the file is not a valid YAML file.
+        validate.SemanticError
+            if the file is semantically invalid.
+    Returns
+        tuple
+            having the file's digest and its data.
+    """
+
+    contents = _read(path)
+    digest = sha1(contents).hexdigest()
+    definition = _parse(contents)
+    if digest not in validated:
+        validate.set(definition, workers)
+
+    return digest, definition
+
+def _load(task):
+    """ Loads a file defining a Set. Runs on a worker process, so errors
+    are returned instead of being raised, as they may not be pickled.
+    The data is marshalled, which is much faster than pickling it.
+
+    Parameters
+        task
+            tuple having the file's path and the digests of the files
+            already validated.
+    Returns
+        tuple
+            having True along with the file's digest, whether its data
+            is marshalled, and its data if it was loaded, or False along
+            with the error's type and the arguments it may be raised
+            again with otherwise.
+    """
+
+    try:
+        digest, definition = _definition(*task)
+    except IOError as error:
+        return False, IOError, (error.errno, error.strerror, error.filename)
+    except YAMLError:
+        return False, YAMLError, ()
+    except validate.SemanticError as error:
+        return False, validate.SemanticError, (error.reason, error.path)
+
+    try:
+        return True, digest, True, marshal_dumps(definition)
+    except ValueError:
+        # YAML may yield values, such as dates, which cannot be marshalled
+        return True, digest, False, definition
+
+def _definitions(paths, validated, workers):
+    """ Loads files defining Sets. Several files are read, parsed and
+    validated at once on a process pool whenever they are large enough
+    for it to pay off, but their data is still yielded in the order of
+    the paths.
+
+    Parameters
+        paths
+            list having the file paths to be loaded.
+        validated
+            digests of the files already validated.
+        workers
+            number of processes to be used.
+    Raises
+        IOError
+            if one of the files could not be read.
+        YAMLError
+            if one of the files is not a valid YAML file.
+        validate.SemanticError
+            if one of the files is semantically invalid.
+    Yields
+        tuple
+            having a file's path, digest and data.
+    """
+
+    size = 0
+    if workers >= 2 and len(paths) >= 2:
+        for path in paths:
+            try:
+                size = size+getsize(path)
+            except OSError:
+                pass
+
+    if size < _parallel_threshold:
+        for path in paths:
+            try:
+                digest, definition = _definition(path, validated, workers)
+            except validate.SemanticError as error:
+                warning("invalid definition in '{0}': {1}".format(path, error))
+                raise
+            yield path, digest, definition
+        return
+
+    processes = min(workers, len(paths))
+    tasks = [(path, validated) for path in paths]
+    pool = Pool(processes)
+    try:
+        results = pool.imap(_load, tasks, max(1, len(paths)/(processes*4)))
+        for path, result in izip(paths, results):
+            if not result[0]:
+                error = result[1](*result[2])
+                if isinstance(error, validate.SemanticError):
+                    warning("invalid definition in '{0}': {1}".format(path, error))
+                raise error
+            if result[2]:
+                yield path, result[1], marshal_loads(result[3])
+            else:
+                yield path, result[1], result[3]
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+@timing.timed('load')
+def _set(paths, cache=None, workers=1):
     """ Loads a Set from one or more YAML files.
 
     Parameters
         paths
             iterable having the file paths to be loaded.
+        cache
+            optional file recording the digests of the files already
+            validated, so that unchanged files are not validated again.
+        workers
+            number of processes the files may be loaded on, or the
+            validation of a single file split across.
     Raises
         IOError
             if one of the files could not be read.
@@ -68,25 +325,23 @@ def _set(paths):
     groups = {}
     virtuals = {}
     registry = Registry()
+    shared = {}
+    validated = set()
+    seen = set()
+    if cache is not None:
+        validated = _validated(cache)
 
-    for path in paths:
-        try:
-            definition = yaml(path)
-            validate.set(definition)
-        except IOError:
-            raise
-        except YAMLError:
-            raise
-        except validate.SemanticError:
-            raise
+    for path, digest, definition in _definitions(list(paths), validated, workers):
+        seen.add(digest)
 
-        repository = findall('([a-zA-Z0-9]+)', path)[-3]
+        repository = _intern(findall('([a-zA-Z0-9]+)', path)[-3])
 
         for name in definition.iterkeys():
             for version in definition[name].iterkeys():
                 for architecture in definition[name][version].iterkeys():
                     data = definition[name][version][architecture]
-                    package = Package(name, version, architecture, repository, data)
+                    _flyweight(data, shared)
+                    package = Package(_intern(name), _intern(str(version)), _intern(str(architecture)), repository, data)
 
                     try:
                         registry.add_package(name, version, architecture)
@@ -142,6 +397,9 @@ def _set(paths):
     for virtual in virtuals.iterkeys():
         units.add(virtuals[virtual])
 
+    if cache is not None and seen != validated:
+        _remember(cache, seen)
+
     return units
 
 def available(configuration):
@@ -163,7 +421,7 @@ def available(configuration):
     """
 
     try:
-        return _set(glob(configuration.db()+'/available/*/*.yml'))
+        return _set(glob(configuration.db()+'/available/*/*.yml'), configuration.db()+'validated.available', configuration.workers())
     except IOError:
         raise
     except YAMLError:
@@ -189,7 +447,8 @@ def installed(configuration):
     """
 
     try:
-        return _set(glob(configuration.db()+'/installed/*/*/*/metadata.yml'))
+        # Each package has its own, tiny metadata file
+        return _set(glob(configuration.db()+'/installed/*/*/*/metadata.yml'), configuration.db()+'validated.installed')
     except IOError:
         raise
     except YAMLError:
@@ -221,7 +480,8 @@ def configuration(filepath):
         raise
     except YAMLError:
         raise
-    except validate.SemanticError:
+    except validate.SemanticError as error:
+        warning("invalid configuration in '{0}': {1}".format(filepath, error))
         raise
 
     if not data['db'].endswith('/'):
@@ -1,19 +1,158 @@
 """ Send messages to the user. """
 
 # Standard library imports
-from time import localtime
+import sys
+from threading import Lock
+from time import localtime, strftime, time
+
+# Message levels. Messages below the current level are discarded.
+DEBUG = 10
+INFO = 20
+WARNING = 30
+
+_level = INFO
+
+# Messages are buffered, and written at once whenever this many are
+# waiting, whenever they have waited this long, or whenever flushed
+_capacity = 256
+_interval = 0.1
+
+_buffer = []
+_flushed = 0.0
+
+# The timestamp is only formatted again once a second has passed
+_second = None
+_stamp = ''
+
+# Status line kept below the messages on terminals, such as progress
+_status = None
+
+# Guards the buffer against messages sent from several threads
+_lock = Lock()
+
+def set_level(level):
+    """ Sets the level below which messages are discarded.
+
+    Parameters
+        level
+            one of DEBUG, INFO or WARNING.
+    """
+
+    global _level
+    _level = level
+
+def quiet():
+    """ Discards every message but warnings. """
+
+    set_level(WARNING)
 
 def _isotime():
     """ Retrieve the current time as a string,
     formatted according to the ISO-8601 standard. """
 
-    now = list(localtime()[:-3])
+    global _second, _stamp
+
+    now = int(time())
+    if now != _second:
+        _stamp = strftime('%Y/%m/%d %H:%M:%S', localtime(now))
+        _second = now
+
+    return _stamp
+
+def _write(line):
+    """ Buffers a line, writing the buffer out if it is full or
+    has not been written for a while. """
+
+    global _flushed
+
+    with _lock:
+        _buffer.append(line)
+        now = time()
+        if len(_buffer) < _capacity and now-_flushed < _interval:
+            return
+        _flushed = now
+        _flush()
+
+def _flush():
+    if _status is None:
+        sys.stdout.write('\n'.join(_buffer)+'\n')
+    else:
+        sys.stdout.write('\r\033[K'+'\n'.join(_buffer)+'\n'+_status)
+    sys.stdout.flush()
+    del _buffer[:]
+
+def interactive():
+    """ Checks whether messages are displayed on a terminal. """
+
+    try:
+        return sys.stdout.isatty()
+    except AttributeError:
+        return False
 
-    for each in range(1, len(now)):
-        if now[each] < 10:
-            now[each] = '0'+str(now[each])
+def status(line):
+    """ Displays a status line below the messages, replacing the previous
+    one. Only terminals display status lines.
+
+    Parameters
+        line
+            the status line, or None for it to be cleared.
+    """
+
+    global _status, _flushed
+
+    if _level > INFO or not interactive():
+        return
+
+    with _lock:
+        if _buffer:
+            _flush()
+            _flushed = time()
+        if line is None:
+            if _status is not None:
+                sys.stdout.write('\r\033[K')
+        else:
+            sys.stdout.write('\r'+line+'\033[K')
+        sys.stdout.flush()
+        _status = line
+
+def flush():
+    """ Writes out every buffered message. Called at the end of each
+    phase of an operation, and before prompting the user. """
+
+    global _flushed
+
+    with _lock:
+        if _buffer:
+            _flush()
+        _flushed = time()
+
+def log(level, message):
+    """ Sends a message.
+
+    Parameters
+        level
+            one of DEBUG, INFO or WARNING.
+        message
+            string to be displayed.
+    """
+
+    if level < _level:
+        return
+    elif level >= WARNING:
+        _write('\033[93m'+_isotime()+' Warning: '+message+'\033[0m')
+    else:
+        _write(_isotime()+' '+message)
+
+def debug(message):
+    """ Display a message only meant for diagnosing problems.
+
+    Paramaters
+        message
+            string to be displayed.
+    """
 
-    return '{0}/{1}/{2} {3}:{4}:{5}'.format(now[0], now[1], now[2], now[3], now[4], now[5])
+    if _level <= DEBUG:
+        _write(_isotime()+' '+message)
 
 def warning(message):
     """ Informs the user about an unexpected event.
@@ -23,7 +162,7 @@ def warning(message):
             the event's description.
     """
 
-    print('\033[93m'+_isotime()+' Warning: '+message+'\033[0m')
+    _write('\033[93m'+_isotime()+' Warning: '+message+'\033[0m')
 
 def simple(message):
     """ Display a simple, uncoloured message to the user.
@@ -33,4 +172,5 @@ def simple(message):
             string to be displayed.
     """
 
-    print(_isotime()+' '+message)
+    if _level <= INFO:
+        _write(_isotime()+' '+message)
@@ -0,0 +1,188 @@
+""" Index the files owned by installed packages. """
+
+# Standard library imports
+from glob import glob
+from os.path import normpath
+
+try:
+    import anydbm as dbm
+except ImportError:
+    import dbm
+
+_built = '\0built'
+
+def normalise(path, root='/'):
+    """ Normalises a path, so that paths from archives, file lists and
+    the command line may be compared to each other.
+
+    Parameters
+        path
+            the path to be normalised.
+        root
+            the root directory absolute paths may be relative to.
+    Returns
+        string
+            the path relative to the root directory, without
+            leading or trailing slashes.
+    """
+
+    path = normpath(path)
+    root = normpath(root)
+    if root != '/' and (path == root or path.startswith(root+'/')):
+        path = path[len(root):]
+
+    return path.lstrip('/')
+
+class Index(object):
+    """ Maps each installed path to the packages owning it. """
+
+    def __init__(self, configuration):
+        """ Constructor. Builds the index from the installed packages'
+        file lists if it does not exist yet.
+
+        Parameters
+            configuration
+                a valid Craft Configuration object.
+        """
+
+        self.handle = dbm.open(configuration.db()+'owners', 'c')
+
+        try:
+            self.handle[_built]
+        except KeyError:
+            self.build(configuration)
+
+    def build(self, configuration):
+        """ Rebuilds the index from the installed packages' file lists.
+
+        Parameters
+            configuration
+                a valid Craft Configuration object.
+        """
+
+        for key in self.handle.keys():
+            del self.handle[key]
+
+        for filepath in glob(configuration.db()+'installed/*/*/*/files'):
+            name, version, architecture = filepath.split('/')[-4:-1]
+            try:
+                handle = open(filepath)
+            except IOError:
+                continue
+            else:
+                paths = handle.read().splitlines()
+                handle.close()
+            self._add("{0}:{1} {2}".format(name, architecture, version), paths)
+
+        self.handle[_built] = ''
+
+    def _add(self, owner, paths):
+        """ Records an owner, given as a string, for a collection of paths. """
+
+        for path in paths:
+            path = normalise(path)
+            if path == '.':
+                continue
+            owners = self.owners(path)
+            if owner not in owners:
+                owners.append(owner)
+                self.handle[path] = '\n'.join(owners)
+
+    def owners(self, path):
+        """ Retrieves the packages owning a path.
+
+        Parameters
+            path
+                the path, relative to the root directory.
+        Returns
+            list
+                having the owners' descriptions. Empty if the
+                path is not owned by any package.
+        """
+
+        try:
+            return self.handle[normalise(path)].split('\n')
+        except KeyError:
+            return []
+
+    def add(self, package, paths):
+        """ Records a package as the owner of a collection of paths.
+
+        Parameters
+            package
+                the Package unit owning the paths.
+            paths
+                iterable having the paths, as found in the package's archive.
+        """
+
+        self._add(str(package), paths)
+
+    def remove(self, package, paths):
+        """ Removes a package from the owners of a collection of paths.
+
+        Parameters
+            package
+                the Package unit that used to own the paths.
+            paths
+                iterable having the paths, as found in the package's archive.
+        """
+
+        owner = str(package)
+        for path in paths:
+            path = normalise(path)
+            owners = self.owners(path)
+            if owner in owners:
+                owners.remove(owner)
+                if owners:
+                    self.handle[path] = '\n'.join(owners)
+                else:
+                    del self.handle[path]
+
+    def collisions(self, package, entries):
+        """ Finds the files of an archive that are already owned by
+        other packages. Directories may be shared, and are ignored.
+
+        Parameters
+            package
+                the Package unit about to be installed.
+            entries
+                iterable having (path, is_directory) tuples, as returned
+                by archive.getentries().
+        Returns
+            list
+                having a (path, owner) tuple for each collision.
+        """
+
+        owner = str(package)
+        found = []
+        for path, is_directory in entries:
+            if not is_directory:
+                for each in self.owners(path):
+                    if each != owner:
+                        found.append((path, each))
+
+        return found
+
+    def close(self):
+        """ Writes the index to disk. """
+
+        self.handle.close()
+
+def owners(configuration, path):
+    """ Retrieves the packages owning a path.
+
+    Parameters
+        configuration
+            a valid Craft Configuration object.
+        path
+            the path, either relative to the root directory or absolute.
+    Returns
+        list
+            having the owners' descriptions.
+    """
+
+    index = Index(configuration)
+    found = index.owners(normalise(path, configuration.root()))
+    index.close()
+
+    return found
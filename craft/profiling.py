@@ -0,0 +1,171 @@
+""" Profile Craft's operations, so that reports may be attached to
+issues without modifying the installed code. """
+
+# Standard library imports
+import atexit
+import cProfile
+import gc
+from os import sysconf
+from threading import Lock, local
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Craft imports
+import timing
+
+# Number of allocation sites, or object types, reported per phase
+_limit = 10
+
+def cpu(filepath):
+    """ Profiles the rest of the process with cProfile. Only the main
+    thread is profiled, so the time spent by parallel installations
+    shows up as waiting for their workers.
+
+    Parameters
+        filepath
+            path of the pstats file written when the process exits.
+    """
+
+    profiler = cProfile.Profile()
+    atexit.register(_dump, profiler, filepath)
+    profiler.enable()
+
+def _dump(profiler, filepath):
+    profiler.disable()
+    profiler.dump_stats(filepath)
+
+def _resident():
+    """ Retrieves the process' resident memory, in bytes. """
+
+    try:
+        handle = open('/proc/self/statm')
+    except IOError:
+        return 0
+
+    try:
+        return int(handle.read().split()[1])*sysconf('SC_PAGE_SIZE')
+    finally:
+        handle.close()
+
+def _snapshot():
+    """ Takes a snapshot of the memory in use. With tracemalloc, it holds
+    the allocations made by each line of code. Otherwise, as on Python 2,
+    it holds the number of live objects of each type. """
+
+    if tracemalloc is not None:
+        return tracemalloc.take_snapshot()
+
+    counts = {}
+    for each in gc.get_objects():
+        name = type(each).__name__
+        counts[name] = counts.get(name, 0)+1
+
+    return counts
+
+def _growth(before, after):
+    """ Compares two snapshots.
+
+    Returns
+        dict
+            mapping each allocation site, or object type, to its growth.
+    """
+
+    growth = {}
+    if tracemalloc is not None:
+        for statistic in after.compare_to(before, 'lineno'):
+            if statistic.size_diff:
+                growth[str(statistic.traceback)] = statistic.size_diff
+    else:
+        for name in after:
+            difference = after[name]-before.get(name, 0)
+            if difference:
+                growth[name] = difference
+
+    return growth
+
+class Allocations(object):
+    """ Records the allocations made during each phase timed by
+    craft.timing. Phases nested in one another each include the
+    allocations of the phases they enclose. """
+
+    def __init__(self):
+        self.order = []
+        self.phases = {}
+        self.lock = Lock()
+        self.spans = local()
+
+    def enter(self, phase):
+        try:
+            stack = self.spans.stack
+        except AttributeError:
+            stack = self.spans.stack = []
+        stack.append((_snapshot(), _resident()))
+
+    def exit(self, phase):
+        before, resident = self.spans.stack.pop()
+        growth = _growth(before, _snapshot())
+        resident = _resident()-resident
+
+        with self.lock:
+            try:
+                totals = self.phases[phase]
+            except KeyError:
+                totals = self.phases[phase] = [0, 0, {}]
+                self.order.append(phase)
+            totals[0] = totals[0]+1
+            totals[1] = max(totals[1], resident)
+            for site in growth:
+                totals[2][site] = totals[2].get(site, 0)+growth[site]
+
+    def report(self):
+        """ Formats the recorded allocations.
+
+        Returns
+            list
+                having the report's lines.
+        """
+
+        if tracemalloc is not None:
+            lines = ['Largest allocations per phase, in bytes, by line of code.']
+        else:
+            lines = ['Largest growth in live objects per phase, by type.']
+
+        with self.lock:
+            for phase in self.order:
+                spans, resident, growth = self.phases[phase]
+                lines.append('')
+                lines.append("Phase '{0}': {1} span(s), resident memory grew by up to {2:.1f} MB".format(phase, spans, resident/1048576.0))
+                largest = sorted(growth.iteritems(), key=lambda item: item[1], reverse=True)[:_limit]
+                for site, amount in largest:
+                    lines.append('{0:>14} {1}'.format('{0:+d}'.format(amount), site))
+
+        return lines
+
+def memory(filepath):
+    """ Records the allocations made during each phase of the rest of
+    the process. Taking snapshots is slow, so phases take much longer
+    than they otherwise would.
+
+    Parameters
+        filepath
+            path of the report written when the process exits.
+    """
+
+    allocations = Allocations()
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    timing.hook(allocations.enter, allocations.exit)
+    timing.enable()
+    atexit.register(_write, allocations, filepath)
+
+def _write(allocations, filepath):
+    handle = open(filepath, 'w')
+    try:
+        for line in allocations.report():
+            handle.write(line+'\n')
+    finally:
+        handle.close()
@@ -0,0 +1,181 @@
+""" Report the progress of long operations. """
+
+# Standard library imports
+from os.path import getsize
+from threading import Event, Lock, Thread
+from time import time
+
+# Craft imports
+import message
+
+# Seconds between two reports on a terminal, where the status line is
+# replaced, and elsewhere, where each report is a message of its own
+_terminal_interval = 0.2
+_log_interval = 5.0
+
+def _size(amount):
+    """ Formats an amount of bytes. """
+
+    for unit in ('B', 'KB', 'MB'):
+        if amount < 1024:
+            return '{0:.1f} {1}'.format(amount, unit)
+        amount = amount/1024.0
+
+    return '{0:.1f} GB'.format(amount)
+
+def _duration(seconds):
+    """ Formats a duration as minutes and seconds. """
+
+    seconds = int(seconds)
+    return '{0}:{1:02d}'.format(seconds/60, seconds % 60)
+
+class Progress(object):
+    """ Tracks the progress of an operation processing items, such as
+    packages, along with the bytes and files they are made of. Reports are
+    rate-limited, so that tracking costs next to nothing however often
+    it advances. Progress may advance from several threads at once. """
+
+    def __init__(self, label, items, unit, size=None):
+        """ Constructor.
+
+        Parameters
+            label
+                describes the operation, such as 'Downloading'.
+            items
+                number of items to be processed.
+            unit
+                name of the items, such as 'packages'.
+            size
+                total bytes to be processed, if known. Used for estimating
+                the time left, which is otherwise estimated from items.
+        """
+
+        self.label = label
+        self.items = items
+        self.unit = unit
+        self.size = size
+        self.done = 0
+        self.bytes = 0
+        self.files = 0
+        self.started = time()
+        self.reported = self.started
+        self.interactive = message.interactive()
+        if self.interactive:
+            self.interval = _terminal_interval
+        else:
+            self.interval = _log_interval
+        self.lock = Lock()
+
+    def advance(self, amount=0, files=0, items=0):
+        """ Records progress, and reports it if the last report is
+        old enough.
+
+        Parameters
+            amount
+                bytes processed since the last call.
+            files
+                files processed since the last call.
+            items
+                items completed since the last call.
+        """
+
+        with self.lock:
+            self.bytes = self.bytes+amount
+            self.files = self.files+files
+            self.done = self.done+items
+
+            now = time()
+            if now-self.reported < self.interval:
+                return
+            self.reported = now
+            line = self.line(now)
+
+        if self.interactive:
+            message.status(line)
+        else:
+            message.simple(line)
+
+    def line(self, now):
+        """ Describes the progress made so far.
+
+        Parameters
+            now
+                the current time.
+        Returns
+            string
+                having the items and bytes processed, their throughput
+                and the estimated time left, whenever it may be estimated.
+        """
+
+        elapsed = max(now-self.started, 0.001)
+        parts = ['{0}/{1} {2}'.format(self.done, self.items, self.unit)]
+
+        if self.size:
+            parts.append('{0} of {1}'.format(_size(self.bytes), _size(self.size)))
+        else:
+            parts.append(_size(self.bytes))
+        parts.append('{0}/s'.format(_size(self.bytes/elapsed)))
+        if self.files:
+            parts.append('{0:.0f} files/s'.format(self.files/elapsed))
+
+        if self.size and self.bytes:
+            parts.append('ETA '+_duration(elapsed*max(self.size-self.bytes, 0)/self.bytes))
+        elif self.items and self.done:
+            parts.append('ETA '+_duration(elapsed*(self.items-self.done)/self.done))
+
+        return '{0}: {1}'.format(self.label, ', '.join(parts))
+
+    def finish(self):
+        """ Clears the status line, and reports the overall throughput
+        of operations having lasted long enough for it to be reported. """
+
+        message.status(None)
+
+        now = time()
+        if now-self.started >= self.interval:
+            message.simple(self.line(now))
+
+class Watcher(Thread):
+    """ Advances a Progress as a file grows, such as an archive being
+    downloaded by an external command. """
+
+    def __init__(self, progress, filepath):
+        """ Constructor.
+
+        Parameters
+            progress
+                the Progress to be advanced by the file's growth.
+            filepath
+                the watched file, which may not exist yet.
+        """
+
+        super(Watcher, self).__init__()
+        self.daemon = True
+        self.progress = progress
+        self.filepath = filepath
+        self.reported = 0
+        self.stopped = Event()
+        self.lock = Lock()
+
+    def run(self):
+        while not self.stopped.wait(_terminal_interval):
+            with self.lock:
+                if not self.stopped.is_set():
+                    self.poll()
+
+    def poll(self):
+        try:
+            size = getsize(self.filepath)
+        except OSError:
+            return
+
+        if size > self.reported:
+            self.progress.advance(size-self.reported)
+            self.reported = size
+
+    def stop(self):
+        """ Stops watching the file, accounting for its final size. """
+
+        with self.lock:
+            self.stopped.set()
+            self.poll()
@@ -0,0 +1,134 @@
+""" Remove large collections of files from the filesystem. """
+
+# Standard library imports
+from multiprocessing.pool import ThreadPool
+from os import lstat, remove, rmdir, geteuid, getegid, getgroups
+from stat import S_ISDIR, S_IWUSR, S_IWGRP, S_IWOTH
+
+# Removing fewer files than this is not worth starting threads for
+_parallel_threshold = 256
+
+class Entry(object):
+    """ A path to be removed, along with the result of its single lstat()
+    call. """
+
+    __slots__ = ('path', 'status')
+
+    def __init__(self, path, status):
+        """ Constructor.
+
+        Parameters
+            path
+                the path to be removed.
+            status
+                the path's lstat() result.
+        """
+
+        self.path = path
+        self.status = status
+
+    def is_directory(self):
+        return S_ISDIR(self.status.st_mode)
+
+    def is_writable(self, uid, gids):
+        """ Checks whether the entry may be written to by a user,
+        the same way access(W_OK) does for its owner, group and
+        other permission bits.
+
+        Parameters
+            uid
+                the user's effective ID.
+            gids
+                set having the user's effective and supplementary group IDs.
+        """
+
+        mode = self.status.st_mode
+        if uid == 0:
+            return True
+        elif self.status.st_uid == uid:
+            return bool(mode & S_IWUSR)
+        elif self.status.st_gid in gids:
+            return bool(mode & S_IWGRP)
+        return bool(mode & S_IWOTH)
+
+def scan(paths):
+    """ Calls lstat() exactly once for each path.
+
+    Parameters
+        paths
+            iterable having the paths to be scanned.
+    Returns
+        tuple
+            having the list of Entry objects for writable paths,
+            and the list of paths that are missing or not writable.
+    """
+
+    uid = geteuid()
+    gids = set(getgroups())
+    gids.add(getegid())
+    entries = []
+    refused = []
+
+    for path in paths:
+        try:
+            entry = Entry(path, lstat(path))
+        except OSError:
+            refused.append(path)
+            continue
+        if entry.is_writable(uid, gids):
+            entries.append(entry)
+        else:
+            refused.append(path)
+
+    return entries, refused
+
+def _remove(path):
+    try:
+        remove(path)
+    except OSError:
+        return False
+    return True
+
+def run(entries, workers):
+    """ Removes scanned entries. Files are removed first, on a thread pool
+    when there are many of them. Directories are then removed in a single
+    pass, deepest first, and kept if they are not empty.
+
+    Parameters
+        entries
+            iterable having the Entry objects to be removed.
+        workers
+            number of threads removing files in parallel.
+    Returns
+        list
+            having the paths that could not be removed.
+    """
+
+    files = []
+    directories = []
+    for entry in entries:
+        if entry.is_directory():
+            directories.append(entry.path)
+        else:
+            files.append(entry.path)
+
+    if workers > 1 and len(files) >= _parallel_threshold:
+        pool = ThreadPool(workers)
+        try:
+            removed = pool.map(_remove, files, max(1, len(files)/(workers*4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        removed = [_remove(path) for path in files]
+
+    failed = [files[position] for position in range(0, len(files)) if not removed[position]]
+
+    directories.sort(key=lambda path: path.rstrip('/').count('/'), reverse=True)
+    for path in directories:
+        try:
+            rmdir(path)
+        except OSError:
+            failed.append(path)
+
+    return failed
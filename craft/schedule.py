@@ -0,0 +1,215 @@
+""" Run operations over packages in dependency order, in parallel
+whenever possible. """
+
+# Standard library imports
+from array import array
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty
+import sys
+
+# Craft imports
+import closure
+
+def components(packages):
+    """ Groups a collection of packages by their dependencies on each other.
+    Packages depending on each other cyclically end up in the same group.
+
+    Parameters
+        packages
+            iterable having the Package units to be grouped.
+    Returns
+        tuple
+            having the list of groups, each being a list of Package units,
+            ordered so that every group comes after the groups it depends on,
+            and a list having, for each group, the set of indices of the
+            groups it depends on.
+    """
+
+    units = sorted(packages)
+    ids = {}
+
+    # Dependencies may refer to packages by name, by a provided virtual
+    # package's name or by a group's name.
+    for position in range(0, len(units)):
+        unit = units[position]
+        names = [unit.name]
+        try:
+            names.extend([descriptor.name for descriptor in unit.descriptors('provides')])
+            names.extend(unit.groups())
+        except AttributeError:
+            pass
+        for name in names:
+            ids.setdefault(name, []).append(position)
+
+    offsets = array('i', [0])
+    values = array('i')
+    for unit in units:
+        try:
+            descriptors = unit.descriptors('depends')
+        except AttributeError:
+            descriptors = ()
+        for descriptor in descriptors:
+            for target in ids.get(descriptor.name, ()):
+                if units[target].is_targeted_by(descriptor) or units[target].name != descriptor.name:
+                    values.append(target)
+        offsets.append(len(values))
+
+    component, count = closure.components(len(units), offsets, values)
+
+    groups = [[] for each in range(0, count)]
+    requirements = [set() for each in range(0, count)]
+    for position in range(0, len(units)):
+        groups[component[position]].append(units[position])
+        for edge in range(offsets[position], offsets[position+1]):
+            target = component[values[edge]]
+            if target != component[position]:
+                requirements[component[position]].add(target)
+
+    return groups, requirements
+
+class Plan(object):
+    """ Ordered collection of packages to be operated on. Iterating over
+    a plan yields every package after the packages it depends on, or
+    before them if the plan is reversed, as needed for uninstallation.
+    Packages depending on each other cyclically are kept together. """
+
+    def __init__(self, packages, reverse=False):
+        """ Constructor.
+
+        Parameters
+            packages
+                iterable having the Package units to be ordered.
+            reverse
+                specifies whether dependents must come before
+                their dependencies.
+        """
+
+        self.packages = set(packages)
+        self.groups, self.requirements = components(self.packages)
+
+        if reverse:
+            count = len(self.groups)
+            requirements = [set() for each in range(0, count)]
+            for position in range(0, count):
+                for requirement in self.requirements[position]:
+                    requirements[count-1-requirement].add(count-1-position)
+            self.groups.reverse()
+            self.requirements = requirements
+
+    def __iter__(self):
+        for group in self.groups:
+            for package in group:
+                yield package
+
+    def __len__(self):
+        return len(self.packages)
+
+    def __contains__(self, package):
+        return package in self.packages
+
+    def cycles(self):
+        """ Returns an iterable having the groups of packages which
+        depend on each other cyclically. """
+
+        for group in self.groups:
+            if len(group) > 1:
+                yield group
+
+    def execute(self, perform, workers):
+        """ Performs an operation over every package of the plan,
+        following its order. See execute().
+
+        Parameters
+            perform
+                function to be called with each Package unit.
+            workers
+                maximum number of groups to be run at the same time.
+        """
+
+        execute(self.groups, self.requirements, perform, workers)
+
+def _run(perform, position, group, done):
+    """ Performs an operation over every package of a group, and reports
+    the outcome through a queue. Runs on a worker thread. """
+
+    try:
+        for package in group:
+            perform(package)
+    except Exception:
+        done.put((position, sys.exc_info()))
+    else:
+        done.put((position, None))
+
+def execute(groups, requirements, perform, workers):
+    """ Performs an operation over groups of packages. A group is only
+    started once all the groups it depends on are finished, and independent
+    groups are run in parallel. Packages within a group are handled
+    one at a time.
+
+    Parameters
+        groups
+            list of groups, as returned by components().
+        requirements
+            list of the groups each group depends on, as returned
+            by components().
+        perform
+            function to be called with each Package unit.
+        workers
+            maximum number of groups to be run at the same time.
+    Raises
+        Exception
+            the first exception raised by perform. Groups which have not
+            been started yet are skipped once that happens, while those
+            already running are waited for.
+    """
+
+    if workers < 2 or len(groups) < 2:
+        for group in groups:
+            for package in group:
+                perform(package)
+        return
+
+    remaining = [len(each) for each in requirements]
+    dependents = [[] for each in groups]
+    for position in range(0, len(groups)):
+        for requirement in requirements[position]:
+            dependents[requirement].append(position)
+
+    ready = [position for position in range(len(groups)-1, -1, -1) if not remaining[position]]
+    done = Queue()
+    running = 0
+    failure = None
+
+    pool = ThreadPool(workers)
+    try:
+        while ready or running:
+            while ready and running < workers and failure is None:
+                position = ready.pop()
+                pool.apply_async(_run, (perform, position, groups[position], done))
+                running = running+1
+
+            if not running:
+                break
+
+            # Waiting without a timeout would not let KeyboardInterrupt through.
+            try:
+                position, error = done.get(True, 1)
+            except Empty:
+                continue
+            running = running-1
+
+            if error:
+                if failure is None:
+                    failure = error
+                continue
+
+            for dependent in dependents[position]:
+                remaining[dependent] = remaining[dependent]-1
+                if not remaining[dependent]:
+                    ready.append(dependent)
+    finally:
+        pool.close()
+        pool.join()
+
+    if failure is not None:
+        raise failure[0], failure[1], failure[2]
@@ -0,0 +1,185 @@
+""" Measure the time spent in each phase of an operation. """
+
+# Standard library imports
+from functools import wraps
+import json
+from threading import Lock
+from time import time
+
+# Spans are only recorded once enabled, and otherwise cost a single check
+_enabled = False
+
+# Phases in the order they were first entered, each one mapped
+# to its total duration in seconds and number of spans
+_order = []
+_phases = {}
+
+# Guards the phases against spans ending on several threads
+_lock = Lock()
+
+# Callables notified whenever a span begins or ends
+_hooks = []
+
+_start = time()
+
+def enable():
+    """ Starts recording spans. """
+
+    global _enabled, _start
+    _enabled = True
+    _start = time()
+
+def enabled():
+    """ Checks whether spans are being recorded. """
+
+    return _enabled
+
+def hook(enter, exit):
+    """ Registers callables to be notified of every span. Hooks run
+    outside of the spans they are notified of, so that their cost is
+    not recorded in them, though it is in any enclosing span.
+
+    Parameters
+        enter
+            callable called with the phase's name whenever a span begins.
+        exit
+            callable called with the phase's name whenever a span ends.
+    """
+
+    _hooks.append((enter, exit))
+
+def _enter(phase):
+    for enter, exit in _hooks:
+        enter(phase)
+
+def _exit(phase):
+    for enter, exit in reversed(_hooks):
+        exit(phase)
+
+def record(phase, seconds):
+    """ Adds a span's duration to a phase.
+
+    Parameters
+        phase
+            the phase's name.
+        seconds
+            the span's duration.
+    """
+
+    with _lock:
+        try:
+            totals = _phases[phase]
+        except KeyError:
+            totals = _phases[phase] = [0.0, 0]
+            _order.append(phase)
+        totals[0] = totals[0]+seconds
+        totals[1] = totals[1]+1
+
+class span(object):
+    """ Times a block of code as a span of a phase. Spans of phases
+    nested in one another are each counted in full, so that the
+    breakdown shows, for instance, how much of loading is spent
+    on validation. """
+
+    __slots__ = ('phase', 'started')
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.started = None
+
+    def __enter__(self):
+        if _enabled:
+            if _hooks:
+                _enter(self.phase)
+            self.started = time()
+        return self
+
+    def __exit__(self, *args):
+        if self.started is not None:
+            record(self.phase, time()-self.started)
+            self.started = None
+            if _hooks:
+                _exit(self.phase)
+
+def timed(phase):
+    """ Decorates a function so that each one of its calls is a span
+    of a phase.
+
+    Parameters
+        phase
+            the phase's name.
+    """
+
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            if _hooks:
+                _enter(phase)
+            started = time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(phase, time()-started)
+                if _hooks:
+                    _exit(phase)
+        return wrapper
+
+    return decorate
+
+def breakdown():
+    """ Retrieves the recorded phases.
+
+    Returns
+        list
+            having a (phase, seconds, spans) tuple for each phase,
+            in the order the phases were first entered.
+    """
+
+    with _lock:
+        return [(phase, _phases[phase][0], _phases[phase][1]) for phase in _order]
+
+def total():
+    """ Retrieves the time elapsed since spans started being recorded. """
+
+    return time()-_start
+
+def summary():
+    """ Formats the recorded phases as a table.
+
+    Returns
+        list
+            having the table's lines.
+    """
+
+    elapsed = total()
+    lines = ['{0:<20} {1:>10} {2:>7} {3:>8}'.format('Phase', 'Seconds', '%', 'Spans')]
+    for phase, seconds, spans in breakdown():
+        lines.append('{0:<20} {1:>10.3f} {2:>7.1f} {3:>8}'.format(phase, seconds, 100*seconds/elapsed if elapsed else 0, spans))
+    lines.append('{0:<20} {1:>10.3f}'.format('total', elapsed))
+
+    return lines
+
+def dump(filepath):
+    """ Writes the recorded phases to a JSON file.
+
+    Parameters
+        filepath
+            path of the file to be written.
+    Raises
+        IOError
+            if the file could not be written.
+    """
+
+    data = {
+        'total': total(),
+        'phases': [{'phase': phase, 'seconds': seconds, 'spans': spans} for phase, seconds, spans in breakdown()]
+    }
+
+    handle = open(filepath, 'w')
+    try:
+        json.dump(data, handle, indent=4, sort_keys=True)
+        handle.write('\n')
+    finally:
+        handle.close()
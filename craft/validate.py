@@ -1,21 +1,333 @@
 """ Validate Craft's objects and data structures. """
 
 # Standard library imports
-from re import findall
+from multiprocessing import Pool
+import re
 
 # Craft imports
-import dsl.relationship
+import archive
+import timing
+
+# Version of the validation rules. Files validated under any other
+# version of them are validated again.
+VERSION = 1
+
+# Sets having at least this many package names are validated in parallel
+_parallel_threshold = 2000
+
+# Data of the set being validated in parallel, inherited by the workers
+_pending = None
+
+_identifier_pattern = re.compile('[a-z0-9\-\.]+\Z')
+
+# Relationships are valid as long as the DSL finds any fragment in them
+_relationship_pattern = re.compile('[a-z0-9\-\.]')
 
 class SemanticError(Exception):
-    """ Raised if there is a semantic error in an object or data structure. """
+    """ Raised if there is a semantic error in an object or data structure.
+
+    Attributes
+        reason
+            description of the error, if known.
+        path
+            list having the keys, and positions in lists, leading from the
+            validated data to the faulty value. Empty if not known.
+    """
+
+    def __init__(self, reason=None, path=None):
+        super(SemanticError, self).__init__(reason)
+        self.reason = reason
+        self.path = list(path or [])
+
+    def __str__(self):
+        if not self.path:
+            return self.reason or ''
+        location = '/'.join([str(key) for key in self.path])
+        if self.reason is None:
+            return location
+        return '{0}: {1}'.format(location, self.reason)
+
+# Schemas are declared with the functions below, each of which compiles
+# its part of a schema into a function checking a value against it. A
+# checker raises SemanticError if the value is invalid; checkers of
+# containers add the key of the faulty item to the front of its path.
+
+# Marks the fields missing from a record
+_missing = object()
+
+def _string(value):
+    if not isinstance(value, str):
+        raise SemanticError('not a string')
+
+def _boolean(value):
+    if not isinstance(value, bool):
+        raise SemanticError('not a boolean')
+
+def _identifier(value):
+    if not isinstance(value, str):
+        raise SemanticError('not a string')
+    elif _identifier_pattern.match(value) is None:
+        raise SemanticError("invalid identifier '{0}'".format(value))
+
+def _relationship(value):
+    if not isinstance(value, str):
+        raise SemanticError('not a string')
+    elif _relationship_pattern.search(value) is None:
+        raise SemanticError("invalid relationship '{0}'".format(value))
+
+def _version(value):
+    if not isinstance(value, (str, float, int)):
+        raise SemanticError('not a version')
+    elif _identifier_pattern.match(str(value)) is None:
+        raise SemanticError("invalid version '{0}'".format(value))
+
+def _anything(value):
     pass
 
-def set(data):
-    """ Validates a Craft set's data.
+# Checks of the strings matching a pattern, which lists of them
+# run without calling the string's checker unless it is invalid
+_patterns = {
+    _identifier: _identifier_pattern.match,
+    _relationship: _relationship_pattern.search
+}
+
+def _nullable(checker):
+    """ Compiles a schema also allowing None. Records skip calling the
+    check for None values altogether. """
+
+    def check(value):
+        if value is not None:
+            checker(value)
+
+    check.checker = checker
+    return check
+
+def _integer(types, minimum):
+    """ Compiles a schema for integers of some types, booleans excluded,
+    no smaller than a minimum. """
+
+    def check(value):
+        if not isinstance(value, types) or isinstance(value, bool):
+            raise SemanticError('not an integer')
+        elif value < minimum:
+            raise SemanticError('smaller than {0}'.format(minimum))
+
+    return check
+
+def _member(choices):
+    """ Compiles a schema for one of some values. """
+
+    def check(value):
+        try:
+            if value in choices:
+                return
+        except TypeError:
+            pass
+        raise SemanticError("unknown value '{0}'".format(value))
+
+    return check
+
+def _sequence(item):
+    """ Compiles a schema for lists having items of a schema. """
+
+    test = _patterns.get(item)
+
+    if item is _string:
+        def check(value):
+            if not isinstance(value, list):
+                raise SemanticError('not a list')
+            for each in value:
+                if not isinstance(each, str):
+                    raise SemanticError('not a string', [value.index(each)])
+    elif test is not None:
+        def check(value):
+            if not isinstance(value, list):
+                raise SemanticError('not a list')
+            for each in value:
+                if not isinstance(each, str) or test(each) is None:
+                    try:
+                        item(each)
+                    except SemanticError as error:
+                        error.path.insert(0, value.index(each))
+                        raise
+    else:
+        def check(value):
+            if not isinstance(value, list):
+                raise SemanticError('not a list')
+            for each in value:
+                try:
+                    item(each)
+                except SemanticError as error:
+                    error.path.insert(0, value.index(each))
+                    raise
+
+    return check
+
+def _mapping(key, item):
+    """ Compiles a schema for dicts having keys and values of a schema. """
+
+    if key is _string and item is _string:
+        def check(value):
+            if not isinstance(value, dict):
+                raise SemanticError('not a mapping')
+            for name, each in value.iteritems():
+                if not isinstance(name, str):
+                    raise SemanticError('not a string', [name])
+                elif not isinstance(each, str):
+                    raise SemanticError('not a string', [name])
+    else:
+        def check(value):
+            if not isinstance(value, dict):
+                raise SemanticError('not a mapping')
+            for name, each in value.iteritems():
+                try:
+                    key(name)
+                    item(each)
+                except SemanticError as error:
+                    error.path.insert(0, name)
+                    raise
+
+    return check
+
+def _fields(schemas):
+    """ Lists the fields of a record, each one along with its check and
+    whether it may be None. """
+
+    fields = []
+    for name, item in (schemas or {}).iteritems():
+        try:
+            fields.append((name, item.checker, True))
+        except AttributeError:
+            fields.append((name, item, False))
+
+    return tuple(fields)
+
+def _record(required=None, optional=None, closed=False):
+    """ Compiles a schema for dicts having specific keys.
+
+    Parameters
+        required
+            dict mapping the keys that must be present to their schemas.
+        optional
+            dict mapping the keys that may be present to their schemas.
+        closed
+            whether keys neither required nor optional are rejected.
+    """
+
+    required = _fields(required)
+    optional = _fields(optional)
+    known = frozenset([name for name, item, nullable in required+optional])
+
+    def check(value):
+        if not isinstance(value, dict):
+            raise SemanticError('not a mapping')
+
+        # The field being checked is the one an error is found in
+        name = None
+        try:
+            for name, item, nullable in required:
+                each = value.get(name, _missing)
+                if each is None:
+                    if not nullable:
+                        item(each)
+                elif each is _missing:
+                    raise SemanticError('missing')
+                else:
+                    item(each)
+            for name, item, nullable in optional:
+                each = value.get(name)
+                if each is not None:
+                    item(each)
+                elif not nullable and name in value:
+                    item(each)
+        except SemanticError as error:
+            error.path.insert(0, name)
+            raise
+
+        if closed:
+            for name in value:
+                if name not in known:
+                    raise SemanticError('unknown key', [name])
+
+    return check
+
+def _constraint(checker, test, reason):
+    """ Compiles a schema for values of another schema,
+    which must also pass a test. """
+
+    def check(value):
+        checker(value)
+        if not test(value):
+            raise SemanticError(reason)
+
+    return check
+
+_package = _record(
+    required={
+        'checksums': _nullable(_mapping(_string, _string)),
+        'files': _record(required={'static': _nullable(_sequence(_string))}),
+        'depends': _nullable(_sequence(_relationship)),
+        'conflicts': _nullable(_sequence(_relationship)),
+        'replaces': _nullable(_sequence(_relationship)),
+        'provides': _nullable(_sequence(_identifier)),
+        'groups': _nullable(_sequence(_identifier)),
+        'flags': _nullable(_sequence(_string)),
+        'information': _record(required={
+            'maintainers': _nullable(_sequence(_string)),
+            'tags': _nullable(_sequence(_string)),
+            'misc': _nullable(_mapping(_string, _string))
+        })
+    },
+    optional={
+        'format': _nullable(_member(archive.FORMATS)),
+        'size': _nullable(_integer((int, long), 0))
+    }
+)
+
+# A set maps each package name to its versions, each version to its
+# architectures, and each architecture to the package's definition
+_versions = _mapping(_version, _mapping(_identifier, _package))
+
+_configuration = _record(
+    required={
+        'repositories': _nullable(_mapping(_anything, _record(
+            required={'target': _string, 'handler': _string},
+            optional={'env': _mapping(_string, _anything)}
+        ))),
+        'architectures': _constraint(
+            _record(required={'default': _identifier, 'enabled': _sequence(_identifier)}),
+            lambda architectures: architectures['default'] in architectures['enabled'],
+            'the default architecture is not enabled'
+        ),
+        'groups': _nullable(_sequence(_string)),
+        'db': _nullable(_string),
+        'root': _nullable(_string)
+    },
+    optional={
+        'workers': _nullable(_integer(int, 1)),
+        'cache_size': _nullable(_integer(int, 1)),
+        'events': _nullable(_record(
+            optional={
+                'console': _boolean,
+                'jsonl': _nullable(_string),
+                'prometheus': _nullable(_string)
+            },
+            closed=True
+        ))
+    }
+)
+
+@timing.timed('validate')
+def set(data, workers=1):
+    """ Validates a Craft set's data. Large sets are validated in parallel,
+    by chunks of package names, and validation stops as soon as any
+    chunk is found to be invalid.
 
     Parameters
         data
             the set's data.
+        workers
+            number of processes the validation may be split across.
     Raises
         SemanticError
             if the data does not properly represent a Craft Set.
@@ -28,40 +340,79 @@ def set(data):
             definition.
     """
 
+    global _pending
+
     if not isinstance(data, dict):
-        raise SemanticError
-
-    for name in data.iterkeys():
-        if not isinstance(name, str):
-            raise SemanticError
-        elif not identifier(name):
-            raise SemanticError
-        elif not isinstance(data[name], dict):
-            raise SemanticError
-
-        for version in data[name].iterkeys():
-            if not isinstance(version, (str, float, int)):
-                raise SemanticError
-            elif not identifier(version):
-                raise SemanticError
-            elif not isinstance(data[name][version], dict):
-                raise SemanticError
-
-            for architecture in data[name][version].iterkeys():
-                if not isinstance(architecture, str):
-                    raise SemanticError
-                elif not identifier(architecture):
-                    raise SemanticError
-                elif not isinstance(data[name][version][architecture], dict):
-                    raise SemanticError
+        raise SemanticError('not a mapping')
 
-                try:
-                    package(data[name][version][architecture])
-                except SemanticError:
-                    raise
+    names = data.keys()
+    if workers < 2 or len(names) < _parallel_threshold:
+        _entries(data, names)
+        return True
+
+    size = max(1, len(names)/(workers*4))
+    chunks = [names[position:position+size] for position in range(0, len(names), size)]
+
+    # Workers are forked, and so inherit the data instead of receiving it;
+    # only the names of each chunk are sent to them
+    _pending = data
+    try:
+        pool = Pool(workers)
+        try:
+            for failure in pool.imap_unordered(_chunk, chunks):
+                if failure is not None:
+                    raise SemanticError(*failure)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    finally:
+        _pending = None
 
     return True
 
+def _chunk(names):
+    """ Validates some of the packages of the set being validated.
+    Runs on a worker process.
+
+    Returns
+        None
+            if the packages are valid.
+        tuple
+            having the error's reason and path otherwise.
+    """
+
+    try:
+        _entries(_pending, names)
+    except SemanticError as error:
+        return error.reason, error.path
+
+    return None
+
+def _entries(data, names):
+    """ Validates some of the packages of a Craft set's data.
+
+    Parameters
+        data
+            the set's data.
+        names
+            iterable having the names of the packages to be validated.
+    Raises
+        SemanticError
+            if any of the packages is not properly defined.
+    """
+
+    for name in names:
+        try:
+            _identifier(name)
+            _versions(data[name])
+        except SemanticError as error:
+            error.path.insert(0, name)
+            raise
+
 def package(data):
     """ Validates a Craft package's data.
 
@@ -76,66 +427,7 @@ def package(data):
             if the data properly represents a Craft package's definition.
     """
 
-    try:
-        checksums = data['checksums']
-        files_static = data['files']['static']
-        depends = data['depends']
-        conflicts = data['conflicts']
-        replaces = data['replaces']
-        provides = data['provides']
-        groups = data['groups']
-        flags = data['flags']
-        maintainers = data['information']['maintainers']
-        tags = data['information']['tags']
-        misc = data['information']['misc']
-    except KeyError:
-        raise SemanticError
-    except TypeError:
-        raise SemanticError
-
-    must_be_str_list = [
-            files_static, depends, conflicts,
-            replaces, provides, groups,
-            flags, tags, maintainers
-    ]
-    for each in must_be_str_list:
-        if each is not None:
-            if not isinstance(each, list):
-                raise SemanticError
-            for subeach in each:
-                if not isinstance(subeach, str):
-                    raise SemanticError
-
-    must_be_str_dict = [
-        checksums, misc
-    ]
-    for each in must_be_str_dict:
-        if each is not None:
-            if not isinstance(each, dict):
-                raise SemanticError
-            for subeach in each.iterkeys():
-                if not isinstance(subeach, str):
-                    raise SemanticError
-                elif not isinstance(each[subeach], str):
-                    raise SemanticError
-
-    must_have_valid_identifiers = [
-            groups, provides
-    ]
-    for each in must_have_valid_identifiers:
-        if each is not None:
-            for subeach in each:
-                if not identifier(subeach):
-                    raise SemanticError
-
-    must_have_valid_relationships = [
-        depends, conflicts, replaces
-    ]
-    for each in must_have_valid_relationships:
-        if each is not None:
-            for subeach in each:
-                if not dsl.relationship.parse(subeach):
-                    raise SemanticError
+    _package(data)
 
     return True
 
@@ -153,75 +445,7 @@ def configuration(data):
             if the data properly represents a valid Craft configuration.
     """
 
-    if not isinstance(data, dict):
-        raise SemanticError
-
-    try:
-        repositories = data['repositories']
-        if isinstance(repositories, dict):
-            for repository in repositories:
-                if not isinstance(repositories[repository], dict):
-                    raise SemanticError
-                target = repositories[repository]['target']
-                handler = repositories[repository]['handler']
-                if not isinstance(target, str):
-                    raise SemanticError
-                elif not isinstance(handler, str):
-                    raise SemanticError
-                try:
-                    env = repositories[repository]['env']
-                    if not isinstance(env, dict):
-                        raise SemanticError
-                    for variable in env:
-                        if not isinstance(variable, str):
-                            raise SemanticError
-                except KeyError:
-                    pass
-        elif repositories is not None:
-            raise SemanticError
-    except KeyError:
-        raise SemanticError
-
-    try:
-        architectures = data['architectures']
-        if not isinstance(architectures, dict):
-            raise SemanticError
-        elif not isinstance(architectures['default'], str):
-            raise SemanticError
-        elif not identifier(architectures['default']):
-            raise SemanticError
-        elif not isinstance(architectures['enabled'], list):
-            raise SemanticError
-        elif not architectures['default'] in architectures['enabled']:
-            raise SemanticError
-    except KeyError:
-        raise SemanticError
-    for architecture in architectures['enabled']:
-        if not isinstance(architecture, str):
-            raise SemanticError
-        elif not identifier(architecture):
-            raise SemanticError
-
-    try:
-        groups = data['groups']
-    except KeyError:
-        raise SemanticError
-    if isinstance(groups, list):
-        for group in groups:
-            if not isinstance(group, str):
-                raise SemanticError
-    elif groups is not None:
-        raise SemanticError
-
-    try:
-        db = data['db']
-        root = data['root']
-    except KeyError:
-        raise SemanticError
-    if db is not None and not isinstance(db, str):
-        raise SemanticError
-    elif root is not None and not isinstance(root, str):
-        raise SemanticError
+    _configuration(data)
 
     return True
 
@@ -238,13 +462,4 @@ def identifier(target):
             if the identifier is invalid.
     """
 
-    target = str(target)
-    r = findall('([a-z0-9\-\.]+)', target)
-
-    try:
-        if r[0] == target:
-            return True
-    except IndexError:
-        pass
-
-    return False
+    return _identifier_pattern.match(str(target)) is not None
@@ -1,79 +1,682 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from os import remove
+from os import chmod, makedirs, remove, utime
+from os.path import abspath, dirname, isdir, join, lexists
 from shutil import rmtree
+from tempfile import mkdtemp
 from glob import glob
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+import copy
+import hashlib
+import json
+import tarfile
 
 import sys, os, unittest
-sys.path.append(os.path.abspath('../lib'))
 
+here = dirname(abspath(__file__))
+sys.path.insert(0, dirname(here))
+
+import craft.actions
 import craft.archive
-import craft.configuration
+import craft.cache
+import craft.closure
+import craft.dsl.version
+import craft.elements
+import craft.integrity
 import craft.load
-import craft.dialects
+import craft.ownership
+import craft.removal
+import craft.schedule
 import craft.validate
 
+def fixture(path):
+    return join(here, path)
+
+def package(name, version='1.0', depends=None, provides=None, checksums=None):
+    """ Builds a Package unit from a minimal definition. """
+
+    return craft.elements.Package(name, version, 'amd64', 'main', {
+        'checksums': checksums,
+        'files': {'static': None},
+        'depends': depends,
+        'conflicts': None,
+        'replaces': None,
+        'provides': provides,
+        'groups': None,
+        'flags': None,
+        'information': {'maintainers': None, 'tags': None, 'misc': None}
+    })
+
+def names(units):
+    return sorted([str(unit) for unit in units])
+
+def environment(directory):
+    """ Builds a Configuration whose database and root directories are
+    found in a temporary directory. """
+
+    makedirs(directory+'/db/available')
+    makedirs(directory+'/root')
+    return craft.elements.Configuration({
+        'repositories': None,
+        'architectures': {'default': 'amd64', 'enabled': ['amd64']},
+        'groups': None,
+        'db': directory+'/db/',
+        'root': directory+'/root/'
+    })
+
+def tarball(filepath, members, content=''):
+    """ Writes a gzipped archive. Members ending with a slash are
+    directories, while each file holds its own name and the content.
+
+    Returns
+        string
+            the archive's SHA-1 digest.
+    """
+
+    handle = tarfile.open(filepath, 'w:gz')
+    for member in members:
+        info = tarfile.TarInfo(member.rstrip('/'))
+        info.mtime = 1
+        if member.endswith('/'):
+            info.type = tarfile.DIRTYPE
+            info.mode = 0755
+            handle.addfile(info)
+        else:
+            data = member+content
+            info.mode = 0644
+            info.size = len(data)
+            handle.addfile(info, BytesIO(data))
+    handle.close()
+
+    handle = open(filepath, 'rb')
+    digest = hashlib.sha1(handle.read()).hexdigest()
+    handle.close()
+    return digest
+
 class Version_Tests(unittest.TestCase):
     def test_parse(self):
-        self.assertEqual(craft.dialects.version.parse(''), False)
-        self.assertEqual(craft.dialects.version.parse('-.-.-.-'), False)
-        self.assertEqual(craft.dialects.version.parse('0.127a.15-rc2.XX.3-2alPhA------TEST'), [0, 127, 'a', 15, 'rc', 2, 'xx', 3, 2, 'alphatest'])
-        self.assertEqual(craft.dialects.version.parse('P-Y-T-H-O-N2,7,6'), ['python', 2, 7, 6])
-        self.assertEqual(craft.dialects.version.parse('P-Y-T-H-O-N2,7,6dev'), ['python', 2, 7, 6, 'dev'])
-        self.assertEqual(craft.dialects.version.parse('p-y-t-h-o-n'), ['python'])
-        self.assertEqual(craft.dialects.version.parse('p-y-t-h-o-n2,7,6'), ['python', 2, 7, 6])
-        self.assertEqual(craft.dialects.version.parse('p-y-t-h-o-n2.7.6'), ['python', 2, 7, 6])
-        self.assertEqual(craft.dialects.version.parse('py-th-on2.7.6dev'), ['python', 2, 7, 6, 'dev'])
+        self.assertEqual(craft.dsl.version.parse(''), False)
+        self.assertEqual(craft.dsl.version.parse('-.-.-.-'), False)
+        self.assertEqual(craft.dsl.version.parse('0.127a.15-rc2.XX.3-2alPhA------TEST'), [0, 127, 'a', 15, 'rc', 2, 'xx', 3, 2, 'alphatest'])
+        self.assertEqual(craft.dsl.version.parse('P-Y-T-H-O-N2,7,6'), ['python', 2, 7, 6])
+        self.assertEqual(craft.dsl.version.parse('P-Y-T-H-O-N2,7,6dev'), ['python', 2, 7, 6, 'dev'])
+        self.assertEqual(craft.dsl.version.parse('p-y-t-h-o-n'), ['python'])
+        self.assertEqual(craft.dsl.version.parse('p-y-t-h-o-n2,7,6'), ['python', 2, 7, 6])
+        self.assertEqual(craft.dsl.version.parse('p-y-t-h-o-n2.7.6'), ['python', 2, 7, 6])
+        self.assertEqual(craft.dsl.version.parse('py-th-on2.7.6dev'), ['python', 2, 7, 6, 'dev'])
 
     # Use the expected integer as the first parameter, for legibility.
     def test_compare(self):
-        self.assertEqual(-1, craft.dialects.version.compare('3.2rc0', '3.2-rc1'))
-        self.assertEqual(0, craft.dialects.version.compare('',''))
-        self.assertEqual(0, craft.dialects.version.compare('1.0', '1.0'))
-        self.assertEqual(0, craft.dialects.version.compare('1.0-A', '1.0a'))
-        self.assertEqual(0, craft.dialects.version.compare('1.0-a', '1.0a'))
-        self.assertEqual(0, craft.dialects.version.compare('1.0a', '1.0a'))
-        self.assertEqual(0, craft.dialects.version.compare('pre-alpha', 'prealpha'))
-        self.assertEqual(0, craft.dialects.version.compare('pre-alpha-1', 'prealpha1'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0', '1'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0-aa', '1.0a'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0-ab', '1.0a'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0.1', '1.0'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0.1', '1.0.1dev'))
-        self.assertEqual(1, craft.dialects.version.compare('1.0aa', '1.0a'))
-        self.assertEqual(1, craft.dialects.version.compare('3.2', '3.2-rc1'))
-        self.assertEqual(1, craft.dialects.version.compare('3.2-9999', '3.2-9998'))
-        self.assertEqual(1, craft.dialects.version.compare('3.2-final', '3.2beta'))
-        self.assertEqual(1, craft.dialects.version.compare('3.2final', '3.2beta'))
+        self.assertEqual(-1, craft.dsl.version.compare('3.2rc0', '3.2-rc1'))
+        self.assertEqual(0, craft.dsl.version.compare('',''))
+        self.assertEqual(0, craft.dsl.version.compare('1.0', '1.0'))
+        self.assertEqual(0, craft.dsl.version.compare('1.0-A', '1.0a'))
+        self.assertEqual(0, craft.dsl.version.compare('1.0-a', '1.0a'))
+        self.assertEqual(0, craft.dsl.version.compare('1.0a', '1.0a'))
+        self.assertEqual(0, craft.dsl.version.compare('pre-alpha', 'prealpha'))
+        self.assertEqual(0, craft.dsl.version.compare('pre-alpha-1', 'prealpha1'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0', '1'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0-aa', '1.0a'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0-ab', '1.0a'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0.1', '1.0'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0.1', '1.0.1dev'))
+        self.assertEqual(1, craft.dsl.version.compare('1.0aa', '1.0a'))
+        self.assertEqual(1, craft.dsl.version.compare('3.2', '3.2-rc1'))
+        self.assertEqual(1, craft.dsl.version.compare('3.2-9999', '3.2-9998'))
+        self.assertEqual(1, craft.dsl.version.compare('3.2-final', '3.2beta'))
+        self.assertEqual(1, craft.dsl.version.compare('3.2final', '3.2beta'))
 
 class Archive_GetFilesTest(unittest.TestCase):
     def runTest(self):
-        self.assertEqual(craft.archive.getfiles('archive/working1.tar.gz'), ['./foo'])
-        self.assertEqual(craft.archive.getfiles('does_not_exist.tar.gz'), False)
+        self.assertEqual(sorted(craft.archive.getfiles(fixture('archive/working1.tar.gz'))), ['.', './.craft', './.craft/postinst', './.craft/postrm', './.craft/preinst', './.craft/prerm', './foo'])
+        self.assertEqual(craft.archive.getfiles(fixture('does_not_exist.tar.gz')), False)
 
 class Archive_ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.destination = mkdtemp()
+
     def runTest(self):
-        self.assertEqual(craft.archive.extract('archive/working1.tar.gz'), True)
-        self.assertEqual(craft.archive.extract('does_not_exist.tar.gz'), False)
+        self.assertEqual(craft.archive.extract(fixture('archive/working1.tar.gz'), self.destination), True)
+        self.assertTrue(lexists(join(self.destination, 'foo')))
+        self.assertEqual(craft.archive.extract(fixture('does_not_exist.tar.gz'), self.destination), False)
 
     def tearDown(self):
-        rmtree('.craft')
-        remove('foo')
+        rmtree(self.destination)
+
+class Archive_ConcurrentExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def runTest(self):
+        # Neither archive has the directories both of them extract into
+        archives = []
+        for name in ('first', 'second'):
+            archives.append(join(self.directory, name+'.tar.gz'))
+            tarball(archives[-1], ['./usr/share/{0}/{1}'.format(depth, name) for depth in range(0, 50)])
+
+        for attempt in range(0, 20):
+            destination = join(self.directory, 'root{0}'.format(attempt))
+            pool = ThreadPool(2)
+            try:
+                results = pool.map(lambda filepath: craft.archive.extract(filepath, destination), archives)
+            finally:
+                pool.close()
+                pool.join()
+            self.assertEqual(results, [True, True])
+            self.assertTrue(lexists(join(destination, 'usr/share/49/first')))
+            self.assertTrue(lexists(join(destination, 'usr/share/49/second')))
+
+    def tearDown(self):
+        rmtree(self.directory)
 
 class Configuration_Tests(unittest.TestCase):
     def test_Configuration(self):
-        for working in glob('configuration/working*.yml'):
-            self.assertIsInstance(craft.configuration.Configuration(craft.load.yaml(working)), craft.configuration.Configuration)
-        for not_working in glob('configuration/not_working*.yml'):
-            self.assertRaises(craft.validate.ConfigurationError, craft.validate.configuration, craft.load.yaml(not_working))
+        for working in glob(fixture('configuration/working*.yml')):
+            self.assertTrue(craft.validate.configuration(craft.load.yaml(working)))
+            self.assertIsInstance(craft.elements.Configuration(craft.load.yaml(working)), craft.elements.Configuration)
+        for not_working in glob(fixture('configuration/not_working*.yml')):
+            self.assertRaises(craft.validate.SemanticError, craft.validate.configuration, craft.load.yaml(not_working))
 
 class Validate_Tests(unittest.TestCase):
-    def test_repository(self):
-        for working in glob('validate/package/working*.yml'):
-            self.assertTrue(craft.validate.repository(craft.load.yaml(working)))
-        for not_working in glob('validate/package/not_working*.yml'):
-            self.assertRaises(craft.validate.PackageError, craft.validate.repository, craft.load.yaml(not_working))
+    def test_set(self):
+        for working in glob(fixture('validate/package/working*.yml')):
+            self.assertTrue(craft.validate.set(craft.load.yaml(working)))
+        for not_working in glob(fixture('validate/package/not_working*.yml')):
+            self.assertRaises(craft.validate.SemanticError, craft.validate.set, craft.load.yaml(not_working))
+
+    def test_set_in_parallel(self):
+        data = craft.load.yaml(fixture('validate/package/working2.yml'))
+        for position in range(0, craft.validate._parallel_threshold):
+            data['package{0}'.format(position)] = data['perl-src']
+        self.assertTrue(craft.validate.set(data, 2))
+
+        data['package7'] = {'1.0': {'amd64': {}}}
+        with self.assertRaises(craft.validate.SemanticError) as raised:
+            craft.validate.set(data, 2)
+        self.assertEqual(raised.exception.path[:3], ['package7', '1.0', 'amd64'])
+        self.assertEqual(craft.validate._pending, None)
+
+class Closure_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.configuration = environment(self.directory)
+        self.a = package('a', depends=['b:amd64'])
+        self.b = package('b', depends=['c:amd64'])
+        self.c = package('c')
+        self.d = package('d', depends=['virtual'])
+        self.e = package('e', depends=['f:amd64'])
+        self.f = package('f', depends=['e:amd64'], provides=['virtual'])
+        self.available = craft.elements.Set([self.a, self.b, self.c, self.d, self.e, self.f])
+        self.closures = craft.closure.build(self.configuration, self.available)
+
+    def test_closure(self):
+        units, unresolved = self.closures.closure(self.a)
+        self.assertEqual(names(units), names([self.a, self.b, self.c]))
+        self.assertEqual(unresolved, [])
+
+        units, unresolved = self.closures.closure(self.d)
+        self.assertEqual(names(units), names([self.d]))
+        self.assertEqual(unresolved, [self.d])
+
+        self.assertEqual(self.closures.closure(package('unknown')), False)
+
+    def test_subtraction(self):
+        units, unresolved = self.closures.closure(self.a, craft.elements.Set([self.b]))
+        self.assertEqual(names(units), names([self.a]))
+
+        units, unresolved = self.closures.closure(self.a, craft.elements.Set(), craft.elements.Set([self.c]))
+        self.assertEqual(names(units), names([self.a, self.b]))
+
+        # A dependency cycle which is only partly installed
+        self.assertEqual(self.closures.closure(self.e, craft.elements.Set([self.f])), False)
+
+        # Another version of a dependency is installed or targeted
+        self.assertEqual(self.closures.closure(self.a, craft.elements.Set([package('c', '0.9')])), False)
+        self.assertEqual(self.closures.closure(self.a, craft.elements.Set(), craft.elements.Set([package('b', '0.9')])), False)
+
+    def test_signature(self):
+        signature = craft.closure._signature(self.configuration)
+        self.configuration.data['architectures']['enabled'].append('i386')
+        self.assertNotEqual(craft.closure._signature(self.configuration), signature)
+
+    def test_repaired_dependency(self):
+        g = package('g', depends=['h:amd64'])
+        h = package('h')
+        closures = craft.closure.build(self.configuration, craft.elements.Set([g]))
+        available = craft.elements.Set([g, h])
+        closures.bind(available)
+        to_install = craft.elements.Set()
+        craft.closure.target_for_installation(closures, g, craft.elements.Set(), available, craft.elements.Set([g]), craft.elements.Set(), to_install)
+        self.assertEqual(names(to_install), names([g, h]))
+
+    def test_unbound(self):
+        self.closures.bind(craft.elements.Set([self.a, self.b]))
+        self.assertEqual(self.closures.closure(self.a), False)
+
+    def test_persisted(self):
+        craft.closure.load(self.configuration, self.available)
+        closures = craft.closure.load(self.configuration, self.available)
+        self.assertEqual(names(closures.closure(self.a)[0]), names([self.a, self.b, self.c]))
+
+    def test_target_for_installation(self):
+        for target in (self.a, self.e):
+            results = []
+            for closures in (self.closures, None):
+                installed = craft.elements.Set([self.c])
+                targeted = craft.elements.Set()
+                to_install = craft.elements.Set()
+                if closures is None:
+                    target.target_for_installation(installed, self.available, craft.elements.Set([target]), targeted, to_install)
+                else:
+                    craft.closure.target_for_installation(closures, target, installed, self.available, craft.elements.Set([target]), targeted, to_install)
+                results.append(names(to_install))
+            self.assertEqual(results[0], results[1])
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Set_Tests(unittest.TestCase):
+    def setUp(self):
+        self.a = package('a')
+        self.b = package('b')
+        self.c = package('c')
+
+    def test_index(self):
+        units = craft.elements.Set([self.a, self.b])
+        units |= set([self.c])
+        self.assertEqual(units.target('c:amd64'), self.c)
+        units -= set([self.a])
+        self.assertEqual(units.target('a:amd64'), False)
+        units &= set([self.b])
+        self.assertEqual(units.target('c:amd64'), False)
+        units ^= set([self.b, self.a])
+        self.assertEqual((units.target('a:amd64'), units.target('b:amd64')), (self.a, False))
+
+        units.intersection_update([self.b])
+        self.assertEqual(units.target('a:amd64'), False)
+        units.symmetric_difference_update([self.c])
+        units.difference_update([self.a])
+        self.assertEqual(units.target('c:amd64'), self.c)
+
+        copied = units.copy()
+        self.assertIsInstance(copied, craft.elements.Set)
+        self.assertEqual(copied.pop(), self.c)
+        self.assertEqual((copied.target('c:amd64'), units.target('c:amd64')), (False, self.c))
+
+class Ownership_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.configuration = environment(self.directory)
+        makedirs(self.directory+'/db/installed/a/1.0/amd64')
+        handle = open(self.directory+'/db/installed/a/1.0/amd64/files', 'w')
+        handle.write('./usr/\n./usr/bin/a\n')
+        handle.close()
+        self.a = package('a')
+        self.b = package('b')
+
+    def test_build(self):
+        self.assertEqual(craft.ownership.owners(self.configuration, self.directory+'/root/usr/bin/a'), [str(self.a)])
+        self.assertEqual(craft.ownership.owners(self.configuration, 'usr/bin/b'), [])
+
+    def test_collisions(self):
+        index = craft.ownership.Index(self.configuration)
+        entries = [('./usr/', True), ('./usr/bin/a', False), ('./usr/bin/b', False)]
+        try:
+            self.assertEqual(index.collisions(self.b, entries), [('./usr/bin/a', str(self.a))])
+            self.assertEqual(index.collisions(self.a, entries), [])
+
+            index.add(self.b, ['./usr/', './usr/bin/b'])
+            self.assertEqual(index.owners('usr'), [str(self.a), str(self.b)])
+            self.assertEqual(index.collisions(self.a, entries), [('./usr/bin/b', str(self.b))])
+
+            index.remove(self.a, ['./usr/', './usr/bin/a'])
+            self.assertEqual(index.collisions(self.b, entries), [])
+            self.assertEqual(index.owners('usr/bin/a'), [])
+        finally:
+            index.close()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Integrity_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.configuration = environment(self.directory)
+        makedirs(self.directory+'/db/installed/a/1.0/amd64')
+        makedirs(self.directory+'/root/usr')
+        for path in ('usr/first', 'usr/second', 'usr/third'):
+            handle = open(self.directory+'/root/'+path, 'w')
+            handle.write(path)
+            handle.close()
+        self.a = package('a')
+        craft.integrity.record(self.configuration, self.a, ['usr/', 'usr/first', 'usr/second', 'usr/third'])
+
+    def test_verify(self):
+        self.assertEqual(craft.integrity.verify(self.configuration, [self.a], 1), {self.a: []})
+
+        handle = open(self.directory+'/root/usr/first', 'w')
+        handle.write('usr/tsrif')
+        handle.close()
+        utime(self.directory+'/root/usr/first', (0, 0))
+        handle = open(self.directory+'/root/usr/second', 'a')
+        handle.write('more')
+        handle.close()
+        remove(self.directory+'/root/usr/third')
+
+        self.assertEqual(craft.integrity.verify(self.configuration, [self.a], 2), {self.a: [
+            ('usr/first', 'checksum mismatch'),
+            ('usr/second', 'size mismatch'),
+            ('usr/third', 'missing')
+        ]})
+
+    def test_unrecorded(self):
+        b = package('b')
+        self.assertEqual(craft.integrity.verify(self.configuration, [b], 1), {b: None})
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Removal_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        makedirs(self.directory+'/tree/sub')
+        makedirs(self.directory+'/tree/kept')
+        for path in ('tree/sub/first', 'tree/second', 'tree/kept/other'):
+            open(join(self.directory, path), 'w').close()
+
+    def test_scan(self):
+        paths = [join(self.directory, path) for path in ('tree/sub/first', 'tree/sub', 'missing')]
+        entries, refused = craft.removal.scan(paths)
+        self.assertEqual([entry.path for entry in entries], paths[:2])
+        self.assertEqual([entry.is_directory() for entry in entries], [False, True])
+        self.assertEqual(refused, paths[2:])
+
+    def test_writable(self):
+        path = join(self.directory, 'tree/second')
+        chmod(path, 0444)
+        entry = craft.removal.scan([path])[0][0]
+        self.assertFalse(entry.is_writable(entry.status.st_uid+1, set()))
+        self.assertTrue(entry.is_writable(0, set()))
+
+    def test_run(self):
+        paths = [join(self.directory, path) for path in ('tree', 'tree/sub', 'tree/sub/first', 'tree/second', 'tree/kept')]
+        entries, refused = craft.removal.scan(paths)
+        failed = craft.removal.run(entries, 1)
+        self.assertEqual(sorted(failed), sorted([paths[0], paths[4]]))
+        self.assertFalse(lexists(paths[1]))
+        self.assertFalse(lexists(paths[3]))
+        self.assertTrue(lexists(join(self.directory, 'tree/kept/other')))
+
+    def test_run_in_parallel(self):
+        paths = []
+        for position in range(0, craft.removal._parallel_threshold):
+            paths.append(join(self.directory, 'tree/sub/file{0}'.format(position)))
+            open(paths[-1], 'w').close()
+        entries, refused = craft.removal.scan(paths)
+        self.assertEqual(craft.removal.run(entries, 4), [])
+        self.assertEqual(glob(self.directory+'/tree/sub/file*'), [])
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Schedule_Tests(unittest.TestCase):
+    def setUp(self):
+        self.a = package('a', depends=['b:amd64'])
+        self.b = package('b', depends=['c:amd64'])
+        self.c = package('c')
+        self.e = package('e', depends=['f:amd64'])
+        self.f = package('f', depends=['e:amd64'])
+        self.x = package('x')
+
+    def test_components(self):
+        groups, requirements = craft.schedule.components([self.a, self.b, self.c, self.e, self.f, self.x])
+        self.assertEqual(sorted([names(group) for group in groups if len(group) > 1]), [names([self.e, self.f])])
+        for position in range(0, len(groups)):
+            for requirement in requirements[position]:
+                self.assertTrue(requirement < position)
+
+    def test_failure(self):
+        for workers in (1, 4):
+            performed = []
+            def perform(unit):
+                if unit is self.b:
+                    raise IOError('failed')
+                performed.append(unit)
+
+            groups, requirements = craft.schedule.components([self.a, self.b, self.c, self.x])
+            self.assertRaises(IOError, craft.schedule.execute, groups, requirements, perform, workers)
+            self.assertTrue(self.c in performed)
+            self.assertFalse(self.a in performed)
+
+    def test_parallel(self):
+        performed = []
+        groups, requirements = craft.schedule.components([self.a, self.b, self.c, self.e, self.f, self.x])
+        craft.schedule.execute(groups, requirements, performed.append, 4)
+        self.assertEqual(names(performed), names([self.a, self.b, self.c, self.e, self.f, self.x]))
+        self.assertTrue(performed.index(self.c) < performed.index(self.b) < performed.index(self.a))
+
+    def test_plan(self):
+        plan = craft.schedule.Plan([self.a, self.b, self.c, self.e, self.f, self.x])
+        order = list(plan)
+        self.assertEqual(len(plan), 6)
+        self.assertTrue(self.x in plan)
+        self.assertTrue(order.index(self.c) < order.index(self.b) < order.index(self.a))
+        self.assertEqual([names(group) for group in plan.cycles()], [names([self.e, self.f])])
+
+        order = list(craft.schedule.Plan([self.a, self.b, self.c], True))
+        self.assertEqual(order, [self.a, self.b, self.c])
+
+class Replace_Tests(unittest.TestCase):
+    """ Staged replacement of an installed package by another version. """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.configuration = environment(self.directory)
+        self.installed = craft.elements.Set()
+        self.old, self.old_archive = self.build('1.0', ['./usr/', './usr/share/', './usr/share/a/', './usr/share/a/first', './usr/share/a/second'])
+        self.new, self.new_archive = self.build('2.0', ['./usr/', './usr/share/', './usr/share/a/', './usr/share/a/first', './usr/share/a/third'])
+        craft.actions._install(self.configuration, self.installed, self.old, self.old_archive)
+
+    def build(self, version, members):
+        filepath = '{0}/a-{1}.tar.gz'.format(self.directory, version)
+        digest = tarball(filepath, members, ' '+version)
+        return package('a', version, checksums={'sha1': digest}), filepath
+
+    def files(self):
+        found = {}
+        for path in glob(self.directory+'/root/usr/share/a/*'):
+            if isdir(path):
+                continue
+            handle = open(path)
+            found[path[len(self.directory+'/root/'):]] = handle.read()
+            handle.close()
+        return found
+
+    def replace(self):
+        return craft.actions._replace(self.configuration, self.installed, self.old, self.new, self.new_archive)
+
+    def test_replace(self):
+        self.assertTrue(self.replace())
+        self.assertEqual(self.files(), {
+            'usr/share/a/first': './usr/share/a/first 2.0',
+            'usr/share/a/third': './usr/share/a/third 2.0'
+        })
+        self.assertEqual(craft.ownership.owners(self.configuration, 'usr/share/a/first'), [str(self.new)])
+        self.assertEqual(craft.ownership.owners(self.configuration, 'usr/share/a/second'), [])
+        self.assertTrue(isdir(self.directory+'/db/installed/a/2.0/amd64'))
+        self.assertFalse(isdir(self.directory+'/db/installed/a/1.0'))
+
+    def test_rollback(self):
+        before = self.files()
+        rename = craft.actions.rename
+        calls = []
+        def failing(source, destination):
+            calls.append(source)
+            if len(calls) == 2:
+                raise OSError('injected')
+            rename(source, destination)
+
+        craft.actions.rename = failing
+        try:
+            self.assertRaises(craft.actions.InstallError, self.replace)
+        finally:
+            craft.actions.rename = rename
+        self.assertEqual(self.files(), before)
+        self.assertFalse(isdir(self.directory+'/db/installed/a/2.0'))
+        self.assertEqual(craft.ownership.owners(self.configuration, 'usr/share/a/first'), [str(self.old)])
+        self.assertEqual(glob(self.directory+'/root/.craft-*'), [])
+
+        self.assertTrue(self.replace())
+
+    def test_file_to_directory(self):
+        # The new archive lists none of the directories it extracts into
+        self.new, self.new_archive = self.build('2.0', ['./usr/share/a/first/inner', './usr/share/b/deep/file'])
+        before = self.files()
+        rename = craft.actions.rename
+        calls = []
+        def failing(source, destination):
+            calls.append(source)
+            if len(calls) == 2:
+                raise OSError('injected')
+            rename(source, destination)
+
+        craft.actions.rename = failing
+        try:
+            self.assertRaises(craft.actions.InstallError, self.replace)
+        finally:
+            craft.actions.rename = rename
+        self.assertEqual(self.files(), before)
+        self.assertFalse(lexists(self.directory+'/root/usr/share/b'))
+
+        self.assertTrue(self.replace())
+        self.assertTrue(isdir(self.directory+'/root/usr/share/a/first'))
+        self.assertEqual(self.files(), {})
+        handle = open(self.directory+'/root/usr/share/b/deep/file')
+        self.assertEqual(handle.read(), './usr/share/b/deep/file 2.0')
+        handle.close()
+
+    def test_directory_to_file(self):
+        self.new, self.new_archive = self.build('2.0', ['./usr/', './usr/share/', './usr/share/a'])
+        self.assertTrue(self.replace())
+        handle = open(self.directory+'/root/usr/share/a')
+        self.assertEqual(handle.read(), './usr/share/a 2.0')
+        handle.close()
+
+    def test_foreign_directory(self):
+        makedirs(self.directory+'/root/usr/share/a/foreign')
+        self.new, self.new_archive = self.build('2.0', ['./usr/', './usr/share/', './usr/share/a'])
+        self.assertRaises(craft.actions.InstallError, self.replace)
+        self.assertTrue(isdir(self.directory+'/root/usr/share/a/foreign'))
+        self.assertEqual(sorted(self.files()), ['usr/share/a/first', 'usr/share/a/second'])
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Cache_Tests(unittest.TestCase):
+    def test_key(self):
+        self.assertEqual(craft.cache.key(package('a', checksums={'sha1': 'ABCDEF0123'})), 'sha1-abcdef0123')
+        self.assertEqual(craft.cache.key(package('a', checksums={'sha1': '../../../etc/passwd'})), False)
+        self.assertEqual(craft.cache.key(package('a', checksums={'sha1': 'abc/def'})), False)
+        self.assertEqual(craft.cache.key(package('a', checksums={'sha1': 'abc\n'})), False)
+
+    def test_path(self):
+        directory = mkdtemp()
+        try:
+            configuration = environment(directory)
+            self.assertEqual(craft.cache.path(configuration, package('a', checksums={'sha1': 'abc'})), directory+'/db/cache/sha1-abc.tar.gz')
+            self.assertEqual(craft.cache.path(configuration, package('a', checksums={'sha1': '../abc'})), False)
+        finally:
+            rmtree(directory)
+
+class Load_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.paths = []
+        data = craft.load.yaml(fixture('validate/package/working2.yml'))
+        for name in sorted(data):
+            makedirs(join(self.directory, name))
+            self.paths.append(join(self.directory, name, 'amd64.yml'))
+            # JSON documents are valid YAML documents
+            handle = open(self.paths[-1], 'w')
+            handle.write(json.dumps({name: data[name]}))
+            handle.close()
+
+    def test_set(self):
+        # Files this small are not worth starting a pool for
+        pool = craft.load.Pool
+        craft.load.Pool = None
+        try:
+            serial = craft.load._set(self.paths, None, 2)
+        finally:
+            craft.load.Pool = pool
+        threshold = craft.load._parallel_threshold
+        craft.load._parallel_threshold = 0
+        try:
+            pooled = craft.load._set(self.paths, None, 2)
+        finally:
+            craft.load._parallel_threshold = threshold
+        self.assertEqual(names(pooled), names(serial))
+        self.assertTrue(list(serial.packages()))
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+class Validate_BaselineTests(unittest.TestCase):
+    """ The compiled schemas accept and reject the same packages
+    the original, hand-written validator did. """
+
+    lists = ('files/static', 'depends', 'conflicts', 'replaces', 'flags', 'information/maintainers', 'information/tags')
+    identifiers = ('provides', 'groups')
+    mappings = ('checksums', 'information/misc')
+
+    def definition(self):
+        return {
+            'checksums': {'sha1': 'a'*40},
+            'files': {'static': ['etc/a.conf']},
+            'depends': ['libfoo:amd64', 'bar'],
+            'conflicts': None,
+            'replaces': None,
+            'provides': ['virtual'],
+            'groups': ['base'],
+            'flags': None,
+            'information': {'maintainers': ['Someone'], 'tags': ['tag'], 'misc': {'Website': 'http://example.org'}}
+        }
+
+    def valid(self, field, value):
+        data = self.definition()
+        keys = field.split('/')
+        parent = data
+        for key in keys[:-1]:
+            parent = parent[key]
+        if value is self:
+            del parent[keys[-1]]
+        else:
+            parent[keys[-1]] = copy.deepcopy(value)
+        try:
+            return craft.validate.package(data)
+        except craft.validate.SemanticError:
+            return False
+
+    def test_fields(self):
+        for field in self.lists+self.identifiers:
+            for value in (None, [], ['ok']):
+                self.assertTrue(self.valid(field, value), field)
+            for value in ('text', 1, {}, [1], [None], self):
+                self.assertFalse(self.valid(field, value), field)
+        for field in self.lists:
+            self.assertTrue(self.valid(field, ['Not Valid!']), field)
+        for field in self.identifiers:
+            self.assertFalse(self.valid(field, ['Not Valid!']), field)
+        for field in self.mappings:
+            for value in (None, {}, {'key': 'value'}):
+                self.assertTrue(self.valid(field, value), field)
+            for value in ('text', 1, [], {'key': 1}, {1: 'value'}, self):
+                self.assertFalse(self.valid(field, value), field)
+        for field in ('files', 'information'):
+            for value in (None, 'text', [], {}, self):
+                self.assertFalse(self.valid(field, value), field)
 
 if __name__ == '__main__':
     unittest.main()